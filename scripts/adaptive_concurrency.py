@@ -0,0 +1,184 @@
+"""
+自适应并发控制模块
+Adaptive Concurrency Controller
+
+用 AIMD（加性增、乘性减）代替固定的 max_concurrent：
+- 每完成"一轮"（成功请求数达到当前并发上限）且延迟正常时，并发上限 +increase
+- 遇到 429、超时或延迟突增（超过基线延迟的 latency_spike 倍）时，并发上限乘以 decrease_factor
+- 同一轮内只减一次：在上次下调之前发出的请求再报告拥塞信号时不会重复下调
+- 延迟突增的样本仍以较小的系数（spike_ewma_alpha）更新基线：延迟永久性上升后基线会逐渐跟上，
+  不会把每个请求都判为突增而让并发一直停在下限
+
+run_batches() 按 yield_from 拓扑批次依次执行，每批全部完成后才开始下一批，
+保证下游素材不会在其参考图生成之前开始；每批的并发决策都会记录到日志
+"""
+
+import math
+import time
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from typing import Dict, Any, List, Callable, Awaitable, Optional
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class AdaptiveConfig:
+    """自适应并发配置"""
+    initial: int = 2
+    min_limit: int = 1
+    max_limit: int = 16
+    increase: int = 1
+    decrease_factor: float = 0.5
+    latency_spike: float = 2.0     # 延迟超过基线的倍数视为拥塞
+    ewma_alpha: float = 0.2        # 基线延迟的指数滑动平均系数
+    spike_ewma_alpha: float = 0.05  # 延迟突增的样本更新基线的系数（较慢，适应延迟的永久性变化）
+    min_samples: int = 3           # 基线延迟至少需要的样本数
+
+    @classmethod
+    def from_config(cls, config: Optional[Dict]) -> 'AdaptiveConfig':
+        config = dict(config or {})
+        aliases = {'min': 'min_limit', 'max': 'max_limit'}
+        values = {aliases.get(k, k): v for k, v in config.items()}
+        return cls(**{k: v for k, v in values.items() if k in cls.__dataclass_fields__})
+
+
+def status_code(error: BaseException) -> Optional[int]:
+    """异常携带的 HTTP 状态码（aiohttp: status，urllib / google-genai: code，httpx / requests: status_code）"""
+    for attr in ('status', 'code', 'status_code'):
+        value = getattr(error, attr, None)
+        if isinstance(value, int) and not isinstance(value, bool):
+            return value
+    value = getattr(getattr(error, 'response', None), 'status_code', None)
+    return value if isinstance(value, int) else None
+
+
+def classify_outcome(error: Optional[BaseException]) -> str:
+    """把请求结果归类为 ok / rate_limited / timeout / error（按状态码判断限流，不匹配错误消息）"""
+    if error is None:
+        return 'ok'
+    if isinstance(error, (asyncio.TimeoutError, TimeoutError)):
+        return 'timeout'
+    if status_code(error) == 429 or getattr(error, 'status', None) == 'RESOURCE_EXHAUSTED':
+        return 'rate_limited'
+    return 'error'
+
+
+class AdaptiveConcurrencyController:
+    """AIMD 并发控制器（在单个事件循环内使用）"""
+
+    def __init__(self, config: Optional[AdaptiveConfig] = None):
+        self.config = config or AdaptiveConfig()
+        self.limit = max(self.config.min_limit, min(self.config.initial, self.config.max_limit))
+        self.in_flight = 0
+        self.baseline_latency: Optional[float] = None
+        self.decisions: List[Dict[str, Any]] = []
+        self.counts = {'ok': 0, 'rate_limited': 0, 'timeout': 0, 'error': 0}
+        self._samples = 0
+        self._round_successes = 0
+        self._epoch = 0            # 每次下调后递增，用于忽略下调前发出的请求
+        self._batch: Optional[int] = None
+        self._condition: Optional[asyncio.Condition] = None
+
+    def _get_condition(self) -> asyncio.Condition:
+        if self._condition is None:
+            self._condition = asyncio.Condition()
+        return self._condition
+
+    def _decide(self, action: str, new_limit: int, reason: str):
+        if new_limit == self.limit:
+            return
+        self.decisions.append({'batch': self._batch, 'time': round(time.monotonic(), 3), 'action': action,
+                               'from': self.limit, 'to': new_limit, 'reason': reason})
+        logger.debug(f"并发上限 {self.limit} -> {new_limit} ({reason})")
+        self.limit = new_limit
+
+    def _on_success(self, latency: float):
+        cfg = self.config
+        spike = (self.baseline_latency is not None and self._samples >= cfg.min_samples
+                 and latency > self.baseline_latency * cfg.latency_spike)
+        self._samples += 1
+        if self.baseline_latency is None:
+            self.baseline_latency = latency
+        else:
+            alpha = cfg.spike_ewma_alpha if spike else cfg.ewma_alpha
+            self.baseline_latency += alpha * (latency - self.baseline_latency)
+        if spike:
+            return 'latency_spike'
+
+        self._round_successes += 1
+        if self._round_successes >= self.limit and self.limit < cfg.max_limit:
+            self._round_successes = 0
+            self._decide('increase', min(cfg.max_limit, self.limit + cfg.increase),
+                         f"一轮 {self.limit} 个请求均正常")
+        return None
+
+    def _on_congestion(self, signal: str, epoch: int):
+        if epoch != self._epoch:
+            return  # 本轮已经下调过
+        self._epoch += 1
+        self._round_successes = 0
+        new_limit = max(self.config.min_limit, math.floor(self.limit * self.config.decrease_factor))
+        self._decide('decrease', new_limit, signal)
+
+    @asynccontextmanager
+    async def slot(self):
+        """获取一个并发槽位，退出时根据异常（或正常返回）调整并发上限"""
+        condition = self._get_condition()
+        async with condition:
+            await condition.wait_for(lambda: self.in_flight < self.limit)
+            self.in_flight += 1
+        epoch, start = self._epoch, time.monotonic()
+        error: Optional[BaseException] = None
+        try:
+            yield
+        except BaseException as e:
+            error = e
+            raise
+        finally:
+            outcome = classify_outcome(error)
+            self.counts[outcome] += 1
+            if outcome == 'ok':
+                signal = self._on_success(time.monotonic() - start)
+                if signal:
+                    self._on_congestion(signal, epoch)
+            elif outcome in ('rate_limited', 'timeout'):
+                self._on_congestion(outcome, epoch)
+            async with condition:
+                self.in_flight -= 1
+                condition.notify_all()
+
+    async def run_batches(self, batches: List[List[Any]],
+                          worker: Callable[[Any], Awaitable[Any]]) -> List[Any]:
+        """按拓扑批次执行任务，批内由控制器限制并发
+
+        Returns:
+            与任务一一对应的结果（失败的任务为异常对象）
+        """
+        results: List[Any] = []
+        for index, batch in enumerate(batches):
+            self._batch = index
+            start_limit, start_counts = self.limit, dict(self.counts)
+
+            async def run_one(item):
+                async with self.slot():
+                    return await worker(item)
+
+            batch_results = await asyncio.gather(*(run_one(item) for item in batch), return_exceptions=True)
+            results.extend(batch_results)
+
+            delta = {k: self.counts[k] - start_counts[k] for k in self.counts}
+            logger.info(f"   批次 {index + 1}/{len(batches)}: {len(batch)} 个任务, 并发上限 {start_limit} -> {self.limit}, "
+                        f"成功 {delta['ok']}, 429 {delta['rate_limited']}, 超时 {delta['timeout']}, 失败 {delta['error']}")
+        self._batch = None
+        return results
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            'final_limit': self.limit,
+            'baseline_latency': round(self.baseline_latency, 4) if self.baseline_latency else None,
+            'counts': dict(self.counts),
+            'decisions': self.decisions,
+        }
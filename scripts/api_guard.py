@@ -0,0 +1,191 @@
+"""
+图像 API 限流与重试模块
+Image API Rate Limiting and Retry Module
+
+在图像 API 调用外包一层共享的保护：
+- 令牌桶限流：限制每分钟请求数（允许 burst 个突发请求）和同时进行的请求数
+- 指数退避重试：对 429、超时、5xx 和连接错误按 base_delay × 2^n 退避（全抖动），优先使用 Retry-After
+- 每次运行的重试预算：所有调用共享，用完后不再重试，避免故障时重试风暴
+
+统计信息（重试次数、限流等待时间、失败尝试和退避浪费的时间）可按 key_fn 返回的键分别汇总
+"""
+
+import time
+import random
+import asyncio
+import logging
+from dataclasses import dataclass
+from typing import Dict, Any, Callable, Awaitable, Optional
+
+from adaptive_concurrency import classify_outcome, status_code
+
+logger = logging.getLogger(__name__)
+
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+
+
+def is_retryable(error: BaseException) -> bool:
+    """429、超时、5xx 和连接错误可以重试"""
+    if classify_outcome(error) in ('rate_limited', 'timeout'):
+        return True
+    if isinstance(error, ConnectionError):
+        return True
+    return status_code(error) in RETRYABLE_STATUS
+
+
+def _retry_after(error: BaseException) -> Optional[float]:
+    headers = getattr(error, 'headers', None)
+    if not headers:
+        return None
+    try:
+        return float(headers.get('Retry-After'))
+    except (TypeError, ValueError):
+        return None
+
+
+@dataclass
+class RetryPolicy:
+    """重试策略"""
+    max_attempts: int = 4          # 包含首次请求
+    base_delay: float = 1.0
+    max_delay: float = 30.0
+
+    def backoff(self, attempt: int, error: BaseException, rng: random.Random) -> float:
+        """第 attempt 次失败（从 1 开始）后的等待时间：全抖动指数退避，不短于 Retry-After"""
+        delay = rng.uniform(0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1)))
+        retry_after = _retry_after(error)
+        if retry_after is not None:
+            delay = max(delay, min(retry_after, self.max_delay))
+        return delay
+
+
+class TokenBucket:
+    """异步令牌桶（每分钟 rate 个令牌，最多积累 burst 个）"""
+
+    def __init__(self, rate_per_minute: float, burst: int = 1):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = max(1, burst)
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self._lock: Optional[asyncio.Lock] = None
+
+    async def acquire(self) -> float:
+        """取一个令牌，返回等待的秒数"""
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        waited = 0.0
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return waited
+                delay = (1 - self.tokens) / self.rate
+                await asyncio.sleep(delay)
+                waited += delay
+
+
+def _empty_stats() -> Dict[str, Any]:
+    return {'calls': 0, 'succeeded': 0, 'failed': 0, 'attempts': 0, 'retries': 0,
+            'budget_exhausted': 0, 'throttle_wait_seconds': 0.0, 'wasted_seconds': 0.0}
+
+
+class ApiGuard:
+    """限流 + 重试的 API 调用包装（在单个事件循环内共享）"""
+
+    def __init__(self, requests_per_minute: Optional[float] = None, burst: int = 1,
+                 max_concurrent: Optional[int] = None, retry: Optional[RetryPolicy] = None,
+                 retry_budget: Optional[int] = None, key_fn: Optional[Callable[[], Optional[str]]] = None,
+                 seed: Optional[int] = None):
+        """
+        Args:
+            requests_per_minute: 每分钟请求上限（None 表示不限制）
+            burst: 令牌桶容量（允许的突发请求数）
+            max_concurrent: 同时进行的请求上限（None 表示不限制）
+            retry: 重试策略
+            retry_budget: 本次运行所有调用共享的重试次数上限（None 表示不限制）
+            key_fn: 返回统计归属键（例如当前阶段）的函数
+        """
+        self.bucket = TokenBucket(requests_per_minute, burst) if requests_per_minute else None
+        self.max_concurrent = max_concurrent
+        self.retry = retry or RetryPolicy()
+        self.retry_budget = retry_budget
+        self.retries_left = retry_budget
+        self.key_fn = key_fn
+        self.stats: Dict[str, Any] = _empty_stats()
+        self.stats_by_key: Dict[str, Dict[str, Any]] = {}
+        self._rng = random.Random(seed)
+        self._semaphore: Optional[asyncio.Semaphore] = None
+
+    @classmethod
+    def from_config(cls, config: Optional[Dict], **kwargs) -> 'ApiGuard':
+        """从配置构建（global.api_guard）"""
+        config = config or {}
+        retry = RetryPolicy(**{k: v for k, v in (config.get('retry') or {}).items()
+                               if k in RetryPolicy.__dataclass_fields__})
+        return cls(requests_per_minute=config.get('requests_per_minute'), burst=config.get('burst', 1),
+                   max_concurrent=config.get('max_concurrent'), retry=retry,
+                   retry_budget=config.get('retry_budget'), **kwargs)
+
+    def _record(self, key: Optional[str], field: str, value=1):
+        self.stats[field] += value
+        if key is not None:
+            self.stats_by_key.setdefault(key, _empty_stats())[field] += value
+
+    def _take_retry(self) -> bool:
+        if self.retries_left is None:
+            return True
+        if self.retries_left <= 0:
+            return False
+        self.retries_left -= 1
+        return True
+
+    async def call(self, fn: Callable[..., Awaitable[Any]], *args, **kwargs) -> Any:
+        """限流后调用 fn，可重试的错误按退避策略重试，最终失败时抛出最后一次的异常"""
+        if self.max_concurrent and self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrent)
+        key = self.key_fn() if self.key_fn else None
+        self._record(key, 'calls')
+
+        attempt = 0
+        while True:
+            attempt += 1
+            if self.bucket is not None:
+                waited = await self.bucket.acquire()
+                if waited:
+                    self._record(key, 'throttle_wait_seconds', waited)
+
+            start = time.monotonic()
+            self._record(key, 'attempts')
+            try:
+                if self._semaphore is not None:
+                    async with self._semaphore:
+                        result = await fn(*args, **kwargs)
+                else:
+                    result = await fn(*args, **kwargs)
+                self._record(key, 'succeeded')
+                return result
+            except Exception as e:
+                self._record(key, 'wasted_seconds', time.monotonic() - start)
+                if not is_retryable(e) or attempt >= self.retry.max_attempts:
+                    self._record(key, 'failed')
+                    raise
+                if not self._take_retry():
+                    self._record(key, 'budget_exhausted')
+                    self._record(key, 'failed')
+                    logger.warning(f"⚠ 重试预算已用完（{self.retry_budget} 次），不再重试: {e}")
+                    raise
+                delay = self.retry.backoff(attempt, e, self._rng)
+                self._record(key, 'retries')
+                self._record(key, 'wasted_seconds', delay)
+                logger.debug(f"第 {attempt} 次请求失败（{e}），{delay:.2f}s 后重试")
+                await asyncio.sleep(delay)
+
+    def stats_for(self, key: str) -> Optional[Dict[str, Any]]:
+        """返回某个统计键的统计（保留 3 位小数），没有调用时返回 None"""
+        stats = self.stats_by_key.get(key)
+        if not stats:
+            return None
+        return {k: round(v, 3) if isinstance(v, float) else v for k, v in stats.items()}
@@ -0,0 +1,212 @@
+"""
+素材清单模块
+Asset Manifest Module
+
+为 public/assets/ 中的每个素材记录生成时的输入哈希（name、description、size、yield_from
+以及参考图的内容哈希），用于增量生成时只重新生成发生变化的素材及其 yield_from 下游素材
+"""
+
+import os
+import json
+import hashlib
+from pathlib import Path
+from datetime import datetime
+from typing import Dict, List, Optional, Set, Tuple
+
+MANIFEST_VERSION = 1
+MANIFEST_FILENAME = "assets.manifest.json"  # 位于 public/ 下，与 assets/ 目录并列
+
+
+def parse_references(yield_from: Optional[str]) -> List[str]:
+    """解析 yield_from 字段，返回引用的素材文件名列表
+
+    支持的格式:
+        None                              - 无参考图
+        "asset.png"                       - 单图参考
+        "__MIRROR__:asset.png"            - 镜像翻转
+        "__MULTI__:a.png,b.png,c.png"     - 多图参考
+    """
+    if not yield_from:
+        return []
+    if yield_from.startswith("__MIRROR__:"):
+        return [yield_from.replace("__MIRROR__:", "", 1).strip()]
+    if yield_from.startswith("__MULTI__:"):
+        refs = yield_from.replace("__MULTI__:", "", 1)
+        return [ref.strip() for ref in refs.split(",") if ref.strip()]
+    return [yield_from.strip()]
+
+
+def dependency_levels(tasks: List[Dict]) -> List[List[Dict]]:
+    """按 yield_from 依赖把任务分层：每层只引用更早层中（或任务列表之外已存在）的素材
+
+    存在循环依赖的任务无法分层，放在最后一层
+    """
+    names = {task.get('name') for task in tasks}
+    level_of: Dict[str, int] = {}
+    remaining = list(tasks)
+    levels: List[List[Dict]] = []
+    while remaining:
+        current, pending = [], []
+        for task in remaining:
+            refs = [ref for ref in parse_references(task.get('yield_from')) if ref in names]
+            if all(ref in level_of for ref in refs):
+                current.append(task)
+            else:
+                pending.append(task)
+        if not current:
+            levels.append(pending)
+            break
+        for task in current:
+            level_of[task.get('name')] = len(levels)
+        levels.append(current)
+        remaining = pending
+    return levels
+
+
+def hash_file(file_path: Path) -> Optional[str]:
+    """计算文件内容哈希，文件不存在时返回 None"""
+    if not file_path.exists():
+        return None
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def hash_task(task: Dict) -> str:
+    """计算任务定义的哈希（只包含影响生成结果的字段）"""
+    payload = json.dumps({
+        'name': task.get('name'),
+        'description': task.get('description'),
+        'size': task.get('size'),
+        'yield_from': task.get('yield_from'),
+    }, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class AssetManifest:
+    """素材生成清单"""
+
+    def __init__(self, workspace_dir: str, assets_dir: str = "public/assets/"):
+        self.workspace_dir = Path(workspace_dir)
+        self.assets_path = self.workspace_dir / assets_dir
+        self.manifest_path = self.assets_path.parent / MANIFEST_FILENAME
+        self.entries: Dict[str, Dict] = {}
+
+    def load(self) -> 'AssetManifest':
+        """读取清单文件（不存在或版本不符时视为空清单）"""
+        self.entries = {}
+        if self.manifest_path.exists():
+            try:
+                with open(self.manifest_path, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+                if data.get('version') == MANIFEST_VERSION:
+                    self.entries = data.get('assets', {})
+            except (json.JSONDecodeError, OSError):
+                self.entries = {}
+        return self
+
+    def save(self):
+        """写入清单文件"""
+        data = {
+            'version': MANIFEST_VERSION,
+            'updated_at': datetime.now().isoformat(timespec='seconds'),
+            'assets': self.entries,
+        }
+        tmp_path = self.manifest_path.with_suffix('.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
+        tmp_path.replace(self.manifest_path)
+
+    def stamps(self) -> Dict[str, Tuple[int, int]]:
+        """素材目录顶层 PNG 的 (mtime_ns, 大小)，用于找出一次运行中写入过的图像"""
+        if not self.assets_path.is_dir():
+            return {}
+        with os.scandir(self.assets_path) as entries:
+            return {entry.name: (entry.stat().st_mtime_ns, entry.stat().st_size) for entry in entries
+                    if entry.is_file() and entry.name.endswith('.png')}
+
+    def written_since(self, stamps: Dict[str, Tuple[int, int]]) -> Set[str]:
+        """与 stamps() 的结果相比新建或被改写的图像"""
+        return {name for name, stamp in self.stamps().items() if stamps.get(name) != stamp}
+
+    @staticmethod
+    def build_dependents(tasks: List[Dict]) -> Dict[str, Set[str]]:
+        """构建 素材 -> 直接引用它的下游素材 的映射"""
+        names = {task.get('name') for task in tasks}
+        dependents: Dict[str, Set[str]] = {name: set() for name in names}
+        for task in tasks:
+            for ref in parse_references(task.get('yield_from')):
+                if ref in names:
+                    dependents[ref].add(task.get('name'))
+        return dependents
+
+    def find_dirty(self, tasks: List[Dict]) -> List[str]:
+        """找出需要重新生成的素材
+
+        直接变脏的条件：清单中无记录、任务定义哈希变化、图像文件缺失、参考图内容变化；
+        然后沿 yield_from 依赖把所有下游素材也标记为脏
+
+        Returns:
+            需要重新生成的素材名（保持 tasks.json 中的顺序）
+        """
+        ref_hashes: Dict[str, Optional[str]] = {}
+
+        def ref_hash(name: str) -> Optional[str]:
+            if name not in ref_hashes:
+                ref_hashes[name] = hash_file(self.assets_path / name)
+            return ref_hashes[name]
+
+        dirty: Set[str] = set()
+        for task in tasks:
+            name = task.get('name')
+            entry = self.entries.get(name)
+            if (entry is None
+                    or entry.get('task_hash') != hash_task(task)
+                    or not (self.assets_path / name).exists()):
+                dirty.add(name)
+                continue
+            recorded_refs = entry.get('refs', {})
+            for ref in parse_references(task.get('yield_from')):
+                if recorded_refs.get(ref) != ref_hash(ref):
+                    dirty.add(name)
+                    break
+
+        # 传播到 yield_from 下游素材
+        dependents = self.build_dependents(tasks)
+        stack = list(dirty)
+        while stack:
+            for child in dependents.get(stack.pop(), ()):
+                if child not in dirty:
+                    dirty.add(child)
+                    stack.append(child)
+
+        return [task.get('name') for task in tasks if task.get('name') in dirty]
+
+    def update(self, tasks: List[Dict], names: Optional[Set[str]] = None):
+        """记录已生成素材的当前输入哈希
+
+        Args:
+            tasks: tasks.json 中的任务列表
+            names: 只更新这些素材（默认更新所有图像已存在的素材）
+        """
+        task_names = {task.get('name') for task in tasks}
+        # 移除已不在 tasks.json 中的素材记录
+        for stale in set(self.entries) - task_names:
+            del self.entries[stale]
+
+        for task in tasks:
+            name = task.get('name')
+            if names is not None and name not in names:
+                continue
+            image_hash = hash_file(self.assets_path / name)
+            if image_hash is None:
+                self.entries.pop(name, None)
+                continue
+            self.entries[name] = {
+                'task_hash': hash_task(task),
+                'image_hash': image_hash,
+                'refs': {ref: hash_file(self.assets_path / ref)
+                         for ref in parse_references(task.get('yield_from'))},
+            }
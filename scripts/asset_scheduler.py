@@ -0,0 +1,182 @@
+"""
+素材就绪队列调度模块
+Asset Ready-Queue Scheduler
+
+按 yield_from 依赖调度素材生成，代替按拓扑层级整批等待的方式：
+- 任务的所有参考图（单图、__MIRROR__:、__MULTI__: 中的每一项）生成完成后立即开始，不等待同层其他任务
+- 就绪任务按"剩余最长依赖链"优先，先启动关键路径上的任务
+- 参考图生成失败时，其下游任务标记为失败而不再请求
+
+运行结束后报告关键路径长度（按实际耗时计算的最长依赖链，即无限并发时的理论最短墙钟时间）与实际墙钟时间
+"""
+
+import time
+import heapq
+import asyncio
+import logging
+from typing import Dict, Any, List, Callable, Awaitable, Optional, Tuple
+
+from asset_manifest import parse_references
+
+logger = logging.getLogger(__name__)
+
+
+class DependencyFailedError(Exception):
+    """参考图生成失败，下游任务未执行"""
+    pass
+
+
+class AssetGraph:
+    """素材 yield_from 依赖图"""
+
+    def __init__(self, tasks: List[Dict]):
+        self.tasks = {task.get('name'): task for task in tasks}
+        self.order = [task.get('name') for task in tasks]
+        # 只保留任务列表内的参考图（列表外的参考图视为已存在）
+        self.parents: Dict[str, List[str]] = {
+            name: [ref for ref in parse_references(task.get('yield_from')) if ref in self.tasks and ref != name]
+            for name, task in self.tasks.items()
+        }
+        self.children: Dict[str, List[str]] = {name: [] for name in self.tasks}
+        for name, refs in self.parents.items():
+            for ref in refs:
+                self.children[ref].append(name)
+        self.chain_length = self._chain_lengths()
+
+    def _chain_lengths(self) -> Dict[str, int]:
+        """每个任务到依赖链末端的最长任务数（包含自身）；处于循环中的任务为 0"""
+        indegree = {name: len(children) for name, children in self.children.items()}
+        stack = [name for name, degree in indegree.items() if degree == 0]
+        lengths: Dict[str, int] = {}
+        while stack:
+            name = stack.pop()
+            lengths[name] = 1 + max((lengths[child] for child in self.children[name]), default=0)
+            for parent in self.parents[name]:
+                indegree[parent] -= 1
+                if indegree[parent] == 0:
+                    stack.append(parent)
+        return {name: lengths.get(name, 0) for name in self.tasks}
+
+    def cyclic(self) -> List[str]:
+        """处于循环依赖中（或依赖循环）的任务"""
+        return [name for name in self.order if self.chain_length[name] == 0]
+
+    def critical_path(self, durations: Optional[Dict[str, float]] = None) -> Tuple[List[str], float]:
+        """按耗时（默认每个任务 1）计算最长依赖链，返回 (任务列表, 总耗时)"""
+        weight = (lambda name: durations.get(name, 0.0)) if durations is not None else (lambda name: 1.0)
+        best: Dict[str, Tuple[float, Optional[str]]] = {}
+
+        def longest(name: str) -> Tuple[float, Optional[str]]:
+            # 迭代计算，避免深依赖链触发递归上限
+            stack = [name]
+            while stack:
+                current = stack[-1]
+                pending = [child for child in self.children[current]
+                           if child not in best and self.chain_length[child]]
+                if pending:
+                    stack.extend(pending)
+                    continue
+                stack.pop()
+                if current in best:
+                    continue
+                tail = max(((best[child][0], child) for child in self.children[current]
+                            if child in best), default=(0.0, None))
+                best[current] = (weight(current) + tail[0], tail[1])
+            return best[name]
+
+        roots = [name for name in self.order if not self.parents[name] and self.chain_length[name]]
+        if not roots:
+            return [], 0.0
+        start = max(roots, key=lambda name: longest(name)[0])
+        path, node = [], start
+        while node is not None:
+            path.append(node)
+            node = best[node][1]
+        return path, best[start][0]
+
+
+async def run_ready_queue(tasks: List[Dict], worker: Callable[[Dict], Awaitable[Any]],
+                          max_concurrent: int = 3, controller=None) -> Dict[str, Any]:
+    """按就绪队列执行素材任务
+
+    Args:
+        tasks: tasks.json 中的任务列表
+        worker: 生成单个素材的协程函数，失败时抛出异常
+        max_concurrent: 同时进行的任务上限（提供 controller 时使用其动态上限）
+        controller: 可选的 AdaptiveConcurrencyController
+
+    Returns:
+        {results: 素材名 -> 结果或异常, durations, wall_time, critical_path, critical_path_time,
+         critical_path_length, efficiency}
+    """
+    graph = AssetGraph(tasks)
+    remaining = {name: len(parents) for name, parents in graph.parents.items()}
+    index = {name: i for i, name in enumerate(graph.order)}
+    ready: List[Tuple[int, int, str]] = []
+    for name in graph.order:
+        if remaining[name] == 0 and graph.chain_length[name]:
+            heapq.heappush(ready, (-graph.chain_length[name], index[name], name))
+
+    results: Dict[str, Any] = {}
+    durations: Dict[str, float] = {}
+    running: Dict[asyncio.Task, str] = {}
+
+    for name in graph.cyclic():
+        results[name] = DependencyFailedError(f"{name} 处于循环依赖中")
+
+    async def run_one(name: str):
+        start = time.monotonic()
+        try:
+            if controller is not None:
+                async with controller.slot():
+                    return await worker(graph.tasks[name])
+            return await worker(graph.tasks[name])
+        finally:
+            durations[name] = time.monotonic() - start
+
+    def fail_descendants(name: str):
+        stack = list(graph.children[name])
+        while stack:
+            child = stack.pop()
+            if child not in results:
+                results[child] = DependencyFailedError(f"参考图 {name} 生成失败")
+                stack.extend(graph.children[child])
+
+    wall_start = time.monotonic()
+    while ready or running:
+        limit = controller.limit if controller is not None else max_concurrent
+        while ready and len(running) < limit:
+            _, _, name = heapq.heappop(ready)
+            if name in results:
+                continue
+            running[asyncio.ensure_future(run_one(name))] = name
+
+        if not running:
+            break
+        done, _ = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+        for task in done:
+            name = running.pop(task)
+            error = task.exception()
+            results[name] = error if error is not None else task.result()
+            if error is not None:
+                fail_descendants(name)
+                continue
+            for child in graph.children[name]:
+                remaining[child] -= 1
+                if remaining[child] == 0 and child not in results:
+                    heapq.heappush(ready, (-graph.chain_length[child], index[child], child))
+    wall_time = time.monotonic() - wall_start
+
+    path, path_time = graph.critical_path(durations)
+    report = {
+        'results': results,
+        'durations': durations,
+        'wall_time': wall_time,
+        'critical_path': path,
+        'critical_path_length': len(path),
+        'critical_path_time': path_time,
+        'efficiency': path_time / wall_time if wall_time else 0.0,
+    }
+    logger.info(f"   关键路径: {len(path)} 个任务, {path_time:.2f}s / 实际墙钟 {wall_time:.2f}s "
+                f"({report['efficiency']:.0%})")
+    return report
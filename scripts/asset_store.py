@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+"""
+共享素材存储模块
+Content-Addressed Asset Store
+
+每个 --workspace 和每个 {workflow}_{timestamp} 工作空间都保存一份完整的 PNG 和 _originals/，
+即使两次运行（例如回放相同的 LLM 输入）生成的素材逐字节相同。本模块把素材按 SHA-256 写入共享的
+对象目录，每份内容只保存一次，工作空间中的文件替换为指向对象的链接：
+
+- 只使用 reflink（写时复制）：新对象是工作空间文件的 reflink，重复内容的工作空间文件替换为对象的 reflink，
+  两者共享数据块但不共享 inode，阶段原地重写 PNG（复用工作空间重新运行 stage4、_post_process_images、PIL 保存）
+  不会修改对象，也不会因权限失败
+- 不使用硬链接，也不复制：文件系统不支持 reflink 时（或存储与工作空间不在同一文件系统）复制对象会让磁盘占用翻倍，
+  这些文件不收录（统计为 skipped），工作空间保留自己的文件
+- refs/ 下为每个工作空间记录它引用的对象；工作空间的保留策略由 workspace_gc 负责，
+  回收工作空间后 prune() 删除失效的引用记录和不再被引用的对象
+
+目录结构:
+    {workspace_base}/.asset_store/
+        objects/ab/abcdef....png
+        refs/<工作空间路径哈希>.json   {"workspace": 路径, "updated_at": 时间, "objects": {相对路径: 哈希}}
+"""
+
+import os
+import json
+import fcntl
+import shutil
+import hashlib
+import logging
+from pathlib import Path
+from datetime import datetime
+from typing import Dict, Any, List, Optional
+
+logger = logging.getLogger(__name__)
+
+FICLONE = 0x40049409  # linux/fs.h: _IOW(0x94, 9, int)
+LINK_MODES = ('auto', 'reflink', 'hardlink', 'copy')
+
+
+def _hash_file(path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _reflink(src: Path, dst: Path):
+    """写时复制克隆（btrfs/XFS 等支持 FICLONE 的文件系统），不支持时抛出 OSError"""
+    with open(src, 'rb') as s, open(dst, 'wb') as d:
+        fcntl.ioctl(d.fileno(), FICLONE, s.fileno())
+
+
+def link_file(src: Path, dst: Path, link: str = 'auto') -> str:
+    """在 dst（不能已存在）创建 src 的链接，auto 时按 reflink → 硬链接 → 复制 依次尝试
+
+    Returns:
+        实际使用的链接方式；全部失败时返回 'none'
+    """
+    modes = ('reflink', 'hardlink', 'copy') if link == 'auto' else (link,)
+    for mode in modes:
+        try:
+            if mode == 'reflink':
+                _reflink(src, dst)
+            elif mode == 'hardlink':
+                os.link(src, dst)
+            else:
+                shutil.copyfile(src, dst)
+            return mode
+        except OSError:
+            Path(dst).unlink(missing_ok=True)
+    return 'none'
+
+
+class AssetStore:
+    """按内容哈希保存素材的共享对象存储"""
+
+    def __init__(self, root: str, patterns: Optional[List[str]] = None):
+        """
+        Args:
+            root: 存储目录（与工作空间位于同一个支持 reflink 的文件系统时才会收录）
+            patterns: 要收录的文件（相对于工作空间的 glob）
+        """
+        self.root = Path(root)
+        self.patterns = patterns or ['public/assets/*.png', 'public/assets/_originals/*.png']
+        self.stats = {'files': 0, 'new_objects': 0, 'linked': 0, 'skipped': 0, 'bytes_deduplicated': 0}
+        self._warned = False
+
+    @classmethod
+    def from_config(cls, config: Optional[Dict], workspace_base: str) -> 'AssetStore':
+        """从配置构建（global.asset_store）"""
+        config = config or {}
+        return cls(config.get('dir') or str(Path(workspace_base) / '.asset_store'), patterns=config.get('patterns'))
+
+    def object_path(self, digest: str) -> Path:
+        return self.root / 'objects' / digest[:2] / f"{digest}.png"
+
+    def _ref_path(self, workspace: Path) -> Path:
+        key = hashlib.sha1(str(workspace.resolve()).encode('utf-8')).hexdigest()
+        return self.root / 'refs' / f"{key}.json"
+
+    @staticmethod
+    def _reflink_replace(src: Path, target: Path) -> bool:
+        """用 src 的 reflink 原子地创建或替换 target（先在同目录创建临时文件），不支持 reflink 时返回 False"""
+        tmp = target.with_name(f".{target.name}.store.tmp")
+        tmp.unlink(missing_ok=True)
+        if link_file(src, tmp, 'reflink') != 'reflink':
+            return False
+        tmp.replace(target)
+        return True
+
+    def _skip(self, path: Path):
+        self.stats['skipped'] += 1
+        if not self._warned:
+            self._warned = True
+            logger.warning(f"⚠ 素材存储 {self.root} 与工作空间之间无法使用 reflink（文件系统不支持或不在同一文件系统），"
+                           f"复制会让磁盘占用翻倍，不收录这些素材: {path}")
+
+    def put(self, path: Path) -> Optional[str]:
+        """收录一个文件，返回内容哈希；无法 reflink 时不写入对象，返回 None
+
+        新内容：对象创建为工作空间文件的 reflink；已有内容：工作空间文件替换为对象的 reflink（去重）
+        """
+        digest = _hash_file(path)
+        obj = self.object_path(digest)
+        size = path.stat().st_size
+        self.stats['files'] += 1
+
+        if not obj.exists():
+            obj.parent.mkdir(parents=True, exist_ok=True)
+            if not self._reflink_replace(path, obj):
+                self._skip(path)
+                return None
+            self.stats['new_objects'] += 1
+            self.stats['linked'] += 1
+        elif self._reflink_replace(obj, path):
+            self.stats['linked'] += 1
+            self.stats['bytes_deduplicated'] += size
+        else:
+            self._skip(path)
+            return None
+        return digest
+
+    def ingest_workspace(self, workspace_dir: str) -> Dict[str, Any]:
+        """收录工作空间中的素材并记录引用，返回本次统计"""
+        workspace = Path(workspace_dir)
+        before = dict(self.stats)
+        objects = {}
+        for pattern in self.patterns:
+            for path in sorted(workspace.glob(pattern)):
+                if path.is_file() and not path.is_symlink():
+                    digest = self.put(path)
+                    if digest is not None:
+                        objects[str(path.relative_to(workspace))] = digest
+
+        ref_path = self._ref_path(workspace)
+        ref_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = ref_path.with_suffix('.tmp')
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump({'workspace': str(workspace.resolve()), 'updated_at': datetime.now().isoformat(timespec='seconds'),
+                       'objects': objects}, f, ensure_ascii=False, indent=2)
+        tmp.replace(ref_path)
+        return {k: self.stats[k] - before[k] for k in self.stats}
+
+    def _load_refs(self) -> List[Dict[str, Any]]:
+        refs = []
+        for ref_path in sorted((self.root / 'refs').glob('*.json')):
+            try:
+                with open(ref_path, 'r', encoding='utf-8') as f:
+                    refs.append({**json.load(f), 'path': ref_path})
+            except (json.JSONDecodeError, OSError) as e:
+                logger.warning(f"⚠ 引用记录损坏，已忽略: {ref_path} ({e})")
+        return refs
+
+    def prune(self, dry_run: bool = False) -> Dict[str, Any]:
+        """删除已不存在的工作空间的引用记录，以及不再被任何引用记录使用的对象
+
+        工作空间本身的保留策略由 workspace_gc 负责，本方法只在其回收工作空间后清理存储
+
+        Returns:
+            {'refs_removed', 'objects_removed', 'bytes_freed'}
+        """
+        result = {'refs_removed': 0, 'objects_removed': 0, 'bytes_freed': 0}
+        live = set()
+        for ref in self._load_refs():
+            if Path(ref['workspace']).exists():
+                live.update(ref.get('objects', {}).values())
+                continue
+            if not dry_run:
+                ref['path'].unlink(missing_ok=True)
+            result['refs_removed'] += 1
+
+        for obj in (self.root / 'objects').glob('*/*.png'):
+            if obj.stem not in live:
+                result['bytes_freed'] += obj.stat().st_size
+                result['objects_removed'] += 1
+                if not dry_run:
+                    obj.unlink()
+        return result
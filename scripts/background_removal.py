@@ -0,0 +1,165 @@
+"""
+背景移除服务模块
+Background Removal Service
+
+在图像生成的事件循环中同步调用 rembg 会和网络 I/O 争抢 GIL，而且每次运行都要重新初始化
+rembg session（"正在初始化 rembg session..."）。本模块提供一个进程池服务：
+
+- 每个工作进程启动时初始化一次 onnxruntime session，之后处理的所有图像复用该 session
+- 图像生成函数把刚保存的图像路径提交给服务（submit），立即返回继续生成，抠图在工作进程中并行进行
+- 工作进程数量可配置，提交的任务在进程池队列中排队；阶段结束前 drain() 等待全部完成
+- 抠图前把原图保存到 _originals/ 目录（与同步实现一致）
+
+进程池在第一次 submit() 时才启动（不提交图像就不会加载模型），需要与生成重叠预热时显式调用 start(warm=True)。
+工作进程使用 spawn 启动，避免 fork 已经初始化了 onnxruntime 线程池的进程；
+服务对象被 fork 到子进程后，子进程无法使用父进程的进程池，会在子进程中重新启动自己的进程池
+"""
+
+import os
+import time
+import shutil
+import asyncio
+import logging
+import threading
+import multiprocessing
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor, Future, wait
+from typing import Dict, Any, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# 工作进程内的 rembg session（每个进程初始化一次）
+_session = None
+
+
+def _init_worker(model: str):
+    global _session
+    from rembg import new_session
+    _session = new_session(model)
+
+
+def _warm_worker() -> int:
+    return os.getpid()
+
+
+def _remove_background(path: str, originals_dir: Optional[str]) -> Dict[str, Any]:
+    """在工作进程中移除一张图像的背景（先保存原图，再原子地替换为透明背景的 PNG）"""
+    from rembg import remove
+
+    start = time.perf_counter()
+    source = Path(path)
+    data = source.read_bytes()
+    if originals_dir:
+        original = Path(originals_dir) / source.name
+        if not original.exists():
+            original.parent.mkdir(parents=True, exist_ok=True)
+            shutil.copyfile(source, original)
+
+    output = remove(data, session=_session)
+    tmp = source.with_name(f".{source.name}.{os.getpid()}.tmp")
+    tmp.write_bytes(output)
+    tmp.replace(source)
+    return {'name': source.name, 'seconds': time.perf_counter() - start, 'pid': os.getpid()}
+
+
+class BackgroundRemovalService:
+    """预热的 rembg 进程池（线程安全，可在事件循环内外提交）"""
+
+    def __init__(self, workers: int = 2, model: str = 'u2net', originals_dir: Optional[str] = '_originals'):
+        """
+        Args:
+            workers: 工作进程数（同时进行的抠图上限）
+            model: rembg 模型名
+            originals_dir: 原图保存目录（相对于图像所在目录；None 表示不保存原图）
+        """
+        self.workers = workers
+        self.model = model
+        self.originals_dir = originals_dir
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._owner_pid: Optional[int] = None  # 启动进程池的进程
+        self._pending: List[Future] = []
+        self._lock = threading.Lock()
+        self.stats = {'submitted': 0, 'completed': 0, 'failed': 0, 'busy_seconds': 0.0}
+
+    @classmethod
+    def from_config(cls, config: Optional[Dict]) -> 'BackgroundRemovalService':
+        """从配置构建（global.background_removal 或 concurrency_sweep.background_removal）"""
+        config = config or {}
+        return cls(workers=config.get('workers', 2), model=config.get('model', 'u2net'),
+                   originals_dir=config.get('originals_dir', '_originals'))
+
+    def start(self, warm: bool = False) -> 'BackgroundRemovalService':
+        """启动进程池；warm 为 True 时立即启动全部工作进程并在后台加载模型，与图像生成重叠"""
+        if self._executor is not None and self._owner_pid != os.getpid():
+            # fork 出的子进程继承了父进程的进程池对象，但无法向其提交任务：丢弃后重新启动
+            self._executor = None
+            with self._lock:
+                self._pending = []
+        if self._executor is None:
+            self._owner_pid = os.getpid()
+            self._executor = ProcessPoolExecutor(max_workers=self.workers,
+                                                 mp_context=multiprocessing.get_context('spawn'),
+                                                 initializer=_init_worker, initargs=(self.model,))
+            if warm:
+                for _ in range(self.workers):
+                    self._executor.submit(_warm_worker)
+            logger.info(f"✓ 背景移除服务已启动: {self.workers} 个工作进程, 模型 {self.model}")
+        return self
+
+    def submit(self, path) -> Future:
+        """提交一张图像，立即返回 Future（结果为 {'name', 'seconds', 'pid'}）"""
+        self.start()
+        path = Path(path)
+        originals_dir = str(path.parent / self.originals_dir) if self.originals_dir else None
+        future = self._executor.submit(_remove_background, str(path), originals_dir)
+        future.add_done_callback(self._record)
+        with self._lock:
+            self.stats['submitted'] += 1
+            self._pending.append(future)
+        return future
+
+    async def remove(self, path) -> Dict[str, Any]:
+        """在事件循环中提交并等待一张图像的抠图结果"""
+        return await asyncio.wrap_future(self.submit(path))
+
+    def _record(self, future: Future):
+        with self._lock:
+            if future.cancelled() or future.exception() is not None:
+                self.stats['failed'] += 1
+                if not future.cancelled():
+                    logger.warning(f"⚠ 背景移除失败: {future.exception()}")
+            else:
+                self.stats['completed'] += 1
+                self.stats['busy_seconds'] += future.result()['seconds']
+
+    def drain(self, timeout: Optional[float] = None, deadline: Optional[float] = None) -> Dict[str, Any]:
+        """等待已提交的图像全部处理完成，返回本批统计（submitted/completed/failed/pending/busy_seconds）
+
+        Args:
+            timeout: 最多等待的秒数
+            deadline: time.monotonic() 截止时间（例如阶段超时的截止时间），只等待剩余的预算；
+                      与 timeout 同时给出时取较早者
+        """
+        if deadline is not None:
+            remaining = max(0.0, deadline - time.monotonic())
+            timeout = remaining if timeout is None else min(timeout, remaining)
+        with self._lock:
+            pending, self._pending = self._pending, []
+        done, not_done = wait(pending, timeout=timeout)
+        with self._lock:
+            self._pending.extend(not_done)
+        succeeded = [f.result() for f in done if not f.cancelled() and f.exception() is None]
+        return {
+            'submitted': len(pending),
+            'completed': len(succeeded),
+            'failed': len(done) - len(succeeded),
+            'pending': len(not_done),
+            'busy_seconds': round(sum(result['seconds'] for result in succeeded), 3),
+        }
+
+    def close(self):
+        """关闭进程池（未完成的任务会被取消；fork 出的子进程只丢弃继承的引用，不关闭父进程的进程池）"""
+        if self._executor is not None:
+            if self._owner_pid == os.getpid():
+                self._executor.shutdown(wait=True, cancel_futures=True)
+            self._executor = None
@@ -0,0 +1,363 @@
+#!/usr/bin/env python3
+"""
+性能基准测试运行器
+Benchmark Runner
+
+对 config/test_config.yaml 中 benchmarks 定义的场景反复计时（先预热），统计中位数/p95，
+与预算比较后输出可以在提交之间对比的 JSON 报告：
+
+- single_image_generation / batch_N_images: 通过本地 Mock 图像服务器生成图像（延迟取 api.gemini.mock_response_time，
+  并发取 image.max_concurrent），包含请求、base64 解码和 PNG 解码
+- background_removal: 对生成的图像做纯色背景移除（image.background_removal 中的 tolerance）
+- image_resize: 把生成的图像缩放到 image.test_sizes 中的各个尺寸
+
+可以导入 mcp_server 时（与 concurrency_sweep 相同的判断），生成场景调用真实的
+_generate_game_asset_internal(workspace, max_concurrent=N)（图像 API 通过环境变量指向 Mock 服务器），
+background_removal 场景调用真实的 _post_process_images(workspace)（背景移除、缩放和保存原图，
+AUTO_REMOVE_BACKGROUND 由调用方决定）；否则使用上面的内置替身。报告中每个场景记录实际使用的 backend
+
+用法示例:
+  python benchmark_runner.py
+  python benchmark_runner.py --repeat 10 --warmup 2 --output bench.json
+  python benchmark_runner.py --compare bench_main.json   # 与之前的报告对比中位数变化
+"""
+
+import io
+import os
+import re
+import sys
+import json
+import time
+import yaml
+import base64
+import shutil
+import asyncio
+import inspect
+import tempfile
+import argparse
+import logging
+import platform
+import statistics
+import subprocess
+import urllib.request
+from pathlib import Path
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, List, Callable, Optional, Tuple, TYPE_CHECKING
+
+from mock_image_server import MockImageServer, MockServerConfig, SIZE_PATTERN
+
+if TYPE_CHECKING:
+    import numpy as np  # numpy/PIL 只在图像场景中导入（concurrency_sweep 只需要 percentile）
+
+# 添加项目根目录到 Python 路径（用于导入 mcp_server）
+sys.path.insert(0, str(Path(__file__).parent.parent.parent))
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s [%(levelname)s] %(message)s',
+    datefmt='%H:%M:%S'
+)
+logger = logging.getLogger(__name__)
+
+REPORT_VERSION = 1
+BATCH_PATTERN = re.compile(r'^batch_(\d+)_images$')
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """线性插值计算百分位数"""
+    ordered = sorted(values)
+    if len(ordered) == 1:
+        return ordered[0]
+    rank = (len(ordered) - 1) * pct / 100
+    low = int(rank)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (rank - low)
+
+
+def _pipeline_functions() -> Dict[str, Callable]:
+    """可以导入 mcp_server 时返回其中真实的管道函数（_generate_game_asset_internal、_post_process_images）"""
+    try:
+        import mcp_server
+    except ImportError:
+        return {}
+    return {name: getattr(mcp_server, name) for name in ('_generate_game_asset_internal', '_post_process_images')
+            if hasattr(mcp_server, name)}
+
+
+def _call(func: Callable, *args, **kwargs):
+    """调用同步函数或协程函数"""
+    result = func(*args, **kwargs)
+    if inspect.isawaitable(result):
+        result = asyncio.run(result)
+    return result
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                              text=True, check=True, timeout=5,
+                              cwd=Path(__file__).parent).stdout.strip()
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+class BenchmarkRunner:
+    """基准测试运行器"""
+
+    def __init__(self, config_path: str = None, repeat: int = 5, warmup: int = 1, backend: str = 'auto'):
+        if config_path is None:
+            config_path = Path(__file__).parent.parent / "config" / "test_config.yaml"
+        with open(config_path, 'r', encoding='utf-8') as f:
+            self.config = yaml.safe_load(f)
+        self.config_path = str(config_path)
+        self.repeat = repeat
+        self.warmup = warmup
+
+        image_config = self.config.get('image', {})
+        self.max_concurrent = image_config.get('max_concurrent', 3)
+        self.test_sizes = [tuple(map(int, SIZE_PATTERN.search(size).groups()))
+                           for size in image_config.get('test_sizes', ['1024x1024'])]
+        self.tolerance = image_config.get('background_removal', {}).get('tolerance', 40)
+
+        mock_delay = self.config.get('api', {}).get('gemini', {}).get('mock_response_time', 0.5)
+        self.server = MockImageServer(MockServerConfig(latency_mean=mock_delay))
+        self._sample: Optional['np.ndarray'] = None
+        self._scratch: List[str] = []  # 真实管道场景使用的临时工作空间
+
+        # backend: auto 可导入 mcp_server 时使用真实管道函数 / pipeline 必须使用真实函数 / simulated 只用内置替身
+        self.pipeline = _pipeline_functions() if backend != 'simulated' else {}
+        if backend == 'pipeline' and not self.pipeline:
+            raise ImportError("无法导入 mcp_server 中的管道函数（--backend pipeline）")
+
+    # ---------------- 场景 ----------------
+
+    def _generate(self, prompt: str, size) -> 'np.ndarray':
+        """向 Mock 服务器请求一张图像并解码"""
+        import numpy as np
+        from PIL import Image
+
+        width, height = size
+        body = json.dumps({'contents': [{'parts': [{'text': prompt}]}]}).encode('utf-8')
+        request = urllib.request.Request(
+            f"{self.server.base_url}/v1beta/models/mock:generateContent", data=body,
+            headers={'Content-Type': 'application/json', 'X-Mock-Size': f"{width}x{height}"})
+        with urllib.request.urlopen(request, timeout=60) as response:
+            payload = json.load(response)
+        data = payload['candidates'][0]['content']['parts'][0]['inlineData']['data']
+        with Image.open(io.BytesIO(base64.b64decode(data))) as img:
+            return np.asarray(img.convert('RGBA'))
+
+    def _batch_generation(self, count: int) -> Callable[[], None]:
+        def run():
+            size = self.test_sizes[0]
+            with ThreadPoolExecutor(max_workers=self.max_concurrent) as executor:
+                list(executor.map(lambda i: self._generate(f"benchmark asset {i}", size), range(count)))
+        return run
+
+    def _workspace(self, tasks: List[Dict], images: Optional[Dict[str, bytes]] = None) -> str:
+        """创建临时工作空间（public/tasks.json、public/assets/ 和 doc/），run() 结束时删除"""
+        workspace = tempfile.mkdtemp(prefix='bench_')
+        self._scratch.append(workspace)
+        self._reset_workspace(workspace, tasks, images)
+        return workspace
+
+    @staticmethod
+    def _reset_workspace(workspace: str, tasks: List[Dict], images: Optional[Dict[str, bytes]] = None):
+        public = Path(workspace) / "public"
+        shutil.rmtree(public, ignore_errors=True)
+        (public / "assets").mkdir(parents=True)
+        (Path(workspace) / "doc").mkdir(exist_ok=True)
+        with open(public / "tasks.json", 'w', encoding='utf-8') as f:
+            json.dump(tasks, f, ensure_ascii=False)
+        for name, data in (images or {}).items():
+            (public / "assets" / name).write_bytes(data)
+
+    def _bench_tasks(self, count: int) -> List[Dict]:
+        width, height = self.test_sizes[0]
+        return [{'name': f"benchmark_{i}.png", 'description': f"benchmark asset {i}", 'size': f"{width}x{height}",
+                 'yield_from': None, 'is_background': False} for i in range(count)]
+
+    def _pipeline_generation(self, count: int) -> Tuple[Callable[[], None], Callable[[], None]]:
+        """真实的 _generate_game_asset_internal：每次计时前重置工作空间，只保留 tasks.json"""
+        func = self.pipeline['_generate_game_asset_internal']
+        tasks = self._bench_tasks(count)
+        workspace = self._workspace(tasks)
+        return (lambda: _call(func, workspace, max_concurrent=self.max_concurrent),
+                lambda: self._reset_workspace(workspace, tasks))
+
+    def _pipeline_post_process(self) -> Tuple[Callable[[], None], Callable[[], None]]:
+        """真实的 _post_process_images：每次计时前恢复未处理的样本图像"""
+        from PIL import Image
+
+        func = self.pipeline['_post_process_images']
+        buffer = io.BytesIO()
+        Image.fromarray(self._sample_image(), 'RGBA').save(buffer, format='PNG')
+        tasks = self._bench_tasks(1)
+        images = {tasks[0]['name']: buffer.getvalue()}
+        workspace = self._workspace(tasks, images)
+        return (lambda: _call(func, workspace),
+                lambda: self._reset_workspace(workspace, tasks, images))
+
+    def _sample_image(self) -> 'np.ndarray':
+        if self._sample is None:
+            self._sample = self._generate("benchmark sample", self.test_sizes[0])
+        return self._sample
+
+    def _background_removal(self):
+        """纯色背景移除：与白色背景相差在 tolerance 内的像素设为透明"""
+        import numpy as np
+        from PIL import Image
+
+        image = self._sample_image().copy()
+        distance = np.abs(image[..., :3].astype(np.int16) - 255).max(axis=-1)
+        image[..., 3] = np.where(distance <= self.tolerance, 0, image[..., 3])
+        Image.fromarray(image, 'RGBA').save(io.BytesIO(), format='PNG')
+
+    def _image_resize(self):
+        from PIL import Image
+
+        with Image.fromarray(self._sample_image(), 'RGBA') as img:
+            for size in self.test_sizes:
+                img.resize(size, Image.LANCZOS).save(io.BytesIO(), format='PNG')
+
+    def _scenario(self, name: str) -> Optional[Tuple[Callable[[], None], Optional[Callable[[], None]], str]]:
+        """返回场景的 (计时函数, 每次计时前的准备函数, backend)，未知场景返回 None"""
+        count = 1 if name == 'single_image_generation' else None
+        match = BATCH_PATTERN.match(name)
+        if match:
+            count = int(match.group(1))
+        if count is not None:
+            if '_generate_game_asset_internal' in self.pipeline:
+                return (*self._pipeline_generation(count), 'pipeline')
+            return self._batch_generation(count), None, 'simulated'
+        if name == 'background_removal' and '_post_process_images' in self.pipeline:
+            return (*self._pipeline_post_process(), 'pipeline')
+        func = {'background_removal': self._background_removal,
+                'image_resize': self._image_resize}.get(name)
+        return (func, None, 'simulated') if func else None
+
+    # ---------------- 计时 ----------------
+
+    def measure(self, name: str, func: Callable[[], None], budget: float,
+                setup: Optional[Callable[[], None]] = None) -> Dict[str, Any]:
+        """预热后重复执行场景并统计耗时（setup 在每次执行前调用，不计入耗时）"""
+        for _ in range(self.warmup):
+            if setup:
+                setup()
+            func()
+        samples = []
+        for _ in range(self.repeat):
+            if setup:
+                setup()
+            start = time.perf_counter()
+            func()
+            samples.append(time.perf_counter() - start)
+
+        median = statistics.median(samples)
+        p95 = percentile(samples, 95)
+        result = {
+            'budget': budget,
+            'runs': len(samples),
+            'median': round(median, 4),
+            'p95': round(p95, 4),
+            'min': round(min(samples), 4),
+            'max': round(max(samples), 4),
+            'samples': [round(value, 4) for value in samples],
+            'passed': p95 <= budget,
+        }
+        status = "✅" if result['passed'] else "❌"
+        logger.info(f"{status} {name}: 中位数 {median:.3f}s, p95 {p95:.3f}s (预算 {budget}s)")
+        return result
+
+    def run(self, only: Optional[List[str]] = None) -> Dict[str, Any]:
+        """运行所有（或指定的）基准场景并返回报告"""
+        benchmarks = self.config.get('benchmarks', {})
+        results = {}
+        with self.server:
+            if self.pipeline:
+                os.environ['GOOGLE_GEMINI_BASE_URL'] = self.server.base_url
+                logger.info(f"使用真实管道函数: {', '.join(sorted(self.pipeline))}")
+            try:
+                for name, budget in benchmarks.items():
+                    if only and name not in only:
+                        continue
+                    scenario = self._scenario(name)
+                    if scenario is None:
+                        logger.warning(f"⚠ 未知的基准场景，已跳过: {name}")
+                        continue
+                    func, setup, backend = scenario
+                    results[name] = {**self.measure(name, func, float(budget), setup), 'backend': backend}
+            finally:
+                for workspace in self._scratch:
+                    shutil.rmtree(workspace, ignore_errors=True)
+                self._scratch.clear()
+
+        return {
+            'version': REPORT_VERSION,
+            'created_at': datetime.now().isoformat(timespec='seconds'),
+            'commit': _git_commit(),
+            'environment': {
+                'python': platform.python_version(),
+                'platform': platform.platform(),
+                'config': self.config_path,
+                'repeat': self.repeat,
+                'warmup': self.warmup,
+                'max_concurrent': self.max_concurrent,
+                'mock_response_time': self.server.config.latency_mean,
+                'pipeline': sorted(self.pipeline),
+            },
+            'passed': all(result['passed'] for result in results.values()),
+            'benchmarks': results,
+        }
+
+
+def compare_reports(current: Dict, previous: Dict) -> Dict[str, Dict[str, float]]:
+    """对比两份报告的中位数，返回 场景 -> {previous, current, change_pct}"""
+    changes = {}
+    for name, result in current.get('benchmarks', {}).items():
+        before = previous.get('benchmarks', {}).get(name)
+        if not before or not before.get('median'):
+            continue
+        change = (result['median'] - before['median']) / before['median'] * 100
+        changes[name] = {'previous': before['median'], 'current': result['median'],
+                         'change_pct': round(change, 1)}
+        logger.info(f"   {name}: {before['median']:.3f}s -> {result['median']:.3f}s ({change:+.1f}%)")
+    return changes
+
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description='图像管道性能基准测试（对照 test_config.yaml 中的 benchmarks 预算）')
+    parser.add_argument('--config', '-c', type=str, default=None,
+                        help='配置文件路径（默认: config/test_config.yaml）')
+    parser.add_argument('--repeat', '-r', type=int, default=5, help='每个场景的计时次数')
+    parser.add_argument('--warmup', type=int, default=1, help='计时前的预热次数')
+    parser.add_argument('--only', type=str, default=None, help='只运行指定场景，多个场景用逗号分隔')
+    parser.add_argument('--output', '-o', type=str, default='benchmark_report.json', help='JSON 报告输出路径')
+    parser.add_argument('--compare', type=str, default=None, help='与之前的 JSON 报告对比中位数变化')
+    parser.add_argument('--backend', choices=['auto', 'pipeline', 'simulated'], default='auto',
+                        help='auto: 可导入 mcp_server 时调用真实的管道函数，否则使用内置替身')
+    args = parser.parse_args()
+
+    runner = BenchmarkRunner(config_path=args.config, repeat=args.repeat, warmup=args.warmup,
+                             backend=args.backend)
+    report = runner.run(only=args.only.split(',') if args.only else None)
+
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            previous = json.load(f)
+        logger.info(f"\n与 {args.compare} ({previous.get('commit')}) 对比:")
+        report['comparison'] = {'against': previous.get('commit'), 'changes': compare_reports(report, previous)}
+
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    logger.info(f"\n📄 基准报告已写入: {args.output}")
+
+    if not report['passed']:
+        logger.error("❌ 存在超出预算的基准场景")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
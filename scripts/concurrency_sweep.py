@@ -0,0 +1,375 @@
+#!/usr/bin/env python3
+"""
+图像生成并发度扫描
+Concurrency Sweep for Image Generation
+
+对同一份 tasks.json，在不同的 Mock 延迟配置下依次以多个 max_concurrent 运行图像生成，
+统计每个并发度的吞吐量（张/秒）、尾延迟（p95/p99）和峰值内存，用数据选择并发度：
+
+- 可以导入 mcp_server 时调用真实的 _generate_game_asset_internal(workspace, max_concurrent=N)，
+  其图像 API 通过环境变量指向本地 Mock 服务器
+- 否则使用内置的模拟客户端：按 yield_from 分批，每批内最多 N 个并发请求，参考图作为 inline_data 发送
+
+每个并发度在独立的 spawn 子进程中运行：峰值内存（ru_maxrss）只统计该子进程自身，
+不包含扫描进程（及其 Mock 服务器线程）的内存，各并发度之间互不影响
+
+用法示例:
+  python concurrency_sweep.py
+  python concurrency_sweep.py --levels 1,2,4,8 --profiles typical --max-tasks 20 -o sweep.json
+  python concurrency_sweep.py --levels 2,4,adaptive --profiles quota_limited
+"""
+
+import os
+import sys
+import json
+import time
+import yaml
+import base64
+import asyncio
+import argparse
+import logging
+import resource
+import tempfile
+import statistics
+import importlib.util
+import urllib.request
+import multiprocessing
+from pathlib import Path
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, List, Optional
+
+from asset_manifest import dependency_levels, parse_references
+from mock_image_server import MockImageServer, MockServerConfig, MockServerStats
+from benchmark_runner import percentile, _git_commit
+from adaptive_concurrency import AdaptiveConcurrencyController, AdaptiveConfig
+from api_guard import ApiGuard
+from asset_scheduler import run_ready_queue
+from background_removal import BackgroundRemovalService
+from reference_cache import ReferenceImageCache
+from style_prefix import StylePrefixPlan
+
+# 添加项目根目录到 Python 路径（用于导入 mcp_server）
+sys.path.insert(0, str(Path(__file__).parent.parent.parent))
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SWEEP = {
+    'levels': [1, 2, 3, 4, 6, 8],
+    'tasks': 'tasks.json',
+    'max_tasks': None,
+    'profiles': {'typical': {'distribution': 'lognormal', 'mean': 0.5, 'stddev': 0.3}},
+}
+
+
+def _simulate_generation(workspace: str, max_concurrent, base_url: str, adaptive: Optional[Dict] = None,
+                         api_guard: Optional[Dict] = None, scheduler: str = 'ready',
+                         reference_config: Optional[Dict] = None,
+                         style_prefix: Optional[Dict] = None,
+                         background_removal: Optional[Dict] = None) -> Dict[str, Any]:
+    """内置的模拟生成客户端：按 yield_from 依赖并发请求 Mock 服务器，并把图像写入 public/assets/
+
+    scheduler 为 'ready' 时参考图完成后立即启动下游任务（关键路径优先），为 'levels' 时按拓扑层级整批执行；
+    max_concurrent 为 'adaptive' 时由 AdaptiveConcurrencyController 动态调整并发；
+    提供 api_guard 配置时每个请求经过 ApiGuard 限流和重试；提供 reference_config 时参考图经过 ReferenceImageCache；
+    提供 style_prefix 配置时公共风格句作为 systemInstruction 发送（StylePrefixPlan）；
+    提供 background_removal 配置时每张图像写入后提交给 BackgroundRemovalService，生成结束后等待抠图完成
+    """
+    assets_path = Path(workspace) / "public" / "assets"
+    with open(Path(workspace) / "public" / "tasks.json", 'r', encoding='utf-8') as f:
+        tasks = json.load(f)
+    reference_cache = ReferenceImageCache.from_config(reference_config) if reference_config else None
+    prefix_plan = StylePrefixPlan.from_config(tasks, style_prefix) if style_prefix else None
+    removal = None
+    if background_removal:
+        if importlib.util.find_spec('rembg') is None:
+            logger.warning("⚠ 未安装 rembg，跳过背景移除")
+        else:
+            removal = BackgroundRemovalService.from_config(background_removal)
+
+    def request_image(task: Dict):
+        if prefix_plan is not None:
+            body = prefix_plan.request_body(task)
+        else:
+            body = {'contents': [{'parts': [{'text': f"{task.get('description', '')}\nSize: {task.get('size', '')}"}]}]}
+        parts = body['contents'][0]['parts']
+        if reference_cache is not None:
+            parts += reference_cache.parts_for(task.get('yield_from'), assets_path)
+        else:
+            for ref in parse_references(task.get('yield_from')):
+                ref_path = assets_path / ref
+                if ref_path.exists():
+                    parts.append({'inline_data': {'mime_type': 'image/png',
+                                                  'data': base64.b64encode(ref_path.read_bytes()).decode('ascii')}})
+        request = urllib.request.Request(
+            f"{base_url}/v1beta/models/mock:generateContent",
+            data=json.dumps(body).encode('utf-8'),
+            headers={'Content-Type': 'application/json'})
+        with urllib.request.urlopen(request, timeout=120) as response:
+            payload = json.load(response)
+        data = payload['candidates'][0]['content']['parts'][0]['inlineData']['data']
+        (assets_path / task['name']).write_bytes(base64.b64decode(data))
+        if removal is not None:
+            removal.submit(assets_path / task['name'])
+
+    controller = (AdaptiveConcurrencyController(AdaptiveConfig.from_config(adaptive))
+                  if max_concurrent == 'adaptive' else None)
+    guard = ApiGuard.from_config(api_guard) if api_guard else None
+
+    schedule: Dict[str, Any] = {}
+
+    async def run() -> List[Any]:
+        loop = asyncio.get_running_loop()
+        workers = controller.config.max_limit if controller else max_concurrent
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            async def request(task: Dict):
+                return await loop.run_in_executor(executor, request_image, task)
+
+            async def worker(task: Dict):
+                return await (guard.call(request, task) if guard else request(task))
+
+            if scheduler == 'ready':
+                report = await run_ready_queue(tasks, worker, max_concurrent=workers, controller=controller)
+                schedule.update({k: report[k] for k in ('critical_path_length', 'critical_path_time', 'efficiency')})
+                return list(report['results'].values())
+
+            if controller:
+                return await controller.run_batches(dependency_levels(tasks), worker)
+
+            semaphore = asyncio.Semaphore(max_concurrent)
+
+            async def limited(task: Dict):
+                async with semaphore:
+                    return await worker(task)
+
+            results = []
+            for batch in dependency_levels(tasks):
+                results += await asyncio.gather(*(limited(task) for task in batch), return_exceptions=True)
+            return results
+
+    results = asyncio.run(run())
+    failed = sum(1 for result in results if isinstance(result, BaseException))
+    counts = {'generated': len(results) - failed, 'failed': failed, 'schedule': schedule}
+    if controller:
+        counts['adaptive'] = controller.summary()
+    if reference_cache is not None:
+        counts['reference_cache'] = dict(reference_cache.stats)
+    if prefix_plan is not None:
+        counts['style_prefix'] = prefix_plan.summary()
+    if removal is not None:
+        counts['background_removal'] = removal.drain()  # 等待抠图完成，计入本并发度的墙钟时间
+        removal.close()
+    if guard:
+        counts['api_stats'] = {k: round(v, 3) if isinstance(v, float) else v for k, v in guard.stats.items()}
+    return counts
+
+
+def _run_level(tasks: List[Dict], max_concurrent, base_url: str, use_pipeline: bool,
+               adaptive: Optional[Dict] = None, api_guard: Optional[Dict] = None,
+               scheduler: str = 'ready', reference_config: Optional[Dict] = None,
+               style_prefix: Optional[Dict] = None,
+               background_removal: Optional[Dict] = None) -> Dict[str, Any]:
+    """在子进程中以指定并发度生成一次全部素材
+
+    peak_rss_mb 为子进程自身的峰值内存，baseline_rss_mb 为开始生成前（解释器和模块导入）的峰值，
+    两者之差即生成过程新增的内存
+    """
+    baseline_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    with tempfile.TemporaryDirectory(prefix='sweep_') as workspace:
+        (Path(workspace) / "public" / "assets").mkdir(parents=True)
+        (Path(workspace) / "doc").mkdir()
+        with open(Path(workspace) / "public" / "tasks.json", 'w', encoding='utf-8') as f:
+            json.dump(tasks, f, ensure_ascii=False)
+
+        start = time.perf_counter()
+        if use_pipeline:
+            from mcp_server import _generate_game_asset_internal
+            asyncio.run(_generate_game_asset_internal(workspace, max_concurrent=max_concurrent))
+            generated = sum(1 for task in tasks if (Path(workspace) / "public" / "assets" / task['name']).exists())
+            counts = {'generated': generated, 'failed': len(tasks) - generated}
+        else:
+            counts = _simulate_generation(workspace, max_concurrent, base_url, adaptive, api_guard,
+                                          scheduler, reference_config, style_prefix, background_removal)
+        wall_time = time.perf_counter() - start
+
+    return {
+        'wall_time': wall_time,
+        'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        'baseline_rss_mb': baseline_rss / 1024,
+        **counts,
+    }
+
+
+def _pipeline_available() -> bool:
+    try:
+        from mcp_server import _generate_game_asset_internal  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+class ConcurrencySweep:
+    """并发度扫描"""
+
+    def __init__(self, config_path: str = None, levels: Optional[List] = None,
+                 profiles: Optional[List[str]] = None, max_tasks: Optional[int] = None,
+                 backend: str = 'auto', scheduler: Optional[str] = None):
+        project_root = Path(__file__).parent.parent
+        if config_path is None:
+            config_path = project_root / "config" / "test_config.yaml"
+        with open(config_path, 'r', encoding='utf-8') as f:
+            config = yaml.safe_load(f) or {}
+        sweep_config = {**DEFAULT_SWEEP, **(config.get('concurrency_sweep') or {})}
+
+        self.levels = levels or sweep_config['levels']
+        self.profiles = {name: profile for name, profile in sweep_config['profiles'].items()
+                         if not profiles or name in profiles}
+        tasks_path = Path(sweep_config['tasks'])
+        if not tasks_path.is_absolute():
+            tasks_path = project_root / tasks_path
+        with open(tasks_path, 'r', encoding='utf-8') as f:
+            self.tasks = json.load(f)
+        max_tasks = max_tasks or sweep_config.get('max_tasks')
+        if max_tasks:
+            self.tasks = self._truncate(self.tasks, max_tasks)
+        self.tasks_path = str(tasks_path)
+
+        self.use_pipeline = backend == 'pipeline' or (backend == 'auto' and _pipeline_available())
+        self.adaptive = sweep_config.get('adaptive') or {}
+        self.api_guard = sweep_config.get('api_guard')
+        self.scheduler = scheduler or sweep_config.get('scheduler', 'ready')
+        self.reference_cache = sweep_config.get('reference_cache')
+        self.style_prefix = sweep_config.get('style_prefix')
+        self.background_removal = sweep_config.get('background_removal')
+        if self.use_pipeline and 'adaptive' in self.levels:
+            logger.warning("⚠ 真实管道不支持自适应并发，已跳过 adaptive")
+            self.levels = [level for level in self.levels if level != 'adaptive']
+
+    @staticmethod
+    def _truncate(tasks: List[Dict], max_tasks: int) -> List[Dict]:
+        """保留前 max_tasks 个任务，并去掉引用了被截掉素材的任务（保持 yield_from 可解析）"""
+        kept, names = [], set()
+        for batch in dependency_levels(tasks):
+            for task in batch:
+                refs = parse_references(task.get('yield_from'))
+                if len(kept) < max_tasks and all(ref in names for ref in refs):
+                    kept.append(task)
+                    names.add(task.get('name'))
+        return kept
+
+    def _measure(self, server: MockImageServer, level) -> Dict[str, Any]:
+        server.stats = MockServerStats()
+        server._recent.clear()  # max_rpm 窗口不跨并发度累计
+        server._seen_prefixes.clear()  # 前缀缓存不跨并发度复用
+        # spawn 而不是 fork：父进程中 Mock 服务器线程正在运行，fork 多线程进程可能在子进程中死锁，
+        # 且 fork 出的子进程 ru_maxrss 会计入从父进程继承的内存
+        ctx = multiprocessing.get_context('spawn')
+        with ctx.Pool(1) as pool:
+            run = pool.apply(_run_level, (self.tasks, level, server.base_url, self.use_pipeline,
+                                          self.adaptive, self.api_guard, self.scheduler,
+                                          self.reference_cache, self.style_prefix, self.background_removal))
+
+        latencies = server.stats.latencies or [0.0]
+        return {
+            'max_concurrent': level,
+            'images': run['generated'],
+            'failed': run['failed'],
+            'wall_time': round(run['wall_time'], 3),
+            'throughput': round(run['generated'] / run['wall_time'], 3) if run['wall_time'] else 0.0,
+            'latency_p50': round(statistics.median(latencies), 3),
+            'latency_p95': round(percentile(latencies, 95), 3),
+            'latency_p99': round(percentile(latencies, 99), 3),
+            'rate_limited': server.stats.rate_limited,
+            'errors': server.stats.errors,
+            'max_in_flight': server.stats.max_in_flight,
+            'peak_rss_mb': round(run['peak_rss_mb'], 1),
+            'rss_growth_mb': round(run['peak_rss_mb'] - run['baseline_rss_mb'], 1),
+            'retries': run.get('api_stats', {}).get('retries', 0),
+            **{k: round(v, 3) for k, v in run.get('schedule', {}).items()},
+            'wasted_seconds': run.get('api_stats', {}).get('wasted_seconds', 0.0),
+            **({'reference_cache': run['reference_cache']} if 'reference_cache' in run else {}),
+            **({'style_prefix': {**run['style_prefix'], 'cached_prompt_tokens': server.stats.cached_prompt_tokens}}
+               if 'style_prefix' in run else {}),
+            **({'adaptive': run['adaptive']} if 'adaptive' in run else {}),
+            **({'background_removal': run['background_removal']} if 'background_removal' in run else {}),
+        }
+
+    def run(self) -> Dict[str, Any]:
+        backend = '_generate_game_asset_internal' if self.use_pipeline else 'simulated'
+        logger.info(f"🔬 并发度扫描: {len(self.tasks)} 个任务, 并发度 {self.levels}, 后端 {backend}, "
+                    f"调度 {self.scheduler}")
+
+        results = {}
+        for name, profile in self.profiles.items():
+            image_api = {k: v for k, v in profile.items()
+                         if k not in ('distribution', 'mean', 'stddev', 'min', 'max')}
+            image_api['latency'] = {k: v for k, v in profile.items()
+                                    if k in ('distribution', 'mean', 'stddev', 'min', 'max')}
+            server = MockImageServer(MockServerConfig.from_config({'image_api': image_api}))
+            with server:
+                os.environ['GOOGLE_GEMINI_BASE_URL'] = server.base_url
+                os.environ.setdefault('AUTO_REMOVE_BACKGROUND', 'false')
+                rows = []
+                for level in self.levels:
+                    row = self._measure(server, level)
+                    rows.append(row)
+                    logger.info(f"   [{name}] 并发 {level}: {row['throughput']:.2f} 张/秒, "
+                                f"p95 {row['latency_p95']:.2f}s, 峰值内存 {row['peak_rss_mb']:.0f}MB")
+            results[name] = {'profile': profile, 'levels': rows}
+            self._print_table(name, rows)
+
+        return {
+            'created_at': datetime.now().isoformat(timespec='seconds'),
+            'commit': _git_commit(),
+            'backend': backend,
+            'scheduler': self.scheduler,
+            'tasks': self.tasks_path,
+            'task_count': len(self.tasks),
+            'profiles': results,
+        }
+
+    @staticmethod
+    def _print_table(name: str, rows: List[Dict]):
+        best = max(rows, key=lambda row: row['throughput'])
+        logger.info(f"\n延迟配置: {name}")
+        logger.info(f"{'并发':>4} {'张/秒':>8} {'p50(s)':>8} {'p95(s)':>8} {'p99(s)':>8} {'429':>5} {'失败':>5} {'重试':>5} {'内存(MB)':>9}")
+        for row in rows:
+            mark = " ←" if row is best else ""
+            logger.info(f"{str(row['max_concurrent']):>4} {row['throughput']:>8.2f} {row['latency_p50']:>8.2f} "
+                        f"{row['latency_p95']:>8.2f} {row['latency_p99']:>8.2f} {row['rate_limited']:>5} "
+                        f"{row['failed']:>5} {row['retries']:>5} {row['peak_rss_mb']:>9.1f}{mark}")
+
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description='图像生成 max_concurrent 并发度扫描')
+    parser.add_argument('--config', '-c', type=str, default=None,
+                        help='配置文件路径（默认: config/test_config.yaml）')
+    parser.add_argument('--levels', type=str, default=None, help='并发度列表，逗号分隔，adaptive 表示自适应并发（例如: 1,2,4,8,adaptive）')
+    parser.add_argument('--profiles', type=str, default=None, help='只运行指定的延迟配置，逗号分隔')
+    parser.add_argument('--max-tasks', type=int, default=None, help='最多使用的任务数')
+    parser.add_argument('--backend', choices=['auto', 'pipeline', 'simulated'], default='auto',
+                        help='auto: 可导入 mcp_server 时使用真实管道，否则使用模拟客户端')
+    parser.add_argument('--scheduler', choices=['ready', 'levels'], default=None,
+                        help='模拟客户端的调度方式: ready 就绪队列（关键路径优先）/ levels 按拓扑层级整批执行')
+    parser.add_argument('--output', '-o', type=str, default='concurrency_sweep.json', help='JSON 报告输出路径')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s [%(levelname)s] %(message)s', datefmt='%H:%M:%S')
+    sweep = ConcurrencySweep(
+        config_path=args.config,
+        levels=[level if level == 'adaptive' else int(level) for level in args.levels.split(',')]
+        if args.levels else None,
+        profiles=args.profiles.split(',') if args.profiles else None,
+        max_tasks=args.max_tasks,
+        backend=args.backend,
+        scheduler=args.scheduler,
+    )
+    report = sweep.run()
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    logger.info(f"\n📄 扫描报告已写入: {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,95 @@
+"""
+图像透明度分析模块
+Image Alpha Analysis Module
+
+用 NumPy 向量化计算素材图像的透明度指标：同尺寸的图像堆叠成一个 (N, H, W, 4) 数组，
+一次计算整批图像的 alpha 覆盖率、边框透明比例和残留背景色像素比例，避免逐像素的 Python 循环
+"""
+
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, List, Tuple
+
+import numpy as np
+from PIL import Image
+
+
+def _load_rgba(path: str) -> Tuple[np.ndarray, bool]:
+    """读取图像为 RGBA 数组，并返回原图是否带透明通道"""
+    with Image.open(path) as img:
+        has_alpha = img.mode in ('RGBA', 'LA', 'PA') or 'transparency' in img.info
+        return np.asarray(img.convert('RGBA')), has_alpha
+
+
+def _border_mask(height: int, width: int, border: int) -> np.ndarray:
+    """生成宽度为 border 像素的边框掩码"""
+    mask = np.zeros((height, width), dtype=bool)
+    mask[:border, :] = True
+    mask[-border:, :] = True
+    mask[:, :border] = True
+    mask[:, -border:] = True
+    return mask
+
+
+def _analyze_batch(stack: np.ndarray, background_rgb: np.ndarray, tolerance: int) -> Dict[str, np.ndarray]:
+    """对同尺寸的一批图像 (N, H, W, 4) 计算透明度指标"""
+    _, height, width, _ = stack.shape
+    border = max(1, min(height, width) // 32)
+    mask = _border_mask(height, width, border)
+
+    alpha = stack[..., 3]
+    border_alpha = alpha[:, mask]                                    # (N, K)
+    border_rgb = stack[:, mask, :3].astype(np.int16)                 # (N, K, 3)
+    near_background = (np.abs(border_rgb - background_rgb).max(axis=-1) <= tolerance)
+
+    return {
+        'alpha_coverage': (alpha > 0).mean(axis=(1, 2)),
+        'transparent_ratio': (alpha == 0).mean(axis=(1, 2)),
+        'border_transparency': (border_alpha == 0).mean(axis=1),
+        'residual_background': ((border_alpha > 0) & near_background).mean(axis=1),
+    }
+
+
+def analyze_alpha(paths: Dict[str, str], background_color: str = '#FFFFFF',
+                  tolerance: int = 40, max_workers: int = 8) -> Dict[str, Dict[str, Any]]:
+    """批量分析图像透明度
+
+    Args:
+        paths: 素材名 -> 图像路径
+        background_color: 生成时使用的纯色背景（默认白色）
+        tolerance: 判断为背景色的通道容差
+        max_workers: 并发解码图像的线程数
+
+    Returns:
+        素材名 -> {has_alpha, alpha_coverage, transparent_ratio, border_transparency, residual_background}
+        解码失败的素材包含 error 字段
+    """
+    background_rgb = np.array([int(background_color.lstrip('#')[i:i + 2], 16) for i in (0, 2, 4)],
+                              dtype=np.int16)
+
+    names = list(paths)
+    results: Dict[str, Dict[str, Any]] = {}
+    groups: Dict[Tuple[int, int], List[Tuple[str, np.ndarray]]] = defaultdict(list)
+
+    def load(name: str):
+        try:
+            return name, _load_rgba(paths[name]), None
+        except Exception as e:
+            return name, None, str(e)
+
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='alpha') as executor:
+        for name, loaded, error in executor.map(load, names):
+            if error is not None:
+                results[name] = {'error': error}
+                continue
+            array, has_alpha = loaded
+            results[name] = {'has_alpha': has_alpha}
+            groups[array.shape[:2]].append((name, array))
+
+    for members in groups.values():
+        stack = np.stack([array for _, array in members])
+        metrics = _analyze_batch(stack, background_rgb, tolerance)
+        for index, (name, _) in enumerate(members):
+            results[name].update({key: float(values[index]) for key, values in metrics.items()})
+
+    return results
@@ -0,0 +1,104 @@
+"""
+延迟导入与导入耗时分析模块
+Lazy Imports and Import-Time Profiling
+
+rembg、onnxruntime、cv2 等重量级依赖在图像模块顶层被导入，即使 AUTO_REMOVE_BACKGROUND=false
+或阶段只做文本生成也要付出数秒的启动时间（见 docs/DISABLE_REMBG.md）。本模块：
+
+- install_lazy_modules(): 在导入阶段函数所在模块之前，把这些依赖注册为 importlib.util.LazyLoader 延迟模块，
+  `import rembg` 只创建模块对象，首次访问属性（真正使用）时才执行模块代码
+  （`from rembg import remove` 会立即访问属性，因此仍会加载）
+- profile_imports(): 在子进程中以 `python -X importtime` 导入阶段模块，按累计耗时列出最慢的模块
+"""
+
+import os
+import re
+import sys
+import logging
+import subprocess
+import importlib.util
+from typing import Dict, Any, List, Optional, Sequence
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_LAZY_MODULES = ('rembg', 'onnxruntime', 'cv2')
+IMPORTTIME_PATTERN = re.compile(r'^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)')
+
+
+def install_lazy_modules(names: Sequence[str] = DEFAULT_LAZY_MODULES) -> List[str]:
+    """把尚未导入且已安装的模块注册为延迟模块，返回实际注册的模块名"""
+    installed = []
+    for name in names:
+        if name in sys.modules:
+            continue
+        try:
+            spec = importlib.util.find_spec(name)
+        except (ImportError, ValueError):
+            spec = None
+        if spec is None or spec.loader is None or not hasattr(spec.loader, 'exec_module'):
+            continue
+        spec.loader = importlib.util.LazyLoader(spec.loader)
+        module = importlib.util.module_from_spec(spec)
+        sys.modules[name] = module
+        spec.loader.exec_module(module)
+        installed.append(name)
+    if installed:
+        logger.debug(f"延迟导入: {', '.join(installed)}")
+    return installed
+
+
+def profile_imports(module_names: Sequence[str], lazy_modules: Sequence[str] = (),
+                    sys_path: Optional[Sequence[str]] = None, top: int = 15) -> Dict[str, Any]:
+    """在子进程中以 -X importtime 导入模块，返回总耗时和累计耗时最长的模块
+
+    Returns:
+        {'modules': 导入的模块, 'total_ms': 总耗时, 'slowest': [{'module', 'self_ms', 'cumulative_ms', 'depth'}],
+         'errors': 导入失败的模块和错误信息}
+    """
+    script = (
+        "import sys\n"
+        f"sys.path[:0] = {[os.path.dirname(os.path.abspath(__file__))] + list(sys_path or [])!r}\n"
+        "import lazy_imports\n"
+        f"lazy_imports.install_lazy_modules({list(lazy_modules)!r})\n"
+        f"for name in {list(module_names)!r}:\n"
+        "    try:\n"
+        "        __import__(name)  # importlib.import_module 不经过 -X importtime 计时\n"
+        "    except Exception as e:\n"
+        "        print(f'{name}: {type(e).__name__}: {e}', file=sys.stderr)\n"
+    )
+    completed = subprocess.run([sys.executable, '-X', 'importtime', '-c', script], capture_output=True, text=True)
+
+    rows, pending = [], []
+    errors = []
+    for line in completed.stderr.splitlines():
+        match = IMPORTTIME_PATTERN.match(line)
+        if match:
+            # 子模块先于父模块输出；分析脚本自身导入的 lazy_imports 子树不计入
+            self_us, cumulative_us, indent, module = match.groups()
+            pending.append({'module': module, 'self_ms': int(self_us) / 1000,
+                            'cumulative_ms': int(cumulative_us) / 1000, 'depth': len(indent) // 2})
+            if pending[-1]['depth'] == 0:
+                if module != 'lazy_imports':
+                    rows += pending
+                pending = []
+        elif not line.startswith('import time:'):
+            errors.append(line)
+
+    total_ms = sum(row['cumulative_ms'] for row in rows if row['depth'] == 0 and row['module'] in module_names)
+    return {
+        'modules': list(module_names),
+        'total_ms': round(total_ms, 1),
+        'slowest': sorted(rows, key=lambda row: row['cumulative_ms'], reverse=True)[:top],
+        'errors': '\n'.join(errors),
+    }
+
+
+def format_import_profile(profile: Dict[str, Any]) -> List[str]:
+    """把 profile_imports() 的结果格式化为 -X importtime 风格的表格行"""
+    lines = [f"导入 {', '.join(profile['modules'])}: 共 {profile['total_ms']:.1f}ms",
+             f"{'self(ms)':>9} | {'cumulative(ms)':>14} | module"]
+    for row in profile['slowest']:
+        lines.append(f"{row['self_ms']:>9.1f} | {row['cumulative_ms']:>14.1f} | {'  ' * row['depth']}{row['module']}")
+    for error in profile['errors'].splitlines():
+        lines.append(f"导入失败: {error}")
+    return lines
@@ -0,0 +1,115 @@
+"""
+LLM 响应录制/回放模块
+LLM Record/Replay Module
+
+把文本生成阶段（generate_game_design、generate_assets_json 等）的请求/响应对保存到
+global.mock.llm_responses 目录下，以规范化后的 prompt 哈希作为键，测试时直接回放：
+
+- off:    不录制也不回放，总是调用真实模型
+- record: 总是调用真实模型，并把响应写入（覆盖）fixture
+- replay: 命中 fixture 时回放（可模拟 api_delay），未命中时调用真实模型并录制
+- strict: 只回放，未命中 fixture 时阶段失败
+"""
+
+import re
+import json
+import hashlib
+import logging
+from pathlib import Path
+from datetime import datetime
+from typing import Dict, Any, List, Optional
+
+logger = logging.getLogger(__name__)
+
+REPLAY_MODES = ('off', 'record', 'replay', 'strict')
+DEFAULT_LLM_FUNCTIONS = [
+    "text_generation_function.generate_game_design",
+    "text_generation_function.generate_assets_json",
+    "text_generation_function.generate_assets_doc",
+    "text_generation_function.generate_todo_list",
+]
+
+_WHITESPACE = re.compile(r'\s+')
+
+
+class LLMReplayMissError(Exception):
+    """strict 模式下未找到录制的响应"""
+    pass
+
+
+def normalize_prompt(value: Any) -> Any:
+    """规范化 prompt：合并空白字符、去掉首尾空白；dict/list 递归处理
+
+    只有空白差异的输入（例如换行风格、缩进）会得到相同的键
+    """
+    if isinstance(value, str):
+        return _WHITESPACE.sub(' ', value).strip()
+    if isinstance(value, dict):
+        return {str(k): normalize_prompt(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [normalize_prompt(v) for v in value]
+    return value
+
+
+class LLMReplayStore:
+    """按 prompt 哈希存取录制的 LLM 响应"""
+
+    def __init__(self, fixtures_dir: str, mode: str = 'replay', api_delay: float = 0.0,
+                 functions: Optional[List[str]] = None):
+        if mode not in REPLAY_MODES:
+            raise ValueError(f"未知的录制/回放模式: {mode}（可选: {', '.join(REPLAY_MODES)}）")
+        self.fixtures_dir = Path(fixtures_dir)
+        self.mode = mode
+        self.api_delay = api_delay
+        self.functions = set(functions or DEFAULT_LLM_FUNCTIONS)
+
+    def handles(self, function_path: str) -> bool:
+        """该函数是否经过录制/回放层"""
+        return self.mode != 'off' and function_path in self.functions
+
+    def compute_key(self, function_path: str, prompt: Any) -> str:
+        """计算 函数路径 + 规范化 prompt 的哈希"""
+        payload = json.dumps({'function': function_path, 'prompt': normalize_prompt(prompt)},
+                             sort_keys=True, ensure_ascii=False, default=str)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def _fixture_path(self, function_path: str, key: str) -> Path:
+        return self.fixtures_dir / function_path.rsplit('.', 1)[-1] / f"{key[:16]}.json"
+
+    def load(self, function_path: str, prompt: Any) -> Optional[Dict]:
+        """读取录制的响应，不存在或损坏时返回 None"""
+        key = self.compute_key(function_path, prompt)
+        fixture_path = self._fixture_path(function_path, key)
+        if not fixture_path.exists():
+            return None
+        try:
+            with open(fixture_path, 'r', encoding='utf-8') as f:
+                entry = json.load(f)
+        except (json.JSONDecodeError, OSError) as e:
+            logger.warning(f"⚠ LLM fixture 损坏，已忽略: {fixture_path} ({e})")
+            return None
+        # 截断的文件名发生碰撞时视为未命中
+        return entry if entry.get('key') == key else None
+
+    def record(self, function_path: str, prompt: Any, response: Any) -> bool:
+        """写入录制的响应（原子替换），响应无法 JSON 序列化时返回 False"""
+        key = self.compute_key(function_path, prompt)
+        entry = {
+            'key': key,
+            'function': function_path,
+            'prompt': prompt,
+            'response': response,
+            'recorded_at': datetime.now().isoformat(timespec='seconds'),
+        }
+        fixture_path = self._fixture_path(function_path, key)
+        fixture_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = fixture_path.with_suffix('.tmp')
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(entry, f, ensure_ascii=False, indent=2)
+        except (TypeError, ValueError):
+            tmp_path.unlink(missing_ok=True)
+            logger.warning(f"⚠ {function_path} 的响应无法序列化，未录制")
+            return False
+        tmp_path.replace(fixture_path)
+        return True
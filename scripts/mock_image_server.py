@@ -0,0 +1,377 @@
+#!/usr/bin/env python3
+"""
+Mock 图像生成服务器
+Mock Image Generation Server
+
+本地模拟 Gemini generateContent 接口，用于在无网络环境下测试图像生成阶段：
+- 接受与 _generate_game_asset_internal 相同的请求格式（text + inline_data 参考图，含 __MULTI__: 多图参考）
+- 按请求的尺寸返回确定性的程序化 PNG（相同 prompt 总是得到相同图像）
+- 可配置延迟分布、错误率和 429 限流（按概率或按每分钟请求数）
+
+用法示例:
+  # 独立启动
+  python mock_image_server.py --port 8765 --latency 0.5 --error-rate 0.05 --rate-limit-rate 0.1
+
+  # 在代码中使用
+  with MockImageServer(MockServerConfig(latency_mean=0.2)) as server:
+      print(server.base_url)
+"""
+
+import re
+import json
+import math
+import time
+import zlib
+import base64
+import random
+import struct
+import hashlib
+import argparse
+import logging
+import threading
+from collections import deque
+from dataclasses import dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Any, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+SIZE_PATTERN = re.compile(r'(\d{1,5})\s*[x×]\s*(\d{1,5})')
+# Gemini imageConfig.aspectRatio -> 默认输出尺寸
+ASPECT_RATIO_SIZES = {
+    '1:1': (1024, 1024), '16:9': (1344, 768), '9:16': (768, 1344),
+    '4:3': (1184, 864), '3:4': (864, 1184), '3:2': (1248, 832), '2:3': (832, 1248),
+}
+
+
+@dataclass
+class MockServerConfig:
+    """Mock 服务器配置"""
+    host: str = '127.0.0.1'
+    port: int = 0                         # 0 表示自动分配端口
+    latency_distribution: str = 'fixed'   # fixed / uniform / normal / lognormal
+    latency_mean: float = 0.5             # 秒
+    latency_stddev: float = 0.0
+    latency_min: float = 0.0
+    latency_max: float = 60.0
+    error_rate: float = 0.0               # 返回 500 的概率
+    rate_limit_rate: float = 0.0          # 返回 429 的概率
+    max_rpm: int = 0                      # 每分钟请求上限，超过返回 429（0 表示不限制）
+    default_size: Tuple[int, int] = (1024, 1024)
+    max_size: int = 4096
+    seed: int = 0                         # 影响延迟和错误注入的随机种子（图像内容只由 prompt 决定）
+
+    @classmethod
+    def from_config(cls, mock_config: Dict, **overrides) -> 'MockServerConfig':
+        """从 stage_test_config.yaml 的 global.mock 配置构建
+
+        global.mock.api_delay 作为默认平均延迟，global.mock.image_api 中的字段覆盖同名配置
+        """
+        image_api = dict(mock_config.get('image_api') or {})
+        image_api.pop('env', None)
+        values = {'latency_mean': mock_config.get('api_delay', cls.latency_mean)}
+        latency = image_api.pop('latency', None) or {}
+        for key in ('distribution', 'mean', 'stddev', 'min', 'max'):
+            if key in latency:
+                values[f'latency_{key}'] = latency[key]
+        values.update({k: v for k, v in image_api.items() if k in cls.__dataclass_fields__})
+        values.update(overrides)
+        if isinstance(values.get('default_size'), (list, str)):
+            values['default_size'] = _parse_size(values['default_size']) or cls.default_size
+        return cls(**values)
+
+
+@dataclass
+class MockServerStats:
+    """请求统计"""
+    requests: int = 0
+    succeeded: int = 0
+    errors: int = 0
+    rate_limited: int = 0
+    bad_requests: int = 0
+    reference_images: int = 0
+    cached_prompt_tokens: int = 0     # 命中前缀缓存的 systemInstruction token 数
+    latencies: List[float] = field(default_factory=list)
+    in_flight: int = 0
+    max_in_flight: int = 0
+
+    def to_dict(self) -> Dict[str, Any]:
+        data = {k: v for k, v in self.__dict__.items() if k != 'latencies'}
+        if self.latencies:
+            ordered = sorted(self.latencies)
+            data['latency_mean'] = round(sum(ordered) / len(ordered), 4)
+            data['latency_p95'] = round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))], 4)
+        return data
+
+
+def _parse_size(value) -> Optional[Tuple[int, int]]:
+    if isinstance(value, (list, tuple)) and len(value) == 2:
+        return int(value[0]), int(value[1])
+    match = SIZE_PATTERN.search(str(value or ''))
+    if not match:
+        return None
+    return int(match.group(1)), int(match.group(2))
+
+
+def encode_png(width: int, height: int, rows: List[bytes]) -> bytes:
+    """把 RGB 行数据编码为 PNG（纯标准库实现）"""
+    def chunk(tag: bytes, data: bytes) -> bytes:
+        return struct.pack('>I', len(data)) + tag + data + struct.pack('>I', zlib.crc32(tag + data) & 0xffffffff)
+
+    raw = b''.join(b'\x00' + row for row in rows)
+    return (b'\x89PNG\r\n\x1a\n'
+            + chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0))
+            + chunk(b'IDAT', zlib.compress(raw, 6))
+            + chunk(b'IEND', b''))
+
+
+def render_placeholder(prompt: str, width: int, height: int, references: int = 0) -> bytes:
+    """根据 prompt 确定性地绘制占位图：白色背景上居中的纯色矩形，带 1 像素黑色描边
+
+    参考图数量越多，矩形内会多画几条横向色带，便于肉眼区分多图参考的结果
+    """
+    rng = random.Random(hashlib.sha256(prompt.encode('utf-8')).digest())
+    color = bytes(rng.randrange(40, 216) for _ in range(3))
+    accent = bytes(rng.randrange(0, 256) for _ in range(3))
+    white, black = b'\xff\xff\xff', b'\x00\x00\x00'
+
+    fill = rng.uniform(0.55, 0.8)
+    box_w, box_h = max(3, int(width * fill)), max(3, int(height * fill))
+    left, top = (width - box_w) // 2, (height - box_h) // 2
+    right, bottom = left + box_w, top + box_h
+
+    blank = white * width
+    edge = white * left + black * box_w + white * (width - right)
+    body = white * left + black + color * (box_w - 2) + black + white * (width - right)
+    band = white * left + black + accent * (box_w - 2) + black + white * (width - right)
+    band_rows = {top + (i + 1) * box_h // (references + 2) for i in range(references)}
+
+    rows = []
+    for y in range(height):
+        if y < top or y >= bottom:
+            rows.append(blank)
+        elif y == top or y == bottom - 1:
+            rows.append(edge)
+        elif y in band_rows:
+            rows.append(band)
+        else:
+            rows.append(body)
+    return encode_png(width, height, rows)
+
+
+class MockImageServer:
+    """本地 Mock 图像生成服务器（在后台线程中运行）"""
+
+    def __init__(self, config: Optional[MockServerConfig] = None):
+        self.config = config or MockServerConfig()
+        self.stats = MockServerStats()
+        self._rng = random.Random(self.config.seed)
+        self._lock = threading.Lock()
+        self._recent = deque()  # 最近一分钟内的请求时间（用于 max_rpm 限流）
+        self._seen_prefixes = set()  # 已收到过的 systemInstruction（模拟服务端前缀缓存）
+        self._httpd: Optional[ThreadingHTTPServer] = None
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> 'MockImageServer':
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_POST(self):
+                server._handle(self)
+
+            def log_message(self, format, *args):
+                logger.debug("mock-image " + format, *args)
+
+        self._httpd = ThreadingHTTPServer((self.config.host, self.config.port), Handler)
+        self._httpd.daemon_threads = True
+        self._thread = threading.Thread(target=self._httpd.serve_forever, name='mock-image-server', daemon=True)
+        self._thread.start()
+        logger.info(f"✓ Mock 图像服务器已启动: {self.base_url}")
+        return self
+
+    def stop(self):
+        if self._httpd is not None:
+            self._httpd.shutdown()
+            self._httpd.server_close()
+            self._thread.join(5)
+            self._httpd = None
+            logger.info(f"✓ Mock 图像服务器已停止: {self.stats.to_dict()}")
+
+    def __enter__(self) -> 'MockImageServer':
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    # ---------------- 请求处理 ----------------
+
+    def _sample_latency(self) -> float:
+        cfg = self.config
+        with self._lock:
+            if cfg.latency_distribution == 'uniform':
+                value = self._rng.uniform(cfg.latency_min, cfg.latency_max)
+            elif cfg.latency_distribution == 'normal':
+                value = self._rng.gauss(cfg.latency_mean, cfg.latency_stddev)
+            elif cfg.latency_distribution == 'lognormal':
+                # 以 mean/stddev 描述的对数正态分布（参数为实际延迟的均值和标准差）
+                mean = max(cfg.latency_mean, 1e-6)
+                sigma2 = math.log(1 + (cfg.latency_stddev / mean) ** 2)
+                mu = math.log(mean) - sigma2 / 2
+                value = self._rng.lognormvariate(mu, sigma2 ** 0.5)
+            else:
+                value = cfg.latency_mean
+        return min(max(value, cfg.latency_min), cfg.latency_max)
+
+    def _admit(self) -> Optional[int]:
+        """决定是否注入错误，返回要返回的错误状态码（None 表示正常处理）"""
+        cfg = self.config
+        now = time.monotonic()
+        with self._lock:
+            if cfg.max_rpm:
+                while self._recent and now - self._recent[0] > 60:
+                    self._recent.popleft()
+                if len(self._recent) >= cfg.max_rpm:
+                    return 429
+                self._recent.append(now)
+            roll = self._rng.random()
+        if roll < cfg.rate_limit_rate:
+            return 429
+        if roll < cfg.rate_limit_rate + cfg.error_rate:
+            return 500
+        return None
+
+    def _resolve_size(self, handler, body: Dict, prompt: str) -> Tuple[int, int]:
+        size = _parse_size(handler.headers.get('X-Mock-Size'))
+        if size is None:
+            image_config = (body.get('generationConfig') or body.get('generation_config') or {}).get('imageConfig') or {}
+            size = ASPECT_RATIO_SIZES.get(image_config.get('aspectRatio'))
+        if size is None:
+            size = _parse_size(prompt)
+        width, height = size or self.config.default_size
+        limit = self.config.max_size
+        return max(1, min(width, limit)), max(1, min(height, limit))
+
+    def _send_json(self, handler, status: int, payload: Dict):
+        data = json.dumps(payload).encode('utf-8')
+        handler.send_response(status)
+        handler.send_header('Content-Type', 'application/json')
+        handler.send_header('Content-Length', str(len(data)))
+        if status == 429:
+            handler.send_header('Retry-After', '1')
+        handler.end_headers()
+        handler.wfile.write(data)
+
+    def _handle(self, handler):
+        start = time.perf_counter()
+        with self._lock:
+            self.stats.requests += 1
+            self.stats.in_flight += 1
+            self.stats.max_in_flight = max(self.stats.max_in_flight, self.stats.in_flight)
+
+        try:
+            length = int(handler.headers.get('Content-Length') or 0)
+            try:
+                body = json.loads(handler.rfile.read(length) or b'{}')
+                parts = [part for content in body.get('contents', []) for part in content.get('parts', [])]
+                system = body.get('systemInstruction') or body.get('system_instruction') or {}
+                system_text = '\n'.join(part['text'] for part in system.get('parts', []) if 'text' in part)
+                texts = [part['text'] for part in parts if 'text' in part]
+                prompt = '\n'.join([system_text] + texts if system_text else texts)
+                references = [part.get('inline_data') or part.get('inlineData')
+                              for part in parts if 'inline_data' in part or 'inlineData' in part]
+                for ref in references:
+                    base64.b64decode(ref['data'], validate=True)
+            except (ValueError, KeyError, TypeError, AttributeError) as e:
+                with self._lock:
+                    self.stats.bad_requests += 1
+                self._send_json(handler, 400, {'error': {'code': 400, 'message': f'Invalid request: {e}',
+                                                         'status': 'INVALID_ARGUMENT'}})
+                return
+
+            time.sleep(self._sample_latency())
+
+            status = self._admit()
+            if status == 429:
+                with self._lock:
+                    self.stats.rate_limited += 1
+                self._send_json(handler, 429, {'error': {'code': 429, 'message': 'Resource has been exhausted',
+                                                         'status': 'RESOURCE_EXHAUSTED'}})
+                return
+            if status == 500:
+                with self._lock:
+                    self.stats.errors += 1
+                self._send_json(handler, 500, {'error': {'code': 500, 'message': 'Internal error (mock)',
+                                                         'status': 'INTERNAL'}})
+                return
+
+            cached_tokens = 0
+            if system_text:
+                with self._lock:
+                    if system_text in self._seen_prefixes:
+                        cached_tokens = len(system_text) // 4
+                    self._seen_prefixes.add(system_text)
+            width, height = self._resolve_size(handler, body, prompt)
+            png = render_placeholder(prompt, width, height, references=len(references))
+            self._send_json(handler, 200, {
+                'candidates': [{
+                    'content': {'role': 'model', 'parts': [
+                        {'inlineData': {'mimeType': 'image/png', 'data': base64.b64encode(png).decode('ascii')}},
+                    ]},
+                    'finishReason': 'STOP',
+                }],
+                'usageMetadata': {'promptTokenCount': len(prompt) // 4, 'cachedContentTokenCount': cached_tokens,
+                                  'referenceImageCount': len(references)},
+            })
+            with self._lock:
+                self.stats.succeeded += 1
+                self.stats.cached_prompt_tokens += cached_tokens
+                self.stats.reference_images += len(references)
+        finally:
+            with self._lock:
+                self.stats.in_flight -= 1
+                self.stats.latencies.append(time.perf_counter() - start)
+
+
+def main():
+    """独立运行 Mock 服务器"""
+    parser = argparse.ArgumentParser(description='Mock 图像生成服务器（Gemini generateContent 格式）')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--latency', type=float, default=0.5, help='平均延迟（秒）')
+    parser.add_argument('--latency-distribution', default='fixed',
+                        choices=['fixed', 'uniform', 'normal', 'lognormal'])
+    parser.add_argument('--latency-stddev', type=float, default=0.0)
+    parser.add_argument('--latency-min', type=float, default=0.0)
+    parser.add_argument('--latency-max', type=float, default=60.0)
+    parser.add_argument('--error-rate', type=float, default=0.0, help='返回 500 的概率')
+    parser.add_argument('--rate-limit-rate', type=float, default=0.0, help='返回 429 的概率')
+    parser.add_argument('--max-rpm', type=int, default=0, help='每分钟请求上限（0 表示不限制）')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s [%(levelname)s] %(message)s', datefmt='%H:%M:%S')
+    config = MockServerConfig(
+        host=args.host, port=args.port,
+        latency_distribution=args.latency_distribution, latency_mean=args.latency,
+        latency_stddev=args.latency_stddev, latency_min=args.latency_min, latency_max=args.latency_max,
+        error_rate=args.error_rate, rate_limit_rate=args.rate_limit_rate, max_rpm=args.max_rpm, seed=args.seed,
+    )
+    server = MockImageServer(config).start()
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,124 @@
+"""
+参考图编码缓存模块
+Reference Image Encoding Cache
+
+yield_from / __MIRROR__: / __MULTI__: 的参考图会被多个下游任务反复读取并 base64 编码
+（例如 player_idle_down_32.png 是 5 个任务的参考图，__MULTI__: 缩略图一次引用 3-5 张完整素材）。
+本模块在进程内按 路径 + mtime + 文件大小 缓存编码后的 inline_data，按编码后的总字节数做 LRU 淘汰，
+并可选地把最长边超过 max_edge 的参考图先缩小再编码，减少磁盘读取、base64 编码开销和请求体大小
+"""
+
+import io
+import os
+import base64
+import struct
+import logging
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, Any, List, Optional, Tuple
+
+from asset_manifest import parse_references
+
+logger = logging.getLogger(__name__)
+
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+
+
+def _png_size(data: bytes) -> Optional[Tuple[int, int]]:
+    if data.startswith(PNG_SIGNATURE) and data[12:16] == b'IHDR':
+        return struct.unpack('>II', data[16:24])
+    return None
+
+
+def _sniff_mime(data: bytes) -> str:
+    if data.startswith(b'\xff\xd8\xff'):
+        return 'image/jpeg'
+    if data.startswith(b'RIFF') and data[8:12] == b'WEBP':
+        return 'image/webp'
+    return 'image/png'
+
+
+class ReferenceImageCache:
+    """参考图 inline_data 的 LRU 缓存（线程安全）"""
+
+    def __init__(self, max_bytes: int = 64 * 1024 * 1024, max_edge: Optional[int] = None):
+        """
+        Args:
+            max_bytes: 缓存的编码数据总字节数上限
+            max_edge: 参考图最长边上限（像素），超过时缩小后再编码；None 表示不缩放
+        """
+        self.max_bytes = max_bytes
+        self.max_edge = max_edge
+        self._entries: 'OrderedDict[Tuple, Dict[str, str]]' = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        self.stats = {'hits': 0, 'misses': 0, 'evictions': 0, 'bytes_read': 0,
+                      'bytes_encoded': 0, 'bytes_saved_by_downscale': 0}
+
+    @classmethod
+    def from_config(cls, config: Optional[Dict]) -> 'ReferenceImageCache':
+        config = config or {}
+        return cls(max_bytes=int(config.get('max_mb', 64) * 1024 * 1024), max_edge=config.get('max_edge'))
+
+    def _downscale(self, data: bytes) -> Tuple[bytes, str]:
+        """最长边超过 max_edge 时缩小（保持宽高比），返回 (数据, MIME 类型)"""
+        size = _png_size(data)
+        if not self.max_edge or (size is not None and max(size) <= self.max_edge):
+            return data, _sniff_mime(data)
+
+        from PIL import Image
+        with Image.open(io.BytesIO(data)) as img:
+            mime_type = Image.MIME.get(img.format, 'image/png')
+            if max(img.size) <= self.max_edge:
+                return data, mime_type
+            img.thumbnail((self.max_edge, self.max_edge), Image.LANCZOS)
+            buffer = io.BytesIO()
+            img.save(buffer, format='PNG')
+        return buffer.getvalue(), 'image/png'
+
+    def get(self, path) -> Dict[str, str]:
+        """返回参考图的 inline_data（{mime_type, data}），文件变化（mtime 或大小不同）后自动重新编码"""
+        path = Path(path)
+        st = os.stat(path)
+        key = (str(path.resolve()), st.st_mtime_ns, st.st_size, self.max_edge)
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.stats['hits'] += 1
+                return entry
+            self.stats['misses'] += 1
+
+        raw = path.read_bytes()
+        data, mime_type = self._downscale(raw)
+        entry = {'mime_type': mime_type, 'data': base64.b64encode(data).decode('ascii')}
+        entry_size = len(entry['data'])
+
+        with self._lock:
+            self.stats['bytes_read'] += len(raw)
+            self.stats['bytes_encoded'] += entry_size
+            self.stats['bytes_saved_by_downscale'] += len(raw) - len(data)
+            if key not in self._entries and entry_size <= self.max_bytes:
+                self._entries[key] = entry
+                self._size += entry_size
+                while self._size > self.max_bytes:
+                    _, evicted = self._entries.popitem(last=False)
+                    self._size -= len(evicted['data'])
+                    self.stats['evictions'] += 1
+        return entry
+
+    def parts_for(self, yield_from: Optional[str], assets_dir) -> List[Dict[str, Any]]:
+        """为任务的 yield_from 生成请求用的 inline_data 部分（跳过不存在的参考图）"""
+        parts = []
+        for ref in parse_references(yield_from):
+            ref_path = Path(assets_dir) / ref
+            if ref_path.exists():
+                parts.append({'inline_data': self.get(ref_path)})
+        return parts
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
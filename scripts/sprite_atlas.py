@@ -0,0 +1,220 @@
+"""
+精灵图集打包模块
+Sprite Atlas Packing Module
+
+把 public/assets/ 中的非背景素材打包成一张或多张纹理图集，并写出 JSON 帧索引，
+游戏只需加载少数几张图集而不是几十个 32×32 的小文件：
+
+- 按 yield_from 把派生素材归入其参考图所在的组（player_walk_down_1_32.png 跟随 player_idle_down_32.png），
+  组内按 参考图 → 派生素材 的深度优先顺序排成一行，同一角色的待机帧和动作帧在图集中相邻
+- 各组作为整体按高度降序做货架式（shelf）装箱，放不下时换行或开始新的图集；
+  排成多行后高于 max_size 的组按行拆成多个块，每个块都能放进一张图集
+- 超过 max_sprite_edge（或图集边长 max_size）的素材（例如整张地图）不打包，在索引的 skipped 中注明原因
+
+索引格式 (public/atlas/atlas.json):
+    {
+      "atlases": [{"image": "atlas_0.png", "width": 512, "height": 96}],
+      "frames": {"player_idle_down_32.png": {"atlas": 0, "x": 0, "y": 0, "w": 32, "h": 32,
+                                             "group": "player_idle_down_32.png"}},
+      "skipped": {"tilemap_level1_example_512x512.png": "background"}
+    }
+"""
+
+import json
+import logging
+from pathlib import Path
+from datetime import datetime
+from typing import Dict, Any, List, Tuple
+
+from asset_manifest import parse_references
+
+logger = logging.getLogger(__name__)
+
+ATLAS_DIR = "public/atlas/"
+ATLAS_INDEX = "atlas.json"
+
+
+def _group_order(tasks: List[Dict]) -> List[Tuple[str, List[str]]]:
+    """按 yield_from 分组：返回 [(组根素材, 组内素材按深度优先排列)]，组的顺序与根素材在任务列表中的顺序一致
+
+    只有单一参考图（含 __MIRROR__:）的素材归入参考图的组，__MULTI__: 缩略图自成一组
+    """
+    names = [task.get('name') for task in tasks]
+    children: Dict[str, List[str]] = {name: [] for name in names}
+    parent_of: Dict[str, str] = {}
+    for task in tasks:
+        refs = [ref for ref in parse_references(task.get('yield_from')) if ref in children]
+        if len(refs) == 1 and not (task.get('yield_from') or '').startswith('__MULTI__:'):
+            parent_of[task.get('name')] = refs[0]
+            children[refs[0]].append(task.get('name'))
+
+    groups, seen = [], set()
+    for name in names:
+        if name in parent_of or name in seen:
+            continue
+        members, stack = [], [name]
+        while stack:
+            current = stack.pop()
+            if current in seen:
+                continue
+            seen.add(current)
+            members.append(current)
+            stack.extend(reversed(children[current]))
+        groups.append((name, members))
+    # 循环引用的素材不属于任何根，各自成组
+    groups += [(name, [name]) for name in names if name not in seen]
+    return groups
+
+
+def _layout_group(sizes: List[Tuple[int, int]], max_width: int, padding: int) -> Tuple[List[Tuple[int, int]], int, int]:
+    """把一组素材从左到右排成行（超过 max_width 时换行），返回 (相对坐标, 块宽, 块高)"""
+    positions, x, y, row_height, width = [], 0, 0, 0, 0
+    for w, h in sizes:
+        if x and x + w > max_width:
+            x, y, row_height = 0, y + row_height + padding, 0
+        positions.append((x, y))
+        x += w + padding
+        row_height = max(row_height, h)
+        width = max(width, x - padding)
+    return positions, width, y + row_height
+
+
+def _split_block(members: List[Tuple[str, int, int]], positions: List[Tuple[int, int]], max_size: int
+                 ) -> List[Tuple[List[Tuple[str, int, int]], List[Tuple[int, int]], int, int]]:
+    """把排好的组按行拆成高度不超过 max_size 的块（同一行的素材不拆开），返回 [(素材, 相对坐标, 块宽, 块高)]"""
+    row_heights: Dict[int, int] = {}
+    for (_, _, h), (_, dy) in zip(members, positions):
+        row_heights[dy] = max(row_heights.get(dy, 0), h)
+
+    chunks: List[Tuple[List, List]] = []
+    top = None
+    for member, (dx, dy) in zip(members, positions):
+        if top is None or (dx == 0 and dy + row_heights[dy] - top > max_size):
+            chunks.append(([], []))
+            top = dy
+        chunks[-1][0].append(member)
+        chunks[-1][1].append((dx, dy - top))
+
+    return [(chunk, offsets, max(dx + w for (_, w, _), (dx, _) in zip(chunk, offsets)),
+             max(dy + h for (_, _, h), (_, dy) in zip(chunk, offsets)))
+            for chunk, offsets in chunks]
+
+
+def plan_atlases(items: List[Tuple[str, List[Tuple[str, int, int]]]], max_size: int = 1024,
+                 padding: int = 1) -> Tuple[List[Dict[str, int]], Dict[str, Dict[str, Any]]]:
+    """计算图集布局
+
+    Args:
+        items: [(组名, [(素材名, 宽, 高)])]，组内顺序即排列顺序
+        max_size: 图集的最大边长
+        padding: 素材之间的间隔像素
+
+    Returns:
+        (图集尺寸列表 [{width, height}], 素材名 -> {atlas, x, y, w, h, group})
+
+    Raises:
+        ValueError: 单个素材的宽或高超过 max_size（任何图集都放不下）
+    """
+    blocks = []
+    for group, members in items:
+        for name, w, h in members:
+            if w > max_size or h > max_size:
+                raise ValueError(f"素材 {name} ({w}x{h}) 超过图集边长 {max_size}")
+        positions, width, height = _layout_group([(w, h) for _, w, h in members], max_size, padding)
+        if height <= max_size:
+            blocks.append((group, members, positions, width, height))
+        else:
+            blocks += [(group, *chunk) for chunk in _split_block(members, positions, max_size)]
+    blocks.sort(key=lambda block: block[4], reverse=True)
+
+    atlases: List[Dict[str, int]] = []
+    frames: Dict[str, Dict[str, Any]] = {}
+    x = shelf_y = shelf_height = 0
+    for group, members, positions, width, height in blocks:
+        if not atlases:
+            atlases.append({'width': 0, 'height': 0})
+        if x and x + width > max_size:
+            x, shelf_y, shelf_height = 0, shelf_y + shelf_height + padding, 0
+        if shelf_y and shelf_y + height > max_size:
+            atlases.append({'width': 0, 'height': 0})
+            x = shelf_y = shelf_height = 0
+
+        atlas = atlases[-1]
+        for (name, w, h), (dx, dy) in zip(members, positions):
+            frames[name] = {'atlas': len(atlases) - 1, 'x': x + dx, 'y': shelf_y + dy, 'w': w, 'h': h, 'group': group}
+        atlas['width'] = max(atlas['width'], x + width)
+        atlas['height'] = max(atlas['height'], shelf_y + height)
+        x += width + padding
+        shelf_height = max(shelf_height, height)
+    return atlases, frames
+
+
+def pack_atlases(workspace_dir: str, assets_dir: str = "public/assets/", output_dir: str = ATLAS_DIR,
+                 tasks_file: str = "public/tasks.json", max_size: int = 1024, padding: int = 1,
+                 max_sprite_edge: int = 256) -> Dict[str, Any]:
+    """把工作空间中的非背景素材打包为图集并写出帧索引（阶段函数）
+
+    Returns:
+        {'atlases': 图集数量, 'frames': 打包的素材数, 'skipped': 未打包的素材数, 'index': 索引路径}
+    """
+    from PIL import Image
+
+    workspace = Path(workspace_dir)
+    assets_path = workspace / assets_dir
+    with open(workspace / tasks_file, 'r', encoding='utf-8') as f:
+        tasks = json.load(f)
+
+    skipped: Dict[str, str] = {}
+    sizes: Dict[str, Tuple[int, int]] = {}
+    for task in tasks:
+        name = task.get('name')
+        if task.get('is_background', False):
+            skipped[name] = 'background'
+            continue
+        try:
+            with Image.open(assets_path / name) as img:
+                sizes[name] = img.size
+        except OSError:
+            skipped[name] = 'missing'
+            continue
+        if max(sizes[name]) > min(max_sprite_edge, max_size):
+            skipped[name] = 'too_large'
+            del sizes[name]
+
+    items = []
+    for group, members in _group_order(tasks):
+        packed = [(name, *sizes[name]) for name in members if name in sizes]
+        if packed:
+            items.append((group, packed))
+    atlases, frames = plan_atlases(items, max_size, padding)
+
+    output_path = workspace / output_dir
+    output_path.mkdir(parents=True, exist_ok=True)
+    for stale in output_path.glob('atlas_*.png'):
+        stale.unlink()
+    index_atlases = []
+    for number, atlas in enumerate(atlases):
+        sheet = Image.new('RGBA', (atlas['width'], atlas['height']), (0, 0, 0, 0))
+        for name, frame in frames.items():
+            if frame['atlas'] == number:
+                with Image.open(assets_path / name) as img:
+                    sheet.paste(img.convert('RGBA'), (frame['x'], frame['y']))
+        image_name = f"atlas_{number}.png"
+        sheet.save(output_path / image_name, format='PNG', optimize=True)
+        index_atlases.append({'image': image_name, **atlas})
+
+    index = {
+        'created_at': datetime.now().isoformat(timespec='seconds'),
+        'padding': padding,
+        'atlases': index_atlases,
+        'frames': frames,
+        'skipped': skipped,
+    }
+    tmp_path = output_path / f".{ATLAS_INDEX}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(index, f, ensure_ascii=False, indent=2)
+    tmp_path.replace(output_path / ATLAS_INDEX)
+
+    logger.info(f"🧩 图集打包: {len(frames)} 个素材 -> {len(index_atlases)} 张图集, 未打包 {len(skipped)} 个")
+    return {'atlases': len(index_atlases), 'frames': len(frames), 'skipped': len(skipped),
+            'index': str(Path(output_dir) / ATLAS_INDEX)}
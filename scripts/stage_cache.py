@@ -0,0 +1,112 @@
+"""
+阶段输出缓存模块
+Stage Output Cache Module
+
+以阶段输入的内容哈希作为键缓存阶段输出（输出文件内容或内存变量），
+在复用的工作空间上重复运行某个阶段时，如果输入未变化则直接恢复输出而不再调用函数
+"""
+
+import json
+import hashlib
+import logging
+from pathlib import Path
+from datetime import datetime
+from typing import Dict, Any, Optional
+
+logger = logging.getLogger(__name__)
+
+# 支持缓存的输出类型（图像目录由素材清单负责增量生成）
+CACHEABLE_OUTPUT_TYPES = ('file', 'memory')
+
+
+class StageCache:
+    """基于内容哈希的阶段输出缓存"""
+
+    def __init__(self, cache_dir: str):
+        self.cache_dir = Path(cache_dir)
+
+    def _entry_path(self, key: str) -> Path:
+        return self.cache_dir / key[:2] / f"{key}.json"
+
+    @staticmethod
+    def _hash_file(file_path: Path) -> Optional[str]:
+        if not file_path.exists():
+            return None
+        digest = hashlib.sha256()
+        with open(file_path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+    def compute_key(self, stage_config: Dict, input_data: Any, workspace_dir: str) -> Optional[str]:
+        """计算阶段缓存键
+
+        键由函数路径、解析后的输入和阶段 options 组成；
+        directory 类型的输入只是工作空间路径，改用 required_files 的内容哈希代替
+
+        Returns:
+            缓存键；输出类型不支持缓存或输入无法序列化时返回 None
+        """
+        output_type = stage_config.get('output', {}).get('type')
+        if output_type not in CACHEABLE_OUTPUT_TYPES:
+            return None
+
+        input_config = stage_config.get('input', {})
+        if input_config.get('type') == 'directory':
+            input_data = {
+                rel_path: self._hash_file(Path(workspace_dir) / rel_path)
+                for rel_path in input_config.get('required_files', [])
+            }
+
+        try:
+            payload = json.dumps({
+                'function': stage_config.get('function'),
+                'input': input_data,
+                'options': stage_config.get('options', {}),
+            }, sort_keys=True, ensure_ascii=False)
+        except (TypeError, ValueError):
+            return None
+
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def load(self, key: str) -> Optional[Dict]:
+        """读取缓存条目，不存在或损坏时返回 None"""
+        entry_path = self._entry_path(key)
+        if not entry_path.exists():
+            return None
+        try:
+            with open(entry_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (json.JSONDecodeError, OSError) as e:
+            logger.warning(f"⚠ 缓存条目损坏，已忽略: {entry_path} ({e})")
+            return None
+
+    def store(self, key: str, stage_config: Dict, value: Any) -> bool:
+        """写入缓存条目（原子替换）
+
+        Args:
+            key: 缓存键
+            stage_config: 阶段配置
+            value: file 输出为文件内容字符串，memory 输出为变量值
+
+        Returns:
+            是否写入成功（memory 变量无法 JSON 序列化时不缓存）
+        """
+        entry = {
+            'function': stage_config.get('function'),
+            'output': stage_config.get('output', {}).get('type'),
+            'created_at': datetime.now().isoformat(timespec='seconds'),
+            'value': value,
+        }
+
+        entry_path = self._entry_path(key)
+        entry_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = entry_path.with_suffix('.tmp')
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(entry, f, ensure_ascii=False)
+        except (TypeError, ValueError):
+            tmp_path.unlink(missing_ok=True)
+            return False
+        tmp_path.replace(entry_path)
+        return True
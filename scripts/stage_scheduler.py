@@ -0,0 +1,81 @@
+"""
+阶段调度模块
+Stage Scheduler Module
+
+根据 stage_test_config.yaml 中每个阶段声明的 dependencies 构建阶段 DAG，
+供运行器并发执行互不依赖的阶段
+"""
+
+from typing import Dict, List, Set
+
+
+class StageGraph:
+    """阶段依赖图（只包含本次要运行的阶段）"""
+
+    def __init__(self, stages_config: Dict[str, Dict], stages_to_run: List[str]):
+        """
+        Args:
+            stages_config: 工作流的 stages 配置
+            stages_to_run: 本次要运行的阶段（保持用户给定的顺序）
+        """
+        self.stages = list(stages_to_run)
+        selected = set(self.stages)
+
+        # 未被选中的依赖视为已满足（例如在复用的工作空间上只运行 stage4）
+        self.dependencies: Dict[str, List[str]] = {}
+        for stage_name in self.stages:
+            declared = (stages_config.get(stage_name) or {}).get('dependencies') or []
+            self.dependencies[stage_name] = [dep for dep in declared if dep in selected]
+
+        self.dependents: Dict[str, List[str]] = {name: [] for name in self.stages}
+        for stage_name, deps in self.dependencies.items():
+            for dep in deps:
+                self.dependents[dep].append(stage_name)
+
+        self._check_acyclic()
+
+    def _check_acyclic(self):
+        """检测循环依赖"""
+        in_degree = {name: len(deps) for name, deps in self.dependencies.items()}
+        queue = [name for name in self.stages if in_degree[name] == 0]
+        visited = 0
+        while queue:
+            current = queue.pop()
+            visited += 1
+            for child in self.dependents[current]:
+                in_degree[child] -= 1
+                if in_degree[child] == 0:
+                    queue.append(child)
+
+        if visited != len(self.stages):
+            cyclic = [name for name in self.stages if in_degree[name] > 0]
+            raise ValueError(f"阶段之间存在循环依赖: {', '.join(cyclic)}")
+
+    def ready(self, done: Set[str], started: Set[str]) -> List[str]:
+        """返回依赖均已完成且尚未启动的阶段"""
+        return [
+            name for name in self.stages
+            if name not in started and all(dep in done for dep in self.dependencies[name])
+        ]
+
+    def ancestors(self, stage_name: str) -> Set[str]:
+        """返回某阶段的所有上游阶段"""
+        result = set()
+        stack = list(self.dependencies.get(stage_name, []))
+        while stack:
+            current = stack.pop()
+            if current not in result:
+                result.add(current)
+                stack.extend(self.dependencies[current])
+        return result
+
+    def descendants(self, stage_name: str) -> Set[str]:
+        """返回某阶段的所有下游阶段"""
+        result = set()
+        stack = list(self.dependents.get(stage_name, []))
+        while stack:
+            current = stack.pop()
+            if current not in result:
+                result.add(current)
+                stack.extend(self.dependents[current])
+        return result
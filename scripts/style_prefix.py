@@ -0,0 +1,99 @@
+"""
+素材描述公共风格前缀提取模块
+Shared Style Prefix Extraction for Asset Descriptions
+
+tasks.json 中的素材描述大量重复相同的风格说明（例如 "Orthogonal top-down view, completely flat 2D sprite."、
+"No shadows, no lighting effects."、"This is a partial image edit."）。本模块按句子统计整个游戏的任务列表，
+把出现在足够多任务中的句子提取为公共风格块：
+
+- 每个任务的公共句子（保持原顺序）组成它的风格前缀，作为 systemInstruction 发送，
+  相同的前缀在请求开头逐字一致，可以命中服务端的前缀缓存（Gemini 隐式缓存）
+- 每次请求的 contents 只包含任务特有的剩余描述和尺寸
+
+前缀每次请求都会完整发送，重组描述并不减少线路字节数；能节省的是服务端缓存命中的前缀 token。
+统计分开记录：实际发送的字节数（前缀按每次请求计入），以及前缀 token 中可命中缓存的部分和需按原价计费的部分
+（按 4 字节/token 估算，与 Mock 服务器一致；真实命中数以响应 usageMetadata.cachedContentTokenCount 为准）
+"""
+
+import re
+import math
+import logging
+import threading
+from collections import Counter
+from typing import Dict, Any, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+SENTENCE_PATTERN = re.compile(r'(?<=[.!?])\s+')
+BYTES_PER_TOKEN = 4
+
+
+def split_sentences(text: str) -> List[str]:
+    """按句末标点切分句子（去掉空白句）"""
+    return [sentence.strip() for sentence in SENTENCE_PATTERN.split(text or '') if sentence.strip()]
+
+
+class StylePrefixPlan:
+    """一个游戏任务列表的公共风格前缀（线程安全地统计发送量）"""
+
+    def __init__(self, shared_sentences: Sequence[str]):
+        self.shared_sentences = frozenset(shared_sentences)
+        self._sent_prefixes = set()
+        self._lock = threading.Lock()
+        self.stats = {'requests': 0, 'prefixes': 0, 'bytes_original': 0, 'bytes_sent': 0,
+                      'prefix_tokens': 0, 'prefix_tokens_cacheable': 0}
+
+    @classmethod
+    def from_tasks(cls, tasks: List[Dict], min_share: float = 0.1, min_tasks: int = 2) -> 'StylePrefixPlan':
+        """出现在至少 max(min_tasks, min_share × 任务数) 个任务描述中的句子视为公共风格句"""
+        counts = Counter()
+        for task in tasks:
+            counts.update(set(split_sentences(task.get('description', ''))))
+        threshold = max(min_tasks, math.ceil(min_share * len(tasks)))
+        return cls([sentence for sentence, count in counts.items() if count >= threshold])
+
+    @classmethod
+    def from_config(cls, tasks: List[Dict], config: Optional[Dict]) -> 'StylePrefixPlan':
+        config = config or {}
+        return cls.from_tasks(tasks, min_share=config.get('min_share', 0.1), min_tasks=config.get('min_tasks', 2))
+
+    def split(self, description: str) -> Tuple[str, str]:
+        """把描述拆成 (风格前缀, 任务特有的剩余描述)，两部分都保持句子的原始顺序"""
+        sentences = split_sentences(description)
+        prefix = ' '.join(s for s in sentences if s in self.shared_sentences)
+        remainder = ' '.join(s for s in sentences if s not in self.shared_sentences)
+        return prefix, remainder
+
+    def request_body(self, task: Dict) -> Dict[str, Any]:
+        """生成 generateContent 请求体（不含参考图），风格前缀放在 systemInstruction 中
+
+        前缀和剩余描述每次都计入 bytes_sent；同一前缀第二次及以后发送时，其 token 计为可命中前缀缓存
+        """
+        description = task.get('description', '')
+        prefix, remainder = self.split(description)
+        body: Dict[str, Any] = {'contents': [{'parts': [{'text': f"{remainder}\nSize: {task.get('size', '')}"}]}]}
+        if prefix:
+            body['systemInstruction'] = {'parts': [{'text': prefix}]}
+
+        with self._lock:
+            self.stats['requests'] += 1
+            self.stats['bytes_original'] += len(description.encode('utf-8'))
+            self.stats['bytes_sent'] += len(remainder.encode('utf-8')) + len(prefix.encode('utf-8'))
+            if prefix:
+                tokens = len(prefix.encode('utf-8')) // BYTES_PER_TOKEN
+                self.stats['prefix_tokens'] += tokens
+                if prefix in self._sent_prefixes:
+                    self.stats['prefix_tokens_cacheable'] += tokens
+                else:
+                    self._sent_prefixes.add(prefix)
+                    self.stats['prefixes'] += 1
+        return body
+
+    def summary(self) -> Dict[str, Any]:
+        """本次运行的统计：请求数、不同前缀数、原始描述/实际发送字节数，
+        以及前缀 token 总数、可命中前缀缓存的 token 数和按原价计费的 token 数（估算）
+        """
+        with self._lock:
+            stats = dict(self.stats)
+        stats['prefix_tokens_billed'] = stats['prefix_tokens'] - stats['prefix_tokens_cacheable']
+        return stats
@@ -24,18 +24,43 @@ Stage-by-Stage Test Runner
 """
 
 import os
+import re
 import sys
 import json
 import yaml
 import argparse
 import logging
 import shutil
+import tempfile
 import asyncio
 import inspect
+import time
+import weakref
+import resource
+import threading
+import contextvars
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from functools import partial
 from pathlib import Path
-from typing import Dict, List, Any, Optional
+from typing import Dict, List, Any, Callable, Optional, Set, Tuple
 from datetime import datetime
 import importlib.util
+import multiprocessing
+
+from stage_scheduler import StageGraph
+from stage_cache import StageCache
+from asset_manifest import AssetManifest
+from mock_image_server import MockImageServer, MockServerConfig
+from llm_replay import LLMReplayStore, LLMReplayMissError
+from api_guard import ApiGuard
+from reference_cache import ReferenceImageCache
+from style_prefix import StylePrefixPlan
+from background_removal import BackgroundRemovalService
+from asset_store import AssetStore
+from workspace_gc import WorkspaceGC, write_run_status
+from workspace_snapshot import WorkspaceSnapshots, fork_workspace, parse_fork_spec
+from lazy_imports import DEFAULT_LAZY_MODULES, install_lazy_modules, profile_imports, format_import_profile
+from validation_engine import ValidationEngine
 
 # 添加项目根目录到 Python 路径
 project_root = Path(__file__).parent.parent.parent
@@ -50,15 +75,147 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 
+class StageTimeoutError(Exception):
+    """阶段执行超时"""
+
+
+def _function_module(function_path: str, function_modules: Optional[Dict[str, str]] = None) -> Tuple[str, str]:
+    """解析函数路径，返回 (模块名, 函数名)
+
+    例如 "text_generation_function.generate_game_design"；不带模块的内部函数优先使用
+    global.function_modules 中登记的定义模块，否则从 mcp_server 导入
+    """
+    if '.' in function_path:
+        module_name, func_name = function_path.rsplit('.', 1)
+        return module_name, func_name
+    return (function_modules or {}).get(function_path, "mcp_server"), function_path
+
+
+def _resolve_function(function_path: str, function_modules: Optional[Dict[str, str]] = None):
+    """根据函数路径导入函数（失败时抛出 ImportError/AttributeError）
+
+    只导入阶段需要的模块；登记的定义模块中找不到函数时回退到 mcp_server
+    """
+    module_name, func_name = _function_module(function_path, function_modules)
+    try:
+        return getattr(importlib.import_module(module_name), func_name)
+    except (ImportError, AttributeError):
+        if module_name == "mcp_server" or '.' in function_path:
+            raise
+        logger.debug(f"{module_name} 中没有 {func_name}，回退到 mcp_server")
+        return getattr(importlib.import_module("mcp_server"), func_name)
+
+
+# 当前正在执行的阶段（由任务工厂用于把新建的任务归属到阶段，便于超时后只取消该阶段的任务）
+_current_stage: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar('current_stage', default=None)
+
+
+def _worker_stats(start: float) -> Dict[str, Any]:
+    """工作进程的资源统计（随结果一起通过管道返回父进程）"""
+    return {'pid': os.getpid(), 'seconds': round(time.perf_counter() - start, 3),
+            'peak_rss_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)}
+
+
+def _sync_worker_main(function_path: str, args: tuple, conn):
+    """同步阶段工作进程入口：执行函数并通过管道返回结果和资源统计"""
+    start = time.perf_counter()
+    try:
+        result = _resolve_function(function_path)(*args)
+        conn.send(("ok", result, _worker_stats(start)))
+    except Exception as e:
+        import traceback
+        conn.send(("error", f"{type(e).__name__}: {e}\n{traceback.format_exc()}", _worker_stats(start)))
+    finally:
+        conn.close()
+
+
+def _run_in_killable_worker(function_path: str, args: tuple, timeout: float) -> Tuple[Any, Dict[str, Any]]:
+    """在独立的 spawn 进程中运行同步阶段函数，超时后强制终止进程
+
+    使用 spawn 而不是 fork：运行器进程中有事件循环、线程池和 Mock 服务器线程，
+    fork 多线程进程可能在子进程中死锁。函数在子进程中对模块状态的修改不会带回父进程，
+    只有返回值和资源统计通过管道返回
+
+    Returns:
+        (函数返回值, {'pid', 'seconds', 'peak_rss_mb'})
+    """
+    ctx = multiprocessing.get_context('spawn')
+    parent_conn, child_conn = ctx.Pipe(duplex=False)
+    process = ctx.Process(target=_sync_worker_main, args=(function_path, args, child_conn), daemon=True)
+    process.start()
+    child_conn.close()
+
+    try:
+        if not parent_conn.poll(timeout):
+            process.terminate()
+            process.join(5)
+            if process.is_alive():
+                process.kill()
+            raise StageTimeoutError(f"阶段执行超时 ({timeout:.1f}s)，工作进程已终止")
+        status, payload, stats = parent_conn.recv()
+    except EOFError:
+        raise RuntimeError(f"工作进程异常退出 (exitcode={process.exitcode})")
+    finally:
+        parent_conn.close()
+        process.join(1)
+
+    if status == "error":
+        raise RuntimeError(payload)
+    return payload, stats
+
+
+def _run_in_daemon_thread(func, args: tuple) -> asyncio.Future:
+    """在守护线程中运行同步函数，返回当前事件循环上的 Future
+
+    线程无法从外部中断：等待超时后函数会在后台运行到结束，但守护线程不会阻止进程退出，
+    也不会占用默认线程池（close() 关闭线程池时不必等待它）
+    """
+    loop = asyncio.get_running_loop()
+    future = loop.create_future()
+
+    def settle(setter, value):
+        if not future.done():
+            setter(value)
+
+    def target():
+        try:
+            outcome = (future.set_result, func(*args))
+        except BaseException as e:
+            outcome = (future.set_exception, e)
+        try:
+            loop.call_soon_threadsafe(settle, *outcome)
+        except RuntimeError:
+            pass  # 事件循环已关闭（阶段早已超时）
+
+    threading.Thread(target=target, name=f"stage-{getattr(func, '__name__', 'sync')}", daemon=True).start()
+    return future
+
+
+def _link_or_copy(src: Path, dst: Path):
+    """优先创建硬链接，跨文件系统等情况下退回复制"""
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copy2(src, dst)
+
+
 class StageTestRunner:
     """分阶段测试运行器"""
 
-    def __init__(self, config_path: str = None, user_input: str = None):
+    def __init__(self, config_path: str = None, user_input: str = None, sequential: bool = False,
+                 use_cache: Optional[bool] = None, refresh_stages: Optional[List[str]] = None,
+                 incremental: bool = False, use_mock: bool = True, llm_mode: Optional[str] = None):
         """初始化测试运行器
 
         Args:
             config_path: 配置文件路径
             user_input: 自定义用户输入（用于 stage1）
+            sequential: 是否强制按顺序逐个运行阶段（忽略依赖并发）
+            use_cache: 是否启用阶段输出缓存（None 表示取 global.stage_cache.enabled，默认关闭）
+            refresh_stages: 忽略缓存强制重新运行的阶段（结果仍会写入缓存）
+            incremental: 图像生成阶段是否只重新生成清单中变化的素材
+            use_mock: options.mock_api 为 true 的阶段是否使用本地 Mock 图像服务器
+            llm_mode: 文本生成阶段的录制/回放模式（off/record/replay/strict，默认取 global.mock.llm_mode）
         """
         # 默认配置文件路径（相对于脚本所在目录）
         if config_path is None:
@@ -71,6 +228,197 @@ class StageTestRunner:
         self.current_workflow = None
         self.context = {}  # 存储阶段间传递的数据
         self.user_input = user_input  # 自定义用户输入
+        self.sequential = sequential or not self.config['global'].get('parallel_stages', True)
+        self.timeout_multiplier = 1.0  # 由测试场景的 timeout_multiplier 设置
+        self._loop: Optional[asyncio.AbstractEventLoop] = None  # 整个运行期间共享的事件循环
+        self._stage_tasks: Dict[str, weakref.WeakSet] = {}    # 阶段 -> 该阶段派生的任务
+        self._hard_kill_stages = set()                          # options.hard_kill 为 true 的阶段
+        self._worker_stats: Dict[str, Dict[str, Any]] = {}      # 阶段 -> 工作进程返回的资源统计
+
+        # 注入阶段函数的共享对象：函数签名声明了同名关键字参数时，以 getter(stage_config) 的返回值传入（None 不传）
+        self._api_guard: Optional[ApiGuard] = None
+        self._reference_cache: Optional[ReferenceImageCache] = None
+        self._background_removal: Optional[BackgroundRemovalService] = None
+        self.stage_services: Dict[str, Callable[[Dict], Any]] = {
+            'api_guard': self.get_api_guard,
+            'reference_cache': self.get_reference_cache,
+            'style_prefix': self.get_style_prefix,
+            'background_removal': self.get_background_removal,
+        }
+
+        # 只导入阶段需要的模块；重量级依赖在首次使用时才加载
+        self.function_modules = self.config['global'].get('function_modules') or {}
+        self.lazy_modules = self.config['global'].get('lazy_imports', list(DEFAULT_LAZY_MODULES)) or []
+        install_lazy_modules(self.lazy_modules)
+
+        # 阶段输出缓存
+        cache_config = self.config['global'].get('stage_cache', {})
+        self.use_cache = cache_config.get('enabled', False) if use_cache is None else use_cache
+        self.refresh_stages = set(refresh_stages or [])
+        cache_dir = cache_config.get('dir') or str(Path(self.config['global']['workspace_base']) / '.stage_cache')
+        self.stage_cache = StageCache(cache_dir)
+        self.incremental = incremental
+
+        # 跨工作空间共享的素材存储（按内容哈希去重，运行结束后收录工作空间素材）
+        store_config = self.config['global'].get('asset_store') or {}
+        self.asset_store = (AssetStore.from_config(store_config, self.config['global']['workspace_base'])
+                            if store_config.get('enabled', False) else None)
+
+        # 阶段快照（每个阶段成功后记录，--fork-from 从快照分叉新的工作空间）
+        self.snapshot_config = self.config['global'].get('workspace_snapshots') or {}
+
+        # Mock 图像服务器（首个 mock_api 阶段运行时启动，close() 时停止）
+        self.use_mock = use_mock and self.config['global'].get('mock', {}).get('enabled', True)
+        self._mock_server: Optional[MockImageServer] = None
+
+        # LLM 响应录制/回放（使用真实 API 时不回放，但仍可显式录制）
+        mock_config = self.config['global'].get('mock', {})
+        self.llm_mode = llm_mode or mock_config.get('llm_mode', 'replay')
+        if not self.use_mock and self.llm_mode in ('replay', 'strict'):
+            self.llm_mode = 'off'
+        self.llm_replay = LLMReplayStore(
+            mock_config.get('llm_responses', 'test/fixtures/mock_responses/'),
+            mode=self.llm_mode,
+            api_delay=mock_config.get('api_delay', 0.0),
+            functions=mock_config.get('llm_functions'),
+        )
+
+    def _get_loop(self) -> asyncio.AbstractEventLoop:
+        """获取运行器共享的事件循环（首次调用时创建）
+
+        所有阶段都在同一个事件循环上执行，aiohttp 会话、连接池以及各模块缓存的异步客户端
+        可以在阶段之间复用，而不会因为 asyncio.run 关闭事件循环而失效
+        """
+        if self._loop is None or self._loop.is_closed():
+            self._loop = asyncio.new_event_loop()
+            self._loop.set_task_factory(self._task_factory)
+            asyncio.set_event_loop(self._loop)
+        return self._loop
+
+    def _task_factory(self, loop, coro, **kwargs):
+        """任务工厂：记录每个任务所属的阶段"""
+        task = asyncio.Task(coro, loop=loop, **kwargs)
+        stage_key = _current_stage.get()
+        if stage_key:
+            self._stage_tasks.setdefault(stage_key, weakref.WeakSet()).add(task)
+        return task
+
+    def get_api_guard(self, stage_config: Optional[Dict] = None) -> ApiGuard:
+        """获取运行器共享的图像 API 限流/重试包装（按 global.api_guard 配置，重试预算在整个运行期间共享）
+
+        统计按当前阶段分别汇总，阶段结束后写入阶段结果的 api_stats
+        """
+        if self._api_guard is None:
+            self._api_guard = ApiGuard.from_config(self.config['global'].get('api_guard'),
+                                                   key_fn=_current_stage.get)
+        return self._api_guard
+
+    def get_reference_cache(self, stage_config: Optional[Dict] = None) -> ReferenceImageCache:
+        """获取运行器共享的参考图编码缓存（按 global.reference_cache 配置，跨阶段复用，参考图重新生成后按 mtime 失效）"""
+        if self._reference_cache is None:
+            self._reference_cache = ReferenceImageCache.from_config(self.config['global'].get('reference_cache'))
+        return self._reference_cache
+
+    def get_style_prefix(self, stage_config: Optional[Dict] = None) -> Optional[StylePrefixPlan]:
+        """按工作空间当前的 tasks.json 提取公共风格前缀（global.style_prefix），每个阶段单独构建以便分别统计
+
+        未启用或没有 tasks.json 时返回 None
+        """
+        config = self.config['global'].get('style_prefix') or {}
+        tasks_path = Path(self.workspace_dir) / "public" / "tasks.json"
+        if not config.get('enabled', False) or not tasks_path.exists():
+            return None
+        with open(tasks_path, 'r', encoding='utf-8') as f:
+            return StylePrefixPlan.from_config(json.load(f), config)
+
+    def get_background_removal(self, stage_config: Optional[Dict] = None) -> Optional[BackgroundRemovalService]:
+        """获取运行器共享的背景移除服务（global.background_removal），进程池在第一次提交图像时才启动
+
+        未启用、AUTO_REMOVE_BACKGROUND=false 或未安装 rembg 时返回 None
+        """
+        config = self.config['global'].get('background_removal') or {}
+        if not config.get('enabled', False) or os.environ.get('AUTO_REMOVE_BACKGROUND', '').lower() == 'false':
+            return None
+        if self._background_removal is None:
+            if importlib.util.find_spec('rembg') is None:
+                logger.warning("⚠ 未安装 rembg，不注入背景移除服务")
+                return None
+            self._background_removal = BackgroundRemovalService.from_config(config)
+        return self._background_removal
+
+    def _bind_services(self, func, stage_config: Dict, stage_key: str) -> Tuple[Any, Dict[str, Any]]:
+        """按阶段函数签名注入共享对象（stage_services），返回 (绑定了关键字参数的函数, 注入的对象)
+
+        只传入函数声明了的参数，未声明的函数原样返回；hard_kill 阶段在 spawn 工作进程中运行，
+        共享对象无法带入子进程，不注入（函数应为这些参数提供默认值）
+        """
+        try:
+            parameters = inspect.signature(func).parameters
+        except (TypeError, ValueError):
+            return func, {}
+        wanted = [name for name in self.stage_services if name in parameters]
+        if not wanted:
+            return func, {}
+        if stage_key in self._hard_kill_stages:
+            logger.warning(f"⚠ hard_kill 阶段在独立进程中运行，不注入 {', '.join(wanted)}")
+            return func, {}
+
+        services = {}
+        for name in wanted:
+            service = self.stage_services[name](stage_config)
+            if service is not None:
+                services[name] = service
+        if not services:
+            return func, {}
+        logger.info(f"   注入: {', '.join(services)}")
+        return partial(func, **services), services
+
+    def _ensure_mock_server(self, stage_config: Dict):
+        """为 options.mock_api 为 true 的阶段启动 Mock 图像服务器并导出环境变量
+
+        环境变量由 global.mock.image_api.env 配置（值中的 {url} 替换为服务器地址），
+        在同一进程内调用或 hard_kill 阶段的工作进程中（继承环境变量）创建的 API 客户端都会指向 Mock 服务器
+        """
+        if not self.use_mock or not stage_config.get('options', {}).get('mock_api'):
+            return
+        if self._mock_server is None:
+            mock_config = self.config['global'].get('mock', {})
+            self._mock_server = MockImageServer(MockServerConfig.from_config(mock_config)).start()
+            env = (mock_config.get('image_api') or {}).get('env') or {'GOOGLE_GEMINI_BASE_URL': '{url}'}
+            for name, value in env.items():
+                os.environ[name] = str(value).format(url=self._mock_server.base_url)
+                logger.info(f"   {name}={os.environ[name]}")
+
+    def close(self):
+        """关闭共享的事件循环和 Mock 图像服务器"""
+        if self._mock_server is not None:
+            self._mock_server.stop()
+            self._mock_server = None
+        self._api_guard = None
+        if self._background_removal is not None:
+            self._background_removal.close()
+            self._background_removal = None
+        if self._reference_cache is not None:
+            stats = self._reference_cache.stats
+            logger.info(f"参考图缓存: 命中 {stats['hits']} 次, 未命中 {stats['misses']} 次, 淘汰 {stats['evictions']} 次")
+            self._reference_cache = None
+
+        if self._loop is None or self._loop.is_closed():
+            return
+
+        loop = self._loop
+        try:
+            pending = [task for task in asyncio.all_tasks(loop) if not task.done()]
+            for task in pending:
+                task.cancel()
+            if pending:
+                loop.run_until_complete(asyncio.gather(*pending, return_exceptions=True))
+
+            loop.run_until_complete(loop.shutdown_asyncgens())
+            loop.run_until_complete(loop.shutdown_default_executor())
+        finally:
+            asyncio.set_event_loop(None)
+            loop.close()
 
     def _load_config(self) -> Dict:
         """加载配置文件"""
@@ -86,19 +434,32 @@ class StageTestRunner:
             logger.error(f"✗ 配置文件格式错误: {e}")
             sys.exit(1)
 
-    def _setup_workspace(self, workflow_name: str, custom_workspace: str = None) -> str:
+    def _setup_workspace(self, workflow_name: str, custom_workspace: str = None,
+                         fork_from: Optional[str] = None) -> str:
         """创建测试工作空间
 
         Args:
             workflow_name: 工作流名称
             custom_workspace: 自定义工作空间名称（可选）
+            fork_from: 分叉来源 "工作空间[@阶段]"（可选，新工作空间链接到该阶段的快照）
 
         Returns:
             工作空间路径
         """
         base_dir = Path(self.config['global']['workspace_base'])
 
-        if custom_workspace:
+        if fork_from:
+            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+            workspace = base_dir / (custom_workspace or f"{workflow_name}_{timestamp}")
+            source_name, stage = parse_fork_spec(fork_from)
+            source = Path(source_name) if Path(source_name).is_dir() else base_dir / source_name
+            fork = fork_workspace(str(source), str(workspace), stage,
+                                  link=self.snapshot_config.get('link', 'auto'))
+            self.context.update(fork['memory'])
+            links = ', '.join(f"{mode} {count}" for mode, count in fork['links'].items()) or '无文件'
+            logger.info(f"✓ 从 {source.name}@{stage or '当前状态'} 分叉工作空间: {workspace} "
+                        f"({fork['files']} 个文件, {links}, {fork['seconds'] * 1000:.0f}ms)")
+        elif custom_workspace:
             # 使用自定义工作空间名称
             workspace = base_dir / custom_workspace
             if workspace.exists():
@@ -131,22 +492,43 @@ class StageTestRunner:
     def _import_function(self, function_path: str):
         """动态导入函数"""
         try:
-            # 解析函数路径，例如 "text_generation_function.generate_game_design"
-            if '.' in function_path:
-                module_name, func_name = function_path.rsplit('.', 1)
-            else:
-                # 如果是内部函数，从 mcp_server 导入
-                module_name = "mcp_server"
-                func_name = function_path
-
-            # 导入模块
-            module = importlib.import_module(module_name)
-            func = getattr(module, func_name)
-            return func
+            return _resolve_function(function_path, self.function_modules)
         except (ImportError, AttributeError) as e:
             logger.error(f"✗ 无法导入函数 {function_path}: {e}")
             return None
 
+    def _get_stage_timeout(self, stage_config: Dict) -> Optional[float]:
+        """计算阶段超时时间（阶段 timeout × 场景 timeout_multiplier）"""
+        timeout = stage_config.get('timeout')
+        if not timeout:
+            return None
+        return float(timeout) * self.timeout_multiplier
+
+    def _collect_progress(self, stage_config: Dict) -> Dict[str, Any]:
+        """统计阶段超时前已完成的输出（例如已生成的图像数量）"""
+        output_config = stage_config.get('output', {})
+        output_type = output_config.get('type')
+        progress = {}
+
+        try:
+            if output_type == 'directory':
+                assets_dir = Path(self.workspace_dir) / output_config.get('path')
+                progress['completed'] = len(list(assets_dir.glob('*.png'))) if assets_dir.exists() else 0
+                for validation in output_config.get('validation', []):
+                    if validation.get('check') == 'image_count_matches':
+                        tasks_file = Path(self.workspace_dir) / validation.get('reference')
+                        if tasks_file.exists():
+                            with open(tasks_file, 'r', encoding='utf-8') as f:
+                                tasks = json.load(f)
+                            progress['expected'] = len(tasks) if isinstance(tasks, list) else 0
+            elif output_type == 'file':
+                file_path = Path(self.workspace_dir) / output_config.get('path')
+                progress['output_written'] = file_path.exists()
+        except Exception as e:
+            logger.debug(f"进度统计失败: {e}")
+
+        return progress
+
     def _prepare_input(self, stage_config: Dict, workflow_name: str) -> Any:
         """准备阶段输入"""
         input_config = stage_config.get('input', {})
@@ -199,132 +581,33 @@ class StageTestRunner:
 
         return None
 
-    def _validate_output(self, stage_config: Dict, stage_name: str) -> bool:
-        """验证阶段输出"""
-        output_config = stage_config.get('output', {})
-        validations = output_config.get('validation', [])
-
-        all_passed = True
+    def _validate_output(self, stage_config: Dict, stage_name: str) -> Tuple[bool, List[Dict]]:
+        """验证阶段输出
 
-        for validation in validations:
-            check_type = validation.get('check')
-            result = self._run_validation_check(check_type, validation, output_config)
+        所有检查共享同一个产物缓存，每个文件只读取/解析一次
 
-            if not result:
-                all_passed = False
-                message = validation.get('message', f'{check_type} 验证失败')
-                logger.error(f"  ✗ {message}")
+        Returns:
+            (是否全部通过, 每个检查的结果和耗时)
+        """
+        output_config = stage_config.get('output', {})
+        engine = ValidationEngine(self.workspace_dir, memory=self.context,
+                                  settings=self.config['global'].get('validators', {}))
+        all_passed, check_results = engine.run(output_config)
+
+        for check in check_results:
+            timing = f"({check['duration_ms']:.1f}ms)"
+            if check['status'] == 'passed':
+                logger.info(f"  ✓ {check['check']} 验证通过 {timing}")
+            elif check['status'] == 'unknown':
+                logger.error(f"  ✗ 未知的验证类型: {check['check']}")
             else:
-                logger.info(f"  ✓ {check_type} 验证通过")
+                logger.error(f"  ✗ {check['message']} {timing}")
 
         # 验证通过后，输出统计信息
         if all_passed:
             self._print_stats(stage_config, stage_name)
 
-        return all_passed
-
-    def _run_validation_check(self, check_type: str, validation: Dict, output_config: Dict) -> bool:
-        """运行单个验证检查"""
-        try:
-            if check_type == 'file_exists':
-                file_path = Path(self.workspace_dir) / output_config.get('path')
-                return file_path.exists()
-
-            elif check_type == 'file_not_empty':
-                file_path = Path(self.workspace_dir) / output_config.get('path')
-                return file_path.exists() and file_path.stat().st_size > 0
-
-            elif check_type == 'valid_json':
-                files = validation.get('files', [output_config.get('path')])
-                for file_rel_path in files:
-                    file_path = Path(self.workspace_dir) / file_rel_path
-                    if not file_path.exists():
-                        return False
-                    try:
-                        with open(file_path, 'r', encoding='utf-8') as f:
-                            json.load(f)
-                    except json.JSONDecodeError:
-                        return False
-                return True
-
-            elif check_type == 'is_array':
-                file_path = Path(self.workspace_dir) / output_config.get('path')
-                with open(file_path, 'r', encoding='utf-8') as f:
-                    data = json.load(f)
-                return isinstance(data, list)
-
-            elif check_type == 'array_not_empty':
-                file_path = Path(self.workspace_dir) / output_config.get('path')
-                with open(file_path, 'r', encoding='utf-8') as f:
-                    data = json.load(f)
-                return isinstance(data, list) and len(data) > 0
-
-            elif check_type == 'items_have_fields':
-                file_path = Path(self.workspace_dir) / output_config.get('path')
-                required_fields = validation.get('required_fields', [])
-                with open(file_path, 'r', encoding='utf-8') as f:
-                    data = json.load(f)
-                if not isinstance(data, list):
-                    return False
-                for item in data:
-                    if not all(field in item for field in required_fields):
-                        return False
-                return True
-
-            elif check_type == 'contains_keywords':
-                file_path = Path(self.workspace_dir) / output_config.get('path')
-                keywords = validation.get('keywords', [])
-                with open(file_path, 'r', encoding='utf-8') as f:
-                    content = f.read()
-                return any(keyword in content for keyword in keywords)
-
-            elif check_type == 'min_size':
-                file_path = Path(self.workspace_dir) / output_config.get('path')
-                min_size = validation.get('value', 0)
-                return file_path.stat().st_size >= min_size
-
-            elif check_type == 'directory_exists':
-                dir_path = Path(self.workspace_dir) / output_config.get('path')
-                return dir_path.exists() and dir_path.is_dir()
-
-            elif check_type == 'image_count_matches':
-                assets_dir = Path(self.workspace_dir) / output_config.get('path')
-                tasks_file = Path(self.workspace_dir) / validation.get('reference')
-
-                if not tasks_file.exists():
-                    return False
-
-                with open(tasks_file, 'r', encoding='utf-8') as f:
-                    tasks = json.load(f)
-
-                expected_count = len(tasks) if isinstance(tasks, list) else 0
-                actual_count = len(list(assets_dir.glob('*.png')))
-
-                # 排除 _originals 目录
-                actual_count -= len(list((assets_dir / '_originals').glob('*.png'))) if (assets_dir / '_originals').exists() else 0
-
-                return actual_count == expected_count
-
-            elif check_type == 'size_format_valid':
-                file_path = Path(self.workspace_dir) / output_config.get('path')
-                pattern = validation.get('pattern')
-                import re
-                with open(file_path, 'r', encoding='utf-8') as f:
-                    tasks = json.load(f)
-                for task in tasks:
-                    size = task.get('size', '')
-                    if not re.match(pattern, size):
-                        return False
-                return True
-
-            # 其他验证类型可以继续添加...
-            else:
-                logger.warning(f"⚠ 未知的验证类型: {check_type}")
-                return True  # 未知的验证默认通过
-
-        except Exception as e:
-            logger.error(f"  ✗ 验证检查异常 ({check_type}): {e}")
-            return False
+        return all_passed, check_results
 
     def _print_stats(self, stage_config: Dict, stage_name: str):
         """打印阶段统计信息"""
@@ -379,8 +662,229 @@ class StageTestRunner:
             # 统计信息打印失败不影响测试结果
             logger.debug(f"统计信息打印失败: {e}")
 
+    def _save_output(self, output_config: Dict, result: Any) -> Any:
+        """保存阶段输出
+
+        Returns:
+            实际保存的值（file 输出为写入的文本内容，memory 输出为变量值），用于写入阶段缓存
+        """
+        if output_config.get('type') == 'file':
+            output_path = Path(self.workspace_dir) / output_config.get('path')
+            output_path.parent.mkdir(parents=True, exist_ok=True)
+
+            # 如果结果是ToolResult格式
+            if isinstance(result, dict) and 'content' in result:
+                content = result['content'][0]['text']
+            else:
+                content = result
+
+            # 写临时文件再替换，不修改与阶段快照共享 inode 的旧文件
+            tmp_path = output_path.with_name(f".{output_path.name}.tmp")
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                f.write(content)
+            tmp_path.replace(output_path)
+            logger.info(f"✓ 输出已保存: {output_path}")
+            return content
+
+        elif output_config.get('type') == 'files':
+            for path in output_config.get('paths', []):
+                # 这里需要根据实际情况处理多文件输出
+                pass
+
+        elif output_config.get('type') == 'memory':
+            # 保存到context供后续阶段使用
+            var_name = output_config.get('variable')
+            self.context[var_name] = result
+            logger.info(f"✓ 结果已保存到内存: {var_name}")
+            return result
+
+        return None
+
+    async def _call_stage_function(self, func, function_path: str, args: tuple,
+                                   timeout: Optional[float], stage_key: str) -> Any:
+        """按函数类型调用阶段函数（协程直接在共享事件循环上等待，同步函数放到执行器中）"""
+        loop = asyncio.get_running_loop()
+        if inspect.iscoroutinefunction(func):
+            token = _current_stage.set(stage_key)
+            try:
+                return await self._run_coroutine_stage(stage_key, func(*args), timeout)
+            finally:
+                _current_stage.reset(token)
+        elif timeout and stage_key in self._hard_kill_stages:
+            # 显式要求强制终止的同步函数在 spawn 工作进程中运行，超时后结束进程（按函数的定义模块导入）
+            result, self._worker_stats[stage_key] = await loop.run_in_executor(
+                None, _run_in_killable_worker, f"{func.__module__}.{func.__name__}", args, timeout)
+            return result
+        elif timeout:
+            # 其余同步函数在本进程的守护线程中运行，内存中的修改保留在运行器进程；超时后线程无法中断
+            try:
+                return await asyncio.wait_for(_run_in_daemon_thread(func, args), timeout)
+            except asyncio.TimeoutError:
+                raise StageTimeoutError(f"阶段执行超时 ({timeout:.1f}s)，同步函数无法中断，将在后台线程中运行到结束"
+                                        f"（需要强制终止时设置 options.hard_kill: true）")
+        else:
+            return await loop.run_in_executor(None, partial(func, *args))
+
+    async def _call_llm_stage(self, func, function_path: str, input_data: Any,
+                              timeout: Optional[float], stage_key: str) -> Tuple[Any, str]:
+        """通过录制/回放层调用文本生成阶段
+
+        Returns:
+            (阶段结果, 回放状态: replayed / recorded / live)
+        """
+        store = self.llm_replay
+        if store.mode != 'record':
+            entry = store.load(function_path, input_data)
+            if entry is not None:
+                if store.api_delay:
+                    await asyncio.sleep(store.api_delay)
+                logger.info(f"📼 回放录制的 LLM 响应 ({entry['key'][:12]}, 录制于 {entry.get('recorded_at')})")
+                return entry['response'], 'replayed'
+            if store.mode == 'strict':
+                raise LLMReplayMissError(
+                    f"strict 模式下未找到录制的响应: {function_path} ({store.compute_key(function_path, input_data)[:12]})")
+
+        result = await self._call_stage_function(func, function_path, (input_data,), timeout, stage_key)
+        if store.record(function_path, input_data, result):
+            logger.info(f"📼 已录制 LLM 响应: {function_path}")
+            return result, 'recorded'
+        return result, 'live'
+
+    async def _run_asset_stage(self, func, function_path: str, timeout: Optional[float], stage_key: str,
+                               output_config: Dict, incremental: bool) -> Any:
+        """运行图像生成阶段，并维护 public/ 下的素材清单
+
+        增量模式下只为清单判定为脏的素材（及其 yield_from 下游素材）生成图像：
+        在临时影子工作空间中写入只包含这些任务的 tasks.json，并链接其余已有图像作为参考图，
+        生成完成后再把新图像移回工作空间
+        """
+        tasks_path = Path(self.workspace_dir) / "public" / "tasks.json"
+        assets_dir = output_config.get('path', 'public/assets/')
+        manifest = AssetManifest(self.workspace_dir, assets_dir).load()
+
+        if not incremental or not tasks_path.exists():
+            # 只记录本次运行写入的图像：部分失败或超时后，之前运行留下的旧图像不能被记为最新
+            before = manifest.stamps()
+            try:
+                return await self._call_stage_function(func, function_path, (self.workspace_dir,), timeout, stage_key)
+            finally:
+                if tasks_path.exists():
+                    with open(tasks_path, 'r', encoding='utf-8') as f:
+                        manifest.update(json.load(f), names=manifest.written_since(before))
+                    manifest.save()
+
+        with open(tasks_path, 'r', encoding='utf-8') as f:
+            tasks = json.load(f)
+
+        dirty = manifest.find_dirty(tasks)
+        if not dirty:
+            logger.info(f"♻️  增量模式: {len(tasks)} 个素材均为最新，跳过图像生成")
+            return "所有素材均为最新"
+
+        logger.info(f"🔁 增量模式: {len(dirty)}/{len(tasks)} 个素材需要重新生成")
+        for name in dirty:
+            logger.info(f"  - {name}")
+
+        dirty_set = set(dirty)
+        assets_path = manifest.assets_path
+        shadow = Path(tempfile.mkdtemp(prefix='.incremental_', dir=self.workspace_dir))
+        shadow_assets = shadow / assets_dir
+        moved = set()
+        try:
+            shadow_assets.mkdir(parents=True)
+            (shadow / "doc").mkdir()
+            with open(shadow / "public" / "tasks.json", 'w', encoding='utf-8') as f:
+                json.dump([task for task in tasks if task.get('name') in dirty_set], f, ensure_ascii=False, indent=4)
+
+            # 未变化的素材作为参考图提供给下游素材
+            for image in assets_path.glob('*.png'):
+                if image.name not in dirty_set:
+                    _link_or_copy(image, shadow_assets / image.name)
+
+            return await self._call_stage_function(func, function_path, (str(shadow),), timeout, stage_key)
+        finally:
+            # 无论成功、失败还是超时，都把已生成的图像移回工作空间
+            for name in dirty:
+                generated = shadow_assets / name
+                if generated.exists():
+                    generated.replace(assets_path / name)
+                    moved.add(name)
+                original = shadow_assets / "_originals" / name
+                if original.exists():
+                    (assets_path / "_originals").mkdir(exist_ok=True)
+                    original.replace(assets_path / "_originals" / name)
+            shutil.rmtree(shadow, ignore_errors=True)
+
+            manifest.update(tasks, names=moved)
+            manifest.save()
+            logger.info(f"✓ 素材清单已更新: {len(moved)}/{len(dirty)} 个素材重新生成")
+
     def run_stage(self, workflow_name: str, stage_name: str) -> Dict:
         """运行单个阶段"""
+        return self._get_loop().run_until_complete(self.run_stage_async(workflow_name, stage_name))
+
+    async def _run_coroutine_stage(self, stage_key: str, coro, timeout: Optional[float]):
+        """在共享事件循环上等待协程阶段，超时后取消该阶段派生的所有任务"""
+        try:
+            return await asyncio.wait_for(coro, timeout)
+        except asyncio.TimeoutError:
+            current = asyncio.current_task()
+            pending = [task for task in self._stage_tasks.get(stage_key, ())
+                       if task is not current and not task.done()]
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+            raise StageTimeoutError(f"阶段执行超时 ({timeout:.1f}s)，已取消 {len(pending)} 个进行中的任务")
+        finally:
+            self._stage_tasks.pop(stage_key, None)
+
+    @staticmethod
+    def _output_patterns(stage_config: Dict) -> List[str]:
+        """阶段声明的输出文件（相对于工作空间的 glob，目录以 / 结尾；{asset_name} 等占位符视为 *）"""
+        output_config = stage_config.get('output') or {}
+        if output_config.get('type') == 'memory':
+            return []
+        paths = output_config.get('paths') or ([output_config['path']] if output_config.get('path') else [])
+        patterns = []
+        for path in paths:
+            pattern = re.sub(r'\{[^}]*\}', '*', str(path))
+            if output_config.get('type') == 'directory' and not pattern.endswith('/'):
+                pattern += '/'
+            patterns.append(pattern)
+        return patterns
+
+    def _snapshot_exclude(self, graph: StageGraph, stages_config: Dict, stage_name: str,
+                          unfinished: Set[str]) -> List[str]:
+        """并发运行中记录 stage_name 的快照时要排除的文件：尚未完成的其他阶段声明的输出
+
+        这些阶段可能正在写入，它们的输出也不属于 stage_name 完成时的状态；
+        stage_name 及其上游阶段自己声明的输出始终保留
+        """
+        own = set()
+        for name in graph.ancestors(stage_name) | {stage_name}:
+            own.update(self._output_patterns(stages_config.get(name, {})))
+        exclude = []
+        for name in graph.stages:
+            if name in unfinished and name != stage_name:
+                exclude.extend(p for p in self._output_patterns(stages_config.get(name, {}))
+                               if p not in own and p not in exclude)
+        return exclude
+
+    async def _record_snapshot(self, workflow_name: str, stage_name: str, memory: Dict[str, Any],
+                               exclude: Optional[List[str]] = None) -> Dict[str, Any]:
+        """记录阶段快照（供 --fork-from 分叉），exclude 中的文件不放入快照"""
+        snapshots = WorkspaceSnapshots(self.workspace_dir, self.snapshot_config.get('link', 'auto'))
+        snapshot = await asyncio.get_running_loop().run_in_executor(
+            None, partial(snapshots.record, stage_name, workflow_name, memory, exclude))
+        logger.debug(f"阶段快照: {stage_name} {snapshot}")
+        return snapshot
+
+    async def run_stage_async(self, workflow_name: str, stage_name: str, snapshot: bool = True) -> Dict:
+        """在共享事件循环上运行单个阶段
+
+        Args:
+            snapshot: 验证通过后立即记录阶段快照；并发调度时为 False，由调度器排除其他未完成阶段的输出后记录
+        """
         logger.info(f"\n{'='*60}")
         logger.info(f"开始阶段: {workflow_name} -> {stage_name}")
         logger.info(f"{'='*60}")
@@ -408,65 +912,92 @@ class StageTestRunner:
             logger.info(f"📥 准备输入...")
             input_data = self._prepare_input(stage_config, workflow_name)
 
-            # 2. 执行函数
-            logger.info(f"⚙️  执行: {stage_config.get('function')}...")
-            func = self._import_function(stage_config.get('function'))
-
-            if not func:
-                stage_result['error'] = "函数导入失败"
-                return stage_result
-
-            # 根据函数类型调用
-            # 这里需要根据实际函数签名调整
-            if stage_config.get('function') == '_generate_game_asset_internal':
-                result = func(self.workspace_dir)
-            elif stage_config.get('function') in ['text_generation_function.generate_game_design',
-                                                    'text_generation_function.generate_assets_json',
-                                                    'text_generation_function.generate_assets_doc']:
-                # 检查函数是否是协程函数
-                if inspect.iscoroutinefunction(func):
-                    result = asyncio.run(func(input_data))
-                else:
-                    result = func(input_data)
-            else:
-                # 通用调用
-                if inspect.iscoroutinefunction(func):
-                    result = asyncio.run(func(input_data))
-                else:
-                    result = func(input_data)
-
-            logger.info(f"✓ 函数执行完成")
-
-            # 3. 保存输出
             output_config = stage_config.get('output', {})
-            if output_config.get('type') == 'file':
-                output_path = Path(self.workspace_dir) / output_config.get('path')
-                output_path.parent.mkdir(parents=True, exist_ok=True)
 
-                # 如果结果是ToolResult格式
-                if isinstance(result, dict) and 'content' in result:
-                    content = result['content'][0]['text']
-                else:
-                    content = result
+            # 2. 查询阶段缓存
+            cache_key = None
+            if self.use_cache:
+                cache_key = self.stage_cache.compute_key(stage_config, input_data, self.workspace_dir)
 
-                with open(output_path, 'w', encoding='utf-8') as f:
-                    f.write(content)
-                logger.info(f"✓ 输出已保存: {output_path}")
+            cached = None
+            if cache_key and stage_name not in self.refresh_stages:
+                cached = self.stage_cache.load(cache_key)
 
-            elif output_config.get('type') == 'files':
-                for path in output_config.get('paths', []):
-                    # 这里需要根据实际情况处理多文件输出
-                    pass
-
-            elif output_config.get('type') == 'memory':
-                # 保存到context供后续阶段使用
-                var_name = output_config.get('variable')
-                self.context[var_name] = result
-                logger.info(f"✓ 结果已保存到内存: {var_name}")
+            if cached is not None:
+                logger.warning(f"♻️  命中阶段缓存 ({cache_key[:12]})，未调用函数，恢复上次的输出")
+                self._save_output(output_config, cached['value'])
+                stage_result['cached'] = True
+            else:
+                # 3. 执行函数
+                logger.info(f"⚙️  执行: {stage_config.get('function')}...")
+                func = self._import_function(stage_config.get('function'))
+
+                if not func:
+                    stage_result['error'] = "函数导入失败"
+                    return stage_result
+
+                # 根据函数类型调用
+                # 这里需要根据实际函数签名调整
+                function_path = stage_config.get('function')
+                timeout = self._get_stage_timeout(stage_config)
+                self._ensure_mock_server(stage_config)
+                stage_key = f"{workflow_name}:{stage_name}"
+                deadline = time.monotonic() + timeout if timeout else None
+                if stage_config.get('options', {}).get('hard_kill'):
+                    self._hard_kill_stages.add(stage_key)
+                func, services = self._bind_services(func, stage_config, stage_key)
+                if function_path == '_generate_game_asset_internal':
+                    incremental = self.incremental or stage_config.get('options', {}).get('incremental', False)
+                    result = await self._run_asset_stage(func, function_path, timeout, stage_key,
+                                                         output_config, incremental)
+                elif self.llm_replay.handles(function_path):
+                    result, stage_result['llm_replay'] = await self._call_llm_stage(
+                        func, function_path, input_data, timeout, stage_key)
+                else:
+                    result = await self._call_stage_function(func, function_path, (input_data,),
+                                                             timeout, stage_key)
+
+                logger.info(f"✓ 函数执行完成")
+                worker = self._worker_stats.pop(stage_key, None)
+                if worker:
+                    stage_result['worker'] = worker
+                    logger.info(f"   工作进程: pid {worker['pid']}, 耗时 {worker['seconds']:.1f}s, "
+                                f"峰值内存 {worker['peak_rss_mb']:.0f}MB")
+                background_removal = services.get('background_removal')
+                if background_removal is not None:
+                    # 等待本阶段提交的抠图完成再验证输出，只使用阶段超时的剩余预算
+                    stats = stage_result['background_removal'] = await asyncio.get_running_loop().run_in_executor(
+                        None, partial(background_removal.drain, deadline=deadline))
+                    if stats['submitted']:
+                        logger.info(f"   背景移除: {stats['completed']}/{stats['submitted']} 张, 失败 {stats['failed']} 张, "
+                                    f"未完成 {stats['pending']} 张, 工作进程耗时 {stats['busy_seconds']:.1f}s")
+                prefix_plan = services.get('style_prefix')
+                if prefix_plan is not None and prefix_plan.stats['requests']:
+                    stats = stage_result['style_prefix'] = prefix_plan.summary()
+                    logger.info(f"   风格前缀: {stats['prefixes']} 个公共前缀, 发送 {stats['bytes_sent']} 字节, "
+                                f"前缀约 {stats['prefix_tokens']} tokens（可命中缓存 {stats['prefix_tokens_cacheable']}）")
+                api_stats = self._api_guard.stats_for(stage_key) if self._api_guard else None
+                if api_stats:
+                    stage_result['api_stats'] = api_stats
+                    logger.info(f"   API 调用: {api_stats['calls']} 次, 重试 {api_stats['retries']} 次, "
+                                f"失败 {api_stats['failed']} 次, 浪费 {api_stats['wasted_seconds']:.1f}s")
+
+                # 保存输出
+                saved_value = self._save_output(output_config, result)
 
             # 4. 验证输出
             logger.info(f"🔍 验证输出...")
-            validation_passed = self._validate_output(stage_config, stage_name)
+            validation_passed, stage_result['checks'] = await asyncio.get_running_loop().run_in_executor(
+                None, self._validate_output, stage_config, stage_name)
+
+            # 5. 验证通过后写入缓存
+            if validation_passed and cache_key and cached is None:
+                if self.stage_cache.store(cache_key, stage_config, saved_value):
+                    logger.debug(f"阶段输出已缓存: {cache_key[:12]}")
+
+            # 6. 记录阶段快照（供 --fork-from 分叉）
+            if validation_passed and snapshot and self.snapshot_config.get('enabled', True):
+                stage_result['snapshot'] = await self._record_snapshot(workflow_name, stage_name, dict(self.context))
 
             stage_result['success'] = validation_passed
             stage_result['end_time'] = datetime.now()
@@ -477,6 +1008,16 @@ class StageTestRunner:
             else:
                 logger.error(f"❌ 阶段失败: {stage_name}")
 
+        except StageTimeoutError as e:
+            stage_result['error'] = str(e)
+            stage_result['timed_out'] = True
+            stage_result['progress'] = self._collect_progress(stage_config)
+            stage_result['end_time'] = datetime.now()
+            stage_result['duration'] = (stage_result['end_time'] - stage_result['start_time']).total_seconds()
+            logger.error(f"⏱ 阶段超时: {stage_name} - {e}")
+            if stage_result['progress']:
+                logger.error(f"   已完成进度: {stage_result['progress']}")
+
         except Exception as e:
             import traceback
             stage_result['error'] = str(e)
@@ -487,8 +1028,32 @@ class StageTestRunner:
 
         return stage_result
 
+    def report_import_profile(self, workflow_name: str, stages: Optional[List[str]] = None) -> Dict[str, Any]:
+        """在子进程中以 -X importtime 导入工作流（或指定阶段）函数所在的模块，输出最慢的导入
+
+        延迟导入配置（global.lazy_imports）同样生效，可用于确认重量级依赖没有在导入时加载
+        """
+        workflow_config = self.config['workflows'].get(workflow_name)
+        if not workflow_config:
+            logger.error(f"✗ 工作流不存在: {workflow_name}")
+            return {}
+
+        modules = []
+        for stage_name, stage_config in workflow_config['stages'].items():
+            if stages and stage_name not in stages or not stage_config.get('function'):
+                continue
+            module_name, _ = _function_module(stage_config['function'], self.function_modules)
+            if module_name not in modules:
+                modules.append(module_name)
+
+        profile = profile_imports(modules, self.lazy_modules, sys_path=[str(project_root)])
+        for line in format_import_profile(profile):
+            logger.info(line)
+        return profile
+
     def run_workflow(self, workflow_name: str, stages: Optional[List[str]] = None,
-                     from_stage: Optional[str] = None, workspace: Optional[str] = None) -> List[Dict]:
+                     from_stage: Optional[str] = None, workspace: Optional[str] = None,
+                     fork_from: Optional[str] = None) -> List[Dict]:
         """运行完整工作流或指定阶段
 
         Args:
@@ -496,6 +1061,8 @@ class StageTestRunner:
             stages: 要运行的阶段列表
             from_stage: 起始阶段
             workspace: 自定义工作空间名称（可选）
+            fork_from: 从 "工作空间[@阶段]" 分叉新的工作空间（可选）；
+                未指定 stages/from_stage 时从分叉阶段的下一个阶段开始运行
 
         Returns:
             测试结果列表
@@ -505,7 +1072,12 @@ class StageTestRunner:
         logger.info(f"{'#'*60}\n")
 
         # 设置工作空间
-        self.workspace_dir = self._setup_workspace(workflow_name, custom_workspace=workspace)
+        try:
+            self.workspace_dir = self._setup_workspace(workflow_name, custom_workspace=workspace,
+                                                       fork_from=fork_from)
+        except (FileNotFoundError, FileExistsError, ValueError, OSError) as e:
+            logger.error(f"✗ 工作空间分叉失败: {e}")
+            return []
         self.current_workflow = workflow_name
 
         workflow_config = self.config['workflows'].get(workflow_name)
@@ -516,9 +1088,14 @@ class StageTestRunner:
         # 确定要运行的阶段
         all_stages = list(workflow_config['stages'].keys())
 
+        fork_stage = parse_fork_spec(fork_from)[1] if fork_from else None
+
         if stages:
             # 用户指定了阶段列表
             stages_to_run = stages
+        elif fork_stage in all_stages and not from_stage:
+            # 从分叉阶段之后继续运行
+            stages_to_run = all_stages[all_stages.index(fork_stage) + 1:]
         elif from_stage:
             # 从指定阶段开始运行到结束
             if from_stage in all_stages:
@@ -531,12 +1108,60 @@ class StageTestRunner:
             # 运行所有阶段
             stages_to_run = all_stages
 
+        if not stages:
+            # optional: true 的阶段（例如图集打包）只在 --stage 显式指定时运行
+            optional = [name for name in stages_to_run if workflow_config['stages'][name].get('optional')]
+            if optional:
+                logger.info(f"跳过可选阶段: {', '.join(optional)}（用 --stage 显式指定运行）")
+                stages_to_run = [name for name in stages_to_run if name not in optional]
+
         logger.info(f"将运行以下阶段: {', '.join(stages_to_run)}\n")
 
-        # 逐个运行阶段
+        if self.sequential:
+            runner_coro = self._run_stages_sequential(workflow_name, stages_to_run)
+        else:
+            runner_coro = self._run_stages_parallel(workflow_name, stages_to_run)
+        results = self._get_loop().run_until_complete(runner_coro)
+        write_run_status(self.workspace_dir, workflow_name, results)
+        self._store_workspace_assets()
+
+        # 打印总结
+        self._print_summary(results)
+
+        # 清理工作空间（可选）
+        if not self.config['global'].get('cleanup_after_test', False):
+            logger.info(f"\n💾 工作空间保留: {self.workspace_dir}")
+
+        return results
+
+    def _store_workspace_assets(self):
+        """把工作空间素材收录到共享素材存储"""
+        if self.asset_store is None or not self.workspace_dir:
+            return
+        stats = self.asset_store.ingest_workspace(self.workspace_dir)
+        logger.info(f"📦 素材存储: {stats['files']} 个文件, 新对象 {stats['new_objects']}, "
+                    f"reflink {stats['linked']}, 未收录 {stats['skipped']}, 去重 {stats['bytes_deduplicated'] / 1024:.1f}KB")
+
+    def collect_workspaces(self, dry_run: bool = False) -> Dict[str, Any]:
+        """按 global.workspace_gc 回收 workspace_base 下的工作空间，再回收共享素材存储中不再被引用的对象"""
+        gc = WorkspaceGC.from_config(self.config['global'].get('workspace_gc'),
+                                     self.config['global']['workspace_base'])
+        result = gc.collect(dry_run=dry_run)
+        logger.info(f"🧹 工作空间回收: 扫描 {result['scanned']} 个, 共 {result['total_bytes'] / 1024 / 1024:.1f}MB, "
+                    f"回收 {len(result['removed'])} 个, {result['bytes_freed'] / 1024 / 1024:.1f}MB "
+                    f"({result['seconds']:.2f}s)")
+        if self.asset_store is not None and result['removed'] and not dry_run:
+            stats = self.asset_store.prune()
+            if stats['objects_removed']:
+                logger.info(f"🗑  素材存储回收: {stats['objects_removed']} 个对象, "
+                            f"{stats['bytes_freed'] / 1024 / 1024:.1f}MB")
+        return result
+
+    async def _run_stages_sequential(self, workflow_name: str, stages_to_run: List[str]) -> List[Dict]:
+        """按顺序逐个运行阶段"""
         results = []
         for stage_name in stages_to_run:
-            result = self.run_stage(workflow_name, stage_name)
+            result = await self.run_stage_async(workflow_name, stage_name)
             results.append(result)
 
             # 如果阶段失败且配置了停止，则中断
@@ -544,14 +1169,88 @@ class StageTestRunner:
                 logger.warning(f"⚠ 阶段失败，停止后续阶段")
                 break
 
-        # 打印总结
-        self._print_summary(results)
+        return results
 
-        # 清理工作空间（可选）
-        if not self.config['global'].get('cleanup_after_test', False):
-            logger.info(f"\n💾 工作空间保留: {self.workspace_dir}")
+    async def _run_stages_parallel(self, workflow_name: str, stages_to_run: List[str]) -> List[Dict]:
+        """按 dependencies 构建的阶段DAG并发运行互不依赖的阶段
 
-        return results
+        stop_on_error 时只取消失败阶段的下游阶段，其他分支继续运行。
+        启用阶段快照时，阶段完成后立即在执行器中记录快照，不阻塞其他已就绪的阶段：
+        快照排除其他尚未完成阶段声明的输出（可能写了一半），只有该阶段的下游阶段等快照记录完成后才启动，
+        不会在记录期间改写它的输出
+        """
+        stages_config = self.config['workflows'][workflow_name]['stages']
+        try:
+            graph = StageGraph(stages_config, stages_to_run)
+        except ValueError as e:
+            logger.error(f"✗ {e}")
+            return []
+
+        stop_on_error = self.config['global'].get('stop_on_error', True)
+        max_parallel = self.config['global'].get('max_parallel_stages', 4)
+
+        snapshots_enabled = self.snapshot_config.get('enabled', True)
+
+        results_by_stage: Dict[str, Dict] = {}
+        done, started, cancelled = set(), set(), set()
+        running = {}
+        snapshotting = {}  # 快照任务 -> (阶段名, 阶段结果)；阶段在快照记录完成后才算完成
+
+        while True:
+            for stage_name in graph.ready(done, started):
+                if len(running) >= max_parallel:
+                    break
+                started.add(stage_name)
+                task = asyncio.ensure_future(self.run_stage_async(workflow_name, stage_name, snapshot=False))
+                running[task] = stage_name
+
+            if not running and not snapshotting:
+                break
+
+            finished, _ = await asyncio.wait([*running, *snapshotting], return_when=asyncio.FIRST_COMPLETED)
+            for task in finished:
+                if task in snapshotting:
+                    stage_name, result = snapshotting.pop(task)
+                    try:
+                        result['snapshot'] = task.result()
+                    except Exception as e:
+                        logger.warning(f"⚠ 阶段快照记录失败: {stage_name} ({e})")
+                    done.add(stage_name)
+                    continue
+
+                stage_name = running.pop(task)
+                result = task.result()
+                results_by_stage[stage_name] = result
+                if result['success'] and snapshots_enabled:
+                    snapshot_pending = {name for name, _ in snapshotting.values()}
+                    unfinished = set(graph.stages) - done - snapshot_pending - cancelled
+                    exclude = self._snapshot_exclude(graph, stages_config, stage_name, unfinished)
+                    snapshot = asyncio.ensure_future(
+                        self._record_snapshot(workflow_name, stage_name, dict(self.context), exclude))
+                    snapshotting[snapshot] = (stage_name, result)
+                else:
+                    done.add(stage_name)
+
+                if not result['success'] and stop_on_error:
+                    skipped = graph.descendants(stage_name) - started
+                    if skipped:
+                        logger.warning(f"⚠ 阶段 {stage_name} 失败，取消下游阶段: {', '.join(sorted(skipped))}")
+                    for child in skipped:
+                        started.add(child)
+                        cancelled.add(child)
+
+        for stage_name in cancelled:
+            stage_config = stages_config.get(stage_name, {})
+            results_by_stage[stage_name] = {
+                "stage": stage_name,
+                "name": stage_config.get('name'),
+                "success": False,
+                "skipped": True,
+                "error": "上游阶段失败，已跳过",
+            }
+
+        # 按用户给定的阶段顺序输出结果
+        return [results_by_stage[name] for name in stages_to_run if name in results_by_stage]
 
     def _print_summary(self, results: List[Dict]):
         """打印测试总结"""
@@ -561,22 +1260,52 @@ class StageTestRunner:
 
         total = len(results)
         success = sum(1 for r in results if r['success'])
-        failed = total - success
+        skipped = sum(1 for r in results if r.get('skipped'))
+        failed = total - success - skipped
 
         for result in results:
-            status = "✅" if result['success'] else "❌"
+            if result.get('skipped'):
+                status = "⏭"
+            else:
+                status = "✅" if result['success'] else "❌"
             duration = result.get('duration', 0)
-            logger.info(f"{status} {result['stage']}: {result['name']} ({duration:.2f}s)")
+            cached = " [缓存: 未调用函数]" if result.get('cached') else (" [回放]" if result.get('llm_replay') == 'replayed' else "")
+            logger.info(f"{status} {result['stage']}: {result['name']} ({duration:.2f}s){cached}")
             if result.get('error'):
                 logger.info(f"   错误: {result['error']}")
+            if result.get('progress'):
+                logger.info(f"   超时前进度: {result['progress']}")
+            if result.get('api_stats', {}).get('retries'):
+                stats = result['api_stats']
+                logger.info(f"   API 重试: {stats['retries']} 次, 浪费 {stats['wasted_seconds']:.1f}s")
+            if result.get('style_prefix', {}).get('prefix_tokens_cacheable'):
+                stats = result['style_prefix']
+                logger.info(f"   风格前缀: 可命中缓存约 {stats['prefix_tokens_cacheable']} tokens, "
+                            f"按原价计费约 {stats['prefix_tokens_billed']} tokens")
 
         logger.info(f"\n总计: {total} 个阶段")
         logger.info(f"成功: {success} 个")
         logger.info(f"失败: {failed} 个")
+        if skipped:
+            logger.info(f"跳过: {skipped} 个")
         logger.info(f"成功率: {success/total*100:.1f}%")
+        self._warn_cached(results)
+
+    @staticmethod
+    def _warn_cached(results: List[Dict]):
+        """输出来自阶段缓存的阶段没有调用函数，在总结末尾明确提示"""
+        from_cache = [result['stage'] for result in results if result.get('cached')]
+        if from_cache:
+            logger.warning(f"⚠ {len(from_cache)} 个阶段的输出来自阶段缓存，函数未被调用（未测试）: {', '.join(from_cache)}；"
+                           f"使用 --no-cache 或 --refresh-stage 重新运行")
 
-    def run_scenario(self, scenario_name: str):
-        """运行预设测试场景"""
+    def run_scenario(self, scenario_name: str, jobs: int = 1):
+        """运行预设测试场景
+
+        Args:
+            scenario_name: 场景名称
+            jobs: 并行工作进程数，大于1时每个工作流在独立进程和独立工作空间中运行
+        """
         logger.info(f"\n🎬 运行测试场景: {scenario_name}")
 
         scenario_config = self.config['test_scenarios'].get(scenario_name)
@@ -586,12 +1315,119 @@ class StageTestRunner:
 
         workflows = scenario_config.get('workflows', [])
         stages = scenario_config.get('stages')
+        self.timeout_multiplier = scenario_config.get('timeout_multiplier', 1.0)
+        self.use_mock = self.use_mock and scenario_config.get('mock', True)
+        if not self.use_mock and self.llm_replay.mode in ('replay', 'strict'):
+            self.llm_mode = self.llm_replay.mode = 'off'
+        if stages == 'all':
+            stages = None
+
+        if jobs > 1 and len(workflows) > 1:
+            self._run_scenario_parallel(workflows, stages, jobs)
+            return
 
         for workflow in workflows:
-            if stages == 'all':
-                self.run_workflow(workflow)
-            else:
-                self.run_workflow(workflow, stages=stages)
+            self.run_workflow(workflow, stages=stages)
+
+    def _runner_kwargs(self) -> Dict:
+        """返回在工作进程中重建运行器所需的参数"""
+        return {
+            "config_path": self.config_path,
+            "user_input": self.user_input,
+            "sequential": self.sequential,
+            "use_cache": self.use_cache,
+            "refresh_stages": sorted(self.refresh_stages),
+            "incremental": self.incremental,
+            "use_mock": self.use_mock,
+            "llm_mode": self.llm_mode,
+        }
+
+    def _run_scenario_parallel(self, workflows: List[str], stages: Optional[List[str]], jobs: int):
+        """在进程池中并行运行多个工作流，并合并输出总结"""
+        max_workers = min(jobs, len(workflows))
+        logger.info(f"🚀 使用 {max_workers} 个工作进程并行运行 {len(workflows)} 个工作流")
+
+        start = time.perf_counter()
+        reports = []
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            futures = {
+                executor.submit(_run_workflow_worker, self._runner_kwargs(),
+                                self.timeout_multiplier, workflow, stages): workflow
+                for workflow in workflows
+            }
+            for future in as_completed(futures):
+                workflow = futures[future]
+                try:
+                    report = future.result()
+                except Exception as e:
+                    logger.error(f"✗ 工作进程异常 ({workflow}): {e}")
+                    report = {"workflow": workflow, "pid": None, "workspace": None,
+                              "duration": 0, "results": [], "error": str(e)}
+                reports.append(report)
+
+        # 按场景中的工作流顺序输出
+        reports.sort(key=lambda r: workflows.index(r['workflow']))
+        self._print_merged_summary(reports, time.perf_counter() - start)
+
+    def _print_merged_summary(self, reports: List[Dict], wall_time: float):
+        """打印多个工作进程的合并测试总结"""
+        logger.info(f"\n{'='*60}")
+        logger.info("合并测试总结")
+        logger.info(f"{'='*60}")
+
+        merged = []
+        for report in reports:
+            logger.info(f"\n[{report['workflow']}] 进程 {report['pid']} ({report['duration']:.2f}s)")
+            if report.get('error'):
+                logger.info(f"   错误: {report['error']}")
+            if report.get('workspace'):
+                logger.info(f"   工作空间: {report['workspace']}")
+            for result in report['results']:
+                if result.get('skipped'):
+                    status = "⏭"
+                else:
+                    status = "✅" if result['success'] else "❌"
+                duration = result.get('duration', 0)
+                cached = " [缓存: 未调用函数]" if result.get('cached') else (" [回放]" if result.get('llm_replay') == 'replayed' else "")
+                logger.info(f"{status} {result['stage']}: {result['name']} ({duration:.2f}s){cached}")
+                if result.get('error'):
+                    logger.info(f"   错误: {result['error']}")
+            merged.extend(report['results'])
+
+        total = len(merged)
+        success = sum(1 for r in merged if r['success'])
+        skipped = sum(1 for r in merged if r.get('skipped'))
+        failed = total - success - skipped
+        serial_time = sum(report['duration'] for report in reports)
+
+        logger.info(f"\n总计: {len(reports)} 个工作流, {total} 个阶段")
+        logger.info(f"成功: {success} 个")
+        logger.info(f"失败: {failed} 个")
+        if skipped:
+            logger.info(f"跳过: {skipped} 个")
+        if total:
+            logger.info(f"成功率: {success/total*100:.1f}%")
+        self._warn_cached(merged)
+        logger.info(f"总耗时: {wall_time:.2f}s（各工作流耗时之和: {serial_time:.2f}s）")
+
+
+def _run_workflow_worker(runner_kwargs: Dict, timeout_multiplier: float,
+                         workflow: str, stages: Optional[List[str]]) -> Dict:
+    """工作进程入口：在独立的运行器和工作空间中运行单个工作流"""
+    start = time.perf_counter()
+    runner = StageTestRunner(**runner_kwargs)
+    runner.timeout_multiplier = timeout_multiplier
+    try:
+        results = runner.run_workflow(workflow, stages=stages)
+    finally:
+        runner.close()
+    return {
+        "workflow": workflow,
+        "pid": os.getpid(),
+        "workspace": runner.workspace_dir,
+        "duration": time.perf_counter() - start,
+        "results": results,
+    }
 
 
 def main():
@@ -606,14 +1442,35 @@ def main():
                         help='从指定阶段开始测试到结束')
     parser.add_argument('--workspace', type=str, default=None,
                         help='指定工作空间名称（用于复用已有工作空间，例如: my_test）')
+    parser.add_argument('--fork-from', type=str, default=None,
+                        help='从已有工作空间的阶段快照分叉新的工作空间（例如: my_test@stage2），'
+                             '新工作空间由 --workspace 指定，默认带时间戳')
     parser.add_argument('--user-input', '-u', type=str, default=None,
                         help='自定义用户输入（用于 stage1 游戏创意）')
     parser.add_argument('--scenario', type=str,
                         help='使用预设测试场景 (quick, full, real_api)')
+    parser.add_argument('--jobs', '-j', type=int, default=1,
+                        help='场景模式下并行运行工作流的进程数（每个工作流使用独立工作空间）')
     parser.add_argument('--config', '-c', type=str, default=None,
                         help='配置文件路径（默认: test/config/stage_test_config.yaml）')
     parser.add_argument('--no-mock', action='store_true',
                         help='使用真实API（谨慎使用！）')
+    parser.add_argument('--llm-mode', type=str, default=None, choices=['off', 'record', 'replay', 'strict'],
+                        help='文本生成阶段的 LLM 录制/回放模式（默认取 global.mock.llm_mode）')
+    parser.add_argument('--cache', dest='use_cache', action='store_const', const=True, default=None,
+                        help='启用阶段输出缓存：输入未变化时恢复上次的输出而不调用函数（默认取 global.stage_cache.enabled）')
+    parser.add_argument('--no-cache', dest='use_cache', action='store_const', const=False,
+                        help='禁用阶段输出缓存（总是重新调用函数）')
+    parser.add_argument('--refresh-stage', type=str, default=None,
+                        help='忽略缓存强制重新运行的阶段，多个阶段用逗号分隔（结果仍会更新缓存）')
+    parser.add_argument('--incremental', action='store_true',
+                        help='图像生成阶段只重新生成素材清单中变化的素材及其 yield_from 下游素材')
+    parser.add_argument('--sequential', action='store_true',
+                        help='按顺序逐个运行阶段（默认按 dependencies 并发运行独立阶段）')
+    parser.add_argument('--import-profile', action='store_true',
+                        help='输出工作流（或 --stage 指定阶段）函数模块的导入耗时分析（-X importtime），不运行阶段')
+    parser.add_argument('--gc', action='store_true',
+                        help='按 global.workspace_gc 回收工作空间后退出（不运行阶段）')
     parser.add_argument('--verbose', '-v', action='store_true',
                         help='详细输出')
 
@@ -624,17 +1481,33 @@ def main():
         logging.getLogger().setLevel(logging.DEBUG)
 
     # 创建运行器
-    runner = StageTestRunner(config_path=args.config, user_input=args.user_input)
+    runner = StageTestRunner(config_path=args.config, user_input=args.user_input,
+                             sequential=args.sequential, use_cache=args.use_cache,
+                             refresh_stages=args.refresh_stage.split(',') if args.refresh_stage else None,
+                             incremental=args.incremental, use_mock=not args.no_mock,
+                             llm_mode=args.llm_mode)
 
     # 运行测试
-    if args.scenario:
-        runner.run_scenario(args.scenario)
-    elif args.workflow:
-        stages = args.stage.split(',') if args.stage else None
-        runner.run_workflow(args.workflow, stages=stages, from_stage=args.from_stage, workspace=args.workspace)
-    else:
-        parser.print_help()
-        sys.exit(1)
+    try:
+        if args.gc:
+            runner.collect_workspaces()
+            return
+        if runner.config['global'].get('workspace_gc', {}).get('run_on_start', False):
+            runner.collect_workspaces()
+
+        if args.import_profile and args.workflow:
+            runner.report_import_profile(args.workflow, stages=args.stage.split(',') if args.stage else None)
+        elif args.scenario:
+            runner.run_scenario(args.scenario, jobs=args.jobs)
+        elif args.workflow:
+            stages = args.stage.split(',') if args.stage else None
+            runner.run_workflow(args.workflow, stages=stages, from_stage=args.from_stage, workspace=args.workspace,
+                                fork_from=args.fork_from)
+        else:
+            parser.print_help()
+            sys.exit(1)
+    finally:
+        runner.close()
 
 
 if __name__ == '__main__':
@@ -0,0 +1,814 @@
+"""
+验证引擎模块
+Validation Engine Module
+
+统一的验证检查注册表：每个检查只注册一次，并声明它需要的工作空间产物。
+验证引擎先批量加载本阶段所有检查需要的产物（每个产物只读取/解析一次），
+再并发执行互相独立的检查，并记录每个检查的耗时。
+
+StageTestRunner 和 StageValidator 都通过这里的注册表执行检查。
+
+添加新的检查:
+
+    @register_check('my_check', artifacts=('json:path',))
+    def _check_my_check(ctx: CheckContext) -> bool:
+        data = ctx.artifacts.load_json(ctx.resolve('path'))
+        return ...
+"""
+
+import os
+import re
+import json
+import time
+import logging
+import struct
+import threading
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor, Future
+from dataclasses import dataclass
+from typing import Dict, Any, List, Tuple, Callable, Optional, Sequence
+
+logger = logging.getLogger(__name__)
+
+SIZE_PATTERN = re.compile(r'^\s*(\d+)\s*[x×]\s*(\d+)\s*$')
+
+
+def parse_size(size: str) -> Optional[Tuple[int, int]]:
+    """解析尺寸字符串（支持 1024x1024 和 32×32 两种写法）"""
+    match = SIZE_PATTERN.match(size or '')
+    if not match:
+        return None
+    return int(match.group(1)), int(match.group(2))
+
+
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+# PNG 颜色类型 -> 是否自带 alpha 通道（类型 3 调色板图像的透明度在 tRNS 块中，头部无法判断）
+PNG_COLOR_TYPES = {0: ('L', False), 2: ('RGB', False), 3: ('P', None), 4: ('LA', True), 6: ('RGBA', True)}
+
+
+def read_image_header(file_path: str) -> Dict[str, Any]:
+    """只读取文件头部获取图像格式和尺寸，不解码像素数据
+
+    PNG 读取签名和 IHDR 块（前 33 字节）；其他格式只根据魔数识别格式
+
+    Returns:
+        {format, width, height, mode, has_alpha}，无法识别时 format 为 None
+    """
+    header = {'format': None, 'width': None, 'height': None, 'mode': None, 'has_alpha': None}
+    with open(file_path, 'rb') as f:
+        head = f.read(33)
+
+    if head.startswith(PNG_SIGNATURE) and head[12:16] == b'IHDR' and len(head) >= 26:
+        width, height, bit_depth, color_type = struct.unpack('>IIBB', head[16:26])
+        mode, has_alpha = PNG_COLOR_TYPES.get(color_type, (None, None))
+        header.update(format='PNG', width=width, height=height, mode=mode, has_alpha=has_alpha)
+    elif head.startswith(b'\xff\xd8\xff'):
+        header['format'] = 'JPEG'
+    elif head.startswith(b'RIFF') and head[8:12] == b'WEBP':
+        header['format'] = 'WEBP'
+    elif head[:6] in (b'GIF87a', b'GIF89a'):
+        header['format'] = 'GIF'
+    return header
+
+
+def _asset_name(item: Any) -> Any:
+    """任务或批次元素可能是任务字典，也可能直接是文件名"""
+    return item.get('name') if isinstance(item, dict) else item
+
+
+class ArtifactCache:
+    """阶段产物缓存（按相对路径缓存文件内容、JSON 解析结果和目录列表）
+
+    每个产物对应一个 Future：并发请求同一个产物时只有第一个请求加载，其余请求等待同一个结果
+    """
+
+    def __init__(self, workspace_dir: str, background_color: str = '#FFFFFF', tolerance: int = 40):
+        """
+        Args:
+            workspace_dir: 工作空间路径
+            background_color: 透明度指标默认使用的背景色（预加载 alpha 产物时使用）
+            tolerance: 透明度指标默认使用的背景色容差
+        """
+        self.workspace_dir = Path(workspace_dir)
+        self.background_color = background_color
+        self.tolerance = tolerance
+        self._cache: Dict[Tuple[str, str], Future] = {}
+        self._lock = threading.Lock()
+
+    def path(self, rel_path: str) -> Path:
+        return self.workspace_dir / rel_path
+
+    def _claim(self, key: Tuple[str, str]) -> Tuple[Future, bool]:
+        """返回产物的 Future，以及调用方是否负责加载（第一个请求该产物的调用方）"""
+        with self._lock:
+            future = self._cache.get(key)
+            if future is not None:
+                return future, False
+            future = self._cache[key] = Future()
+            return future, True
+
+    def _get(self, kind: str, rel_path: str, loader):
+        future, owner = self._claim((kind, rel_path))
+        if owner:
+            try:
+                future.set_result(loader(self.path(rel_path)))
+            except Exception as e:
+                future.set_exception(e)
+        return future.result()
+
+    def stat(self, rel_path: str):
+        """返回 os.stat_result，文件不存在时返回 None"""
+        def loader(path: Path):
+            try:
+                return path.stat()
+            except FileNotFoundError:
+                return None
+        return self._get('stat', rel_path, loader)
+
+    def exists(self, rel_path: str) -> bool:
+        return self.stat(rel_path) is not None
+
+    def read_text(self, rel_path: str) -> str:
+        """读取文本内容（文件不存在时抛出 FileNotFoundError）"""
+        def loader(path: Path):
+            with open(path, 'r', encoding='utf-8') as f:
+                return f.read()
+        return self._get('text', rel_path, loader)
+
+    def load_json(self, rel_path: str) -> Any:
+        """解析 JSON（复用 read_text 的内容，解析失败时抛出 json.JSONDecodeError）"""
+        return self._get('json', rel_path, lambda path: json.loads(self.read_text(rel_path)))
+
+    def list_pngs(self, rel_dir: str) -> List[os.DirEntry]:
+        """单次 os.scandir 列出目录顶层的 PNG 文件（不包含 _originals 等子目录）"""
+        def loader(path: Path):
+            if not path.is_dir():
+                return []
+            with os.scandir(path) as it:
+                return [entry for entry in it if entry.is_file() and entry.name.endswith('.png')]
+        return self._get('pngs', rel_dir, loader)
+
+    def image_table(self, rel_dir: str) -> Dict[str, Dict[str, Any]]:
+        """并发读取目录顶层所有 PNG 的头部信息
+
+        Returns:
+            文件名 -> {format, width, height, mode, has_alpha, file_size}（读取失败时包含 error）
+        """
+        def read(entry: os.DirEntry) -> Dict[str, Any]:
+            try:
+                header = read_image_header(entry.path)
+                header['file_size'] = entry.stat().st_size
+            except OSError as e:
+                header = {'format': None, 'error': str(e)}
+            return header
+
+        def loader(path: Path):
+            entries = self.list_pngs(rel_dir)
+            if not entries:
+                return {}
+            with ThreadPoolExecutor(max_workers=min(32, len(entries)), thread_name_prefix='png-header') as executor:
+                headers = executor.map(read, entries)
+            return {entry.name: header for entry, header in zip(entries, headers)}
+        return self._get('images', rel_dir, loader)
+
+    def alpha_stats(self, rel_dir: str, names: Sequence[str], background_color: Optional[str] = None,
+                    tolerance: Optional[int] = None) -> Dict[str, Dict[str, Any]]:
+        """批量计算指定素材的透明度指标（NumPy 向量化）
+
+        按 素材 + 参数 缓存：尚未计算的素材合并为一批计算，正在被其他检查计算的素材等待同一个结果
+        """
+        background_color = background_color or self.background_color
+        tolerance = self.tolerance if tolerance is None else tolerance
+        futures, missing = {}, []
+        for name in names:
+            futures[name], owner = self._claim(('alpha', f"{rel_dir}{name}#{background_color}#{tolerance}"))
+            if owner:
+                missing.append(name)
+
+        if missing:
+            base = self.path(rel_dir)
+            try:
+                from image_analysis import analyze_alpha
+                results = analyze_alpha({name: str(base / name) for name in missing}, background_color, tolerance)
+            except Exception as e:
+                for name in missing:
+                    futures[name].set_exception(e)
+            else:
+                for name in missing:
+                    futures[name].set_result(results.get(name, {'error': '未分析'}))
+        return {name: future.result() for name, future in futures.items()}
+
+    def alpha_table(self, rel_dir: str) -> Dict[str, Dict[str, Any]]:
+        """按默认参数计算目录顶层全部 PNG 的透明度指标（预加载用，结果按素材缓存）"""
+        return self.alpha_stats(rel_dir, [entry.name for entry in self.list_pngs(rel_dir)])
+
+    def preload(self, kind: str, rel_path: str):
+        """预加载产物，加载错误留给具体检查处理"""
+        loader = {
+            'stat': self.stat,
+            'text': self.read_text,
+            'json': self.load_json,
+            'pngs': self.list_pngs,
+            'images': self.image_table,
+            'alpha': self.alpha_table,
+        }.get(kind)
+        if loader is None:
+            return
+        try:
+            loader(rel_path)
+        except Exception:
+            pass
+
+
+@dataclass
+class CheckSpec:
+    """已注册的验证检查"""
+    name: str
+    func: Callable[['CheckContext'], bool]
+    artifacts: Tuple[str, ...] = ()  # 形如 "json:path"、"pngs:path"、"json:reference"
+
+
+CHECK_REGISTRY: Dict[str, CheckSpec] = {}
+
+
+def register_check(name: str, artifacts: Sequence[str] = (), aliases: Sequence[str] = ()):
+    """注册验证检查
+
+    Args:
+        name: 配置文件中使用的 check 名称
+        artifacts: 检查需要的产物，格式为 "类型:字段"，字段先从 validation 再从 output 配置中解析；
+                   类型为 stat / text / json / pngs / images / alpha
+        aliases: 同一实现的其他名称
+    """
+    def decorator(func):
+        for check_name in (name, *aliases):
+            CHECK_REGISTRY[check_name] = CheckSpec(check_name, func, tuple(artifacts))
+        return func
+    return decorator
+
+
+class CheckContext:
+    """单个检查的执行上下文"""
+
+    def __init__(self, engine: 'ValidationEngine', validation: Dict, output_config: Dict):
+        self.artifacts = engine.artifacts
+        self.memory = engine.memory
+        self.settings = engine.settings
+        self.validation = validation
+        self.output_config = output_config
+
+    def resolve(self, field: str, default: Any = None) -> Any:
+        """解析检查参数：先取 validation 中的值，再取 output 配置中的值"""
+        if field in self.validation:
+            value = self.validation[field]
+        elif field in self.output_config:
+            value = self.output_config[field]
+        elif field == 'path' and self.output_config.get('paths'):
+            value = self.output_config['paths'][0]
+        else:
+            return default
+        return self._format(value)
+
+    def _format(self, value: Any) -> Any:
+        """替换路径中的 {asset_name} 等占位符，并去掉 *.png 之类的通配部分"""
+        if isinstance(value, list):
+            return [self._format(v) for v in value]
+        if not isinstance(value, str):
+            return value
+        if '{asset_name}' in value:
+            asset_data = self.memory.get('asset_data')
+            if isinstance(asset_data, dict) and asset_data.get('name'):
+                value = value.replace('{asset_name}', asset_data['name'])
+        if '*' in value:
+            value = value.split('*', 1)[0]
+        return value
+
+    def memory_value(self) -> Any:
+        """读取 memory 类型输出的变量值"""
+        return self.memory.get(self.resolve('variable'))
+
+
+class ValidationEngine:
+    """基于注册表和共享产物缓存的阶段输出验证引擎"""
+
+    def __init__(self, workspace_dir: str, memory: Optional[Dict] = None,
+                 settings: Optional[Dict] = None):
+        """
+        Args:
+            workspace_dir: 工作空间路径
+            memory: 阶段间传递的内存数据（memory 类型输出的检查使用）
+            settings: 全局验证器配置（global.validators）
+        """
+        self.workspace_dir = workspace_dir
+        self.memory = memory or {}
+        self.settings = settings or {}
+        self.artifacts = ArtifactCache(workspace_dir, self.settings.get('background_color', '#FFFFFF'),
+                                       self.settings.get('background_tolerance', 40))
+
+    def _required_artifacts(self, validations: List[Dict], output_config: Dict) -> List[Tuple[str, str]]:
+        """收集所有检查声明的产物（去重）"""
+        required = []
+        for validation in validations:
+            spec = CHECK_REGISTRY.get(validation.get('check'))
+            if spec is None:
+                continue
+            ctx = CheckContext(self, validation, output_config)
+            for artifact in spec.artifacts:
+                kind, field = artifact.split(':', 1)
+                value = ctx.resolve(field)
+                for rel_path in (value if isinstance(value, list) else [value]):
+                    if rel_path and (kind, rel_path) not in required:
+                        required.append((kind, rel_path))
+        return required
+
+    def run(self, output_config: Dict) -> Tuple[bool, List[Dict]]:
+        """执行输出配置中的全部验证检查
+
+        先并发预加载所有检查需要的产物，再并发执行检查
+
+        Returns:
+            (是否全部通过, 每个检查的结果列表 [{check, status, passed, duration_ms, message}])
+        """
+        validations = output_config.get('validation', [])
+        if not validations:
+            return True, []
+
+        max_workers = self.settings.get('max_workers', 8)
+        with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='validate') as executor:
+            required = self._required_artifacts(validations, output_config)
+            list(executor.map(lambda item: self.artifacts.preload(*item), required))
+            results = list(executor.map(
+                lambda validation: self._timed_check(validation, output_config), validations))
+
+        return all(r['passed'] for r in results), results
+
+    def _timed_check(self, validation: Dict, output_config: Dict) -> Dict:
+        check_type = validation.get('check')
+        start = time.perf_counter()
+        status = self.check_status(check_type, validation, output_config)
+        return {
+            'check': check_type,
+            'status': status,
+            'passed': status == 'passed',
+            'duration_ms': round((time.perf_counter() - start) * 1000, 3),
+            'message': validation.get('message', f'{check_type} 验证失败'),
+        }
+
+    def check_status(self, check_type: str, validation: Dict, output_config: Dict) -> str:
+        """运行单个验证检查，返回 passed / failed / error / unknown"""
+        spec = CHECK_REGISTRY.get(check_type)
+        if spec is None:
+            return 'unknown'
+
+        try:
+            passed = spec.func(CheckContext(self, validation, output_config))
+            return 'passed' if passed else 'failed'
+        except Exception as e:
+            logger.error(f"  ✗ 验证检查异常 ({check_type}): {e}")
+            return 'error'
+
+    def run_check(self, check_type: str, validation: Dict, output_config: Dict) -> bool:
+        """运行单个验证检查，返回是否通过"""
+        return self.check_status(check_type, validation, output_config) == 'passed'
+
+
+# ============================================================
+# 文件验证
+# ============================================================
+
+@register_check('file_exists', artifacts=('stat:path',))
+def _check_file_exists(ctx: CheckContext) -> bool:
+    return ctx.artifacts.exists(ctx.resolve('path'))
+
+
+@register_check('file_not_empty', artifacts=('stat:path',))
+def _check_file_not_empty(ctx: CheckContext) -> bool:
+    stat = ctx.artifacts.stat(ctx.resolve('path'))
+    return stat is not None and stat.st_size > 0
+
+
+@register_check('min_size', artifacts=('stat:path',))
+def _check_min_size(ctx: CheckContext) -> bool:
+    stat = ctx.artifacts.stat(ctx.resolve('path'))
+    return stat is not None and stat.st_size >= ctx.validation.get('value', 0)
+
+
+@register_check('directory_exists')
+def _check_directory_exists(ctx: CheckContext) -> bool:
+    return ctx.artifacts.path(ctx.resolve('path')).is_dir()
+
+
+# ============================================================
+# JSON验证
+# ============================================================
+
+@register_check('valid_json', artifacts=('json:files', 'json:path'))
+def _check_valid_json(ctx: CheckContext) -> bool:
+    # memory 输出直接验证变量能否序列化为 JSON
+    if ctx.output_config.get('type') == 'memory' and 'files' not in ctx.validation:
+        value = ctx.memory_value()
+        if isinstance(value, str):
+            json.loads(value)
+            return True
+        json.dumps(value)
+        return value is not None
+
+    files = ctx.resolve('files') or [ctx.resolve('path')]
+    for file_rel_path in files:
+        try:
+            ctx.artifacts.load_json(file_rel_path)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return False
+    return True
+
+
+@register_check('is_array', artifacts=('json:path',))
+def _check_is_array(ctx: CheckContext) -> bool:
+    return isinstance(ctx.artifacts.load_json(ctx.resolve('path')), list)
+
+
+@register_check('array_not_empty', artifacts=('json:path',))
+def _check_array_not_empty(ctx: CheckContext) -> bool:
+    data = ctx.artifacts.load_json(ctx.resolve('path'))
+    return isinstance(data, list) and len(data) > 0
+
+
+@register_check('items_have_fields', artifacts=('json:path',))
+def _check_items_have_fields(ctx: CheckContext) -> bool:
+    data = ctx.artifacts.load_json(ctx.resolve('path'))
+    required_fields = ctx.validation.get('required_fields', [])
+    if not isinstance(data, list):
+        return False
+    return all(all(field in item for field in required_fields) for item in data)
+
+
+@register_check('size_format_valid', artifacts=('json:path',))
+def _check_size_format_valid(ctx: CheckContext) -> bool:
+    tasks = ctx.artifacts.load_json(ctx.resolve('path'))
+    pattern = re.compile(ctx.validation.get('pattern', r'^\d+x\d+$'))
+    return all(pattern.match(task.get('size', '')) for task in tasks)
+
+
+@register_check('todos_structure', artifacts=('json:path',))
+def _check_todos_structure(ctx: CheckContext) -> bool:
+    data = ctx.artifacts.load_json(ctx.resolve('path'))
+    # 支持两种格式: {todos: [...]} 或 [...]
+    if isinstance(data, dict):
+        return all(isinstance(data.get(field), list) for field in ctx.validation.get('required_fields', ['todos']))
+    return isinstance(data, list)
+
+
+# ============================================================
+# 内容验证
+# ============================================================
+
+@register_check('contains_keywords', artifacts=('text:path',))
+def _check_contains_keywords(ctx: CheckContext) -> bool:
+    content = ctx.artifacts.read_text(ctx.resolve('path'))
+    return any(keyword in content for keyword in ctx.validation.get('keywords', []))
+
+
+@register_check('has_test_step', artifacts=('text:path',))
+def _check_has_test_step(ctx: CheckContext) -> bool:
+    content = ctx.artifacts.read_text(ctx.resolve('path')).lower()
+    return ctx.validation.get('keyword', 'playwright').lower() in content
+
+
+@register_check('asset_count_matches', artifacts=('text:path', 'json:reference'))
+def _check_asset_count_matches(ctx: CheckContext) -> bool:
+    tasks = ctx.artifacts.load_json(ctx.resolve('reference'))
+    doc_content = ctx.artifacts.read_text(ctx.resolve('path'))
+    # 统计 "####" 标题数量（每个素材一个四级标题）
+    return doc_content.count('####') >= len(tasks)
+
+
+# ============================================================
+# 图像验证
+# ============================================================
+
+def _expected_and_actual(ctx: CheckContext) -> Tuple[List[Dict], set]:
+    tasks = ctx.artifacts.load_json(ctx.resolve('reference', 'public/tasks.json'))
+    names = {entry.name for entry in ctx.artifacts.list_pngs(ctx.resolve('path'))}
+    return (tasks if isinstance(tasks, list) else []), names
+
+
+@register_check('image_count_matches', artifacts=('pngs:path', 'json:reference'))
+def _check_image_count_matches(ctx: CheckContext) -> bool:
+    reference = ctx.resolve('reference')
+    if not ctx.artifacts.exists(reference):
+        return False
+
+    tasks = ctx.artifacts.load_json(reference)
+    expected_count = len(tasks) if isinstance(tasks, list) else 0
+
+    # list_pngs 只列出顶层文件，_originals 子目录天然被排除
+    actual_count = len(ctx.artifacts.list_pngs(ctx.resolve('path')))
+    return actual_count == expected_count
+
+
+@register_check('all_images_downloaded', artifacts=('pngs:path', 'json:reference'))
+def _check_all_images_downloaded(ctx: CheckContext) -> bool:
+    tasks, names = _expected_and_actual(ctx)
+    return all(task.get('name') in names for task in tasks)
+
+
+@register_check('api_calls_successful', artifacts=('pngs:path', 'json:reference'))
+def _check_api_calls_successful(ctx: CheckContext) -> bool:
+    tasks, names = _expected_and_actual(ctx)
+    if not tasks:
+        return False
+    min_rate = ctx.validation.get('min_success_rate', ctx.settings.get('min_success_rate', 0.8))
+    generated = sum(1 for task in tasks if task.get('name') in names)
+    return generated / len(tasks) >= min_rate
+
+
+def build_image_table(artifacts: ArtifactCache, assets_dir: str, tasks: List[Dict],
+                      tolerance: int = 10) -> List[Dict[str, Any]]:
+    """汇总每个素材的图像头部信息与 tasks.json 中的期望尺寸
+
+    Returns:
+        每个素材一行: {name, exists, format, width, height, expected_size, size_ok}，
+        另外附上目录中存在但不在 tasks.json 里的图像（expected_size 为 None）
+    """
+    images = artifacts.image_table(assets_dir)
+    rows = []
+    for task in tasks:
+        name = task.get('name')
+        header = images.get(name, {})
+        expected = parse_size(task.get('size', ''))
+        size_ok = None
+        if expected and header.get('width') is not None:
+            size_ok = (abs(header['width'] - expected[0]) <= tolerance
+                       and abs(header['height'] - expected[1]) <= tolerance)
+        rows.append({
+            'name': name,
+            'exists': name in images,
+            'format': header.get('format'),
+            'width': header.get('width'),
+            'height': header.get('height'),
+            'has_alpha': header.get('has_alpha'),
+            'expected_size': expected,
+            'size_ok': size_ok,
+        })
+
+    task_names = {task.get('name') for task in tasks}
+    for name, header in images.items():
+        if name not in task_names:
+            rows.append({
+                'name': name, 'exists': True, 'format': header.get('format'),
+                'width': header.get('width'), 'height': header.get('height'),
+                'has_alpha': header.get('has_alpha'), 'expected_size': None, 'size_ok': None,
+            })
+    return rows
+
+
+@register_check('images_valid', artifacts=('images:path',), aliases=('image_format_valid',))
+def _check_images_valid(ctx: CheckContext) -> bool:
+    allowed_formats = ctx.validation.get('allowed_formats', ['PNG'])
+    images = ctx.artifacts.image_table(ctx.resolve('path'))
+    return len(images) > 0 and all(header.get('format') in allowed_formats for header in images.values())
+
+
+@register_check('image_valid', artifacts=('stat:path',))
+def _check_image_valid(ctx: CheckContext) -> bool:
+    header = read_image_header(str(ctx.artifacts.path(ctx.resolve('path'))))
+    return header['format'] is not None and header['width'] != 0 and header['height'] != 0
+
+
+@register_check('images_size_correct', artifacts=('images:path', 'json:reference'),
+                aliases=('images_resized', 'sizes_accurate', 'sizes_updated'))
+def _check_images_size_correct(ctx: CheckContext) -> bool:
+    # sizes_accurate / sizes_updated 以输出文件（tasks.json）作为参考，并在 public/assets/ 中查找图像；
+    # sizes_updated 要求记录的尺寸与实际尺寸完全一致（元数据更新阶段写入的是实际尺寸）
+    check = ctx.validation.get('check')
+    if check in ('sizes_accurate', 'sizes_updated'):
+        tasks = ctx.artifacts.load_json(ctx.resolve('path'))
+        assets_dir = ctx.validation.get('assets_dir', 'public/assets/')
+    else:
+        tasks = ctx.artifacts.load_json(ctx.resolve('reference', 'public/tasks.json'))
+        assets_dir = ctx.resolve('path')
+
+    default_tolerance = 0 if check == 'sizes_updated' else ctx.settings.get('size_tolerance', 10)
+    tolerance = ctx.validation.get('tolerance', default_tolerance)
+    for row in build_image_table(ctx.artifacts, assets_dir, tasks, tolerance):
+        if row['expected_size'] is None:
+            continue
+        # 图像缺失、无法读取尺寸或尺寸超出容差
+        if not row['exists'] or row['size_ok'] is not True:
+            return False
+    return True
+
+
+def _foreground_alpha_stats(ctx: CheckContext) -> Dict[str, Dict[str, Any]]:
+    """计算非背景素材的透明度指标（跳过 skip_categories 中的类别，默认跳过 is_background 素材）"""
+    tasks = ctx.artifacts.load_json(ctx.resolve('reference', 'public/tasks.json'))
+    skip_categories = ctx.validation.get('skip_categories', ['background'])
+    assets_dir = ctx.resolve('path')
+    existing = {entry.name for entry in ctx.artifacts.list_pngs(assets_dir)}
+
+    names = []
+    for task in tasks:
+        if task.get('is_background') and 'background' in skip_categories:
+            continue
+        if task.get('category') in skip_categories:
+            continue
+        if task.get('name') in existing:
+            names.append(task.get('name'))
+
+    return ctx.artifacts.alpha_stats(
+        assets_dir, names,
+        background_color=ctx.validation.get('background_color', ctx.settings.get('background_color', '#FFFFFF')),
+        tolerance=ctx.validation.get('color_tolerance', ctx.settings.get('background_tolerance', 40)),
+    )
+
+
+@register_check('transparent_png', artifacts=('pngs:path', 'json:reference', 'alpha:path'))
+def _check_transparent_png(ctx: CheckContext) -> bool:
+    check_alpha_channel = ctx.validation.get('check_alpha_channel', True)
+    for name, stats in _foreground_alpha_stats(ctx).items():
+        if 'error' in stats:
+            return False
+        if check_alpha_channel and not stats['has_alpha']:
+            return False
+        if stats['transparent_ratio'] <= 0:
+            return False
+    return True
+
+
+@register_check('background_removed', artifacts=('pngs:path', 'json:reference', 'alpha:path'))
+def _check_background_removed(ctx: CheckContext) -> bool:
+    min_border = ctx.validation.get('min_border_transparency', 0.5)
+    max_residual = ctx.validation.get('max_residual_background', 0.05)
+    for name, stats in _foreground_alpha_stats(ctx).items():
+        if 'error' in stats:
+            return False
+        if stats['border_transparency'] < min_border or stats['residual_background'] > max_residual:
+            return False
+    return True
+
+
+@register_check('originals_saved', artifacts=('pngs:path',), aliases=('originals_preserved',))
+def _check_originals_saved(ctx: CheckContext) -> bool:
+    return len(ctx.artifacts.list_pngs(ctx.resolve('path'))) > 0
+
+
+@register_check('atlas_coverage', artifacts=('json:path', 'json:reference'))
+def _check_atlas_coverage(ctx: CheckContext) -> bool:
+    # 图集索引覆盖 tasks.json 中的每个非背景素材（或注明了未打包原因），帧位于图集范围内且互不重叠
+    index_path = ctx.resolve('path')
+    index = ctx.artifacts.load_json(index_path)
+    tasks = ctx.artifacts.load_json(ctx.resolve('reference', 'public/tasks.json'))
+    frames, skipped, atlases = index.get('frames', {}), index.get('skipped', {}), index.get('atlases', [])
+    allowed_skips = set(ctx.validation.get('allowed_skip_reasons', ['background', 'too_large']))
+
+    for task in tasks:
+        name = task.get('name')
+        if name not in frames and skipped.get(name) not in allowed_skips:
+            logger.debug(f"  图集未覆盖: {name}")
+            return False
+
+    atlas_dir = index_path.rsplit('/', 1)[0] + '/' if '/' in index_path else ''
+    if not all(ctx.artifacts.exists(f"{atlas_dir}{atlas.get('image')}") for atlas in atlases):
+        return False
+
+    placed: Dict[int, List[Tuple[int, int, int, int]]] = {}
+    for frame in frames.values():
+        number = frame.get('atlas')
+        if not isinstance(number, int) or not 0 <= number < len(atlases):
+            return False
+        x, y, w, h = frame['x'], frame['y'], frame['w'], frame['h']
+        if x < 0 or y < 0 or x + w > atlases[number]['width'] or y + h > atlases[number]['height']:
+            return False
+        for ox, oy, ow, oh in placed.get(number, []):
+            if x < ox + ow and ox < x + w and y < oy + oh and oy < y + h:
+                return False
+        placed.setdefault(number, []).append((x, y, w, h))
+    return True
+
+
+# ============================================================
+# 内存数据验证（generate-game-asset / add-game-asset）
+# ============================================================
+
+@register_check('is_list')
+def _check_is_list(ctx: CheckContext) -> bool:
+    return isinstance(ctx.memory_value(), list)
+
+
+@register_check('all_have_description')
+def _check_all_have_description(ctx: CheckContext) -> bool:
+    tasks = ctx.memory_value()
+    return isinstance(tasks, list) and all(isinstance(t, dict) and t.get('description') for t in tasks)
+
+
+@register_check('has_required_fields')
+def _check_has_required_fields(ctx: CheckContext) -> bool:
+    data = ctx.memory_value()
+    if isinstance(data, str):
+        data = json.loads(data)
+    return isinstance(data, dict) and all(field in data for field in ctx.validation.get('fields', []))
+
+
+@register_check('is_list_of_lists')
+def _check_is_list_of_lists(ctx: CheckContext) -> bool:
+    batches = ctx.memory_value()
+    return isinstance(batches, list) and all(isinstance(batch, list) for batch in batches)
+
+
+def _batch_levels(ctx: CheckContext) -> Tuple[Dict[Any, int], List[Tuple[Any, List[str]]]]:
+    """返回 素材名 -> 批次序号，以及参与分批的任务的 (素材名, 引用的素材) 列表"""
+    from asset_manifest import parse_references
+
+    batches = ctx.memory_value() or []
+    levels = {}
+    for index, batch in enumerate(batches):
+        for item in batch:
+            levels.setdefault(_asset_name(item), index)
+
+    tasks = ctx.memory.get(ctx.validation.get('tasks_variable', 'valid_tasks')) or []
+    tasks = [t for t in tasks if isinstance(t, dict)]
+    tasks += [item for batch in batches for item in batch if isinstance(item, dict)]
+
+    dependencies, seen = [], set()
+    for task in tasks:
+        name = task.get('name')
+        if name not in seen:
+            seen.add(name)
+            dependencies.append((name, parse_references(task.get('yield_from'))))
+    return levels, dependencies
+
+
+@register_check('no_circular_dependency')
+def _check_no_circular_dependency(ctx: CheckContext) -> bool:
+    # 存在循环依赖的任务无法被拓扑排序，因此不会出现在任何批次中，或者重复出现
+    levels, dependencies = _batch_levels(ctx)
+    batches = ctx.memory_value() or []
+    scheduled = [_asset_name(item) for batch in batches for item in batch]
+    return len(scheduled) == len(set(scheduled)) and all(name in levels for name, _ in dependencies)
+
+
+@register_check('dependencies_resolved')
+def _check_dependencies_resolved(ctx: CheckContext) -> bool:
+    # 引用的素材要么也在批次中，要么已存在于工作空间
+    levels, dependencies = _batch_levels(ctx)
+    assets_dir = ctx.validation.get('assets_dir', 'public/assets/')
+    for _, refs in dependencies:
+        for ref in refs:
+            if ref not in levels and not ctx.artifacts.exists(f"{assets_dir}{ref}"):
+                return False
+    return True
+
+
+@register_check('batch_order_correct')
+def _check_batch_order_correct(ctx: CheckContext) -> bool:
+    levels, dependencies = _batch_levels(ctx)
+    for name, refs in dependencies:
+        level = levels.get(name)
+        for ref in refs:
+            if ref in levels and level is not None and levels[ref] >= level:
+                return False
+    return True
+
+
+@register_check('needs_generation_filter', artifacts=('json:reference',))
+def _check_needs_generation_filter(ctx: CheckContext) -> bool:
+    # 过滤结果只包含 tasks.json 中的任务，不包含 needs_generation 为 false 的任务，
+    # 并且不遗漏 needs_generation 为 true 的任务（未设置该字段的任务视为需要生成，可由其他条件过滤）
+    tasks = ctx.artifacts.load_json(ctx.resolve('reference', 'public/tasks.json'))
+    selected = ctx.memory_value()
+    if not isinstance(tasks, list) or not isinstance(selected, list):
+        return False
+    by_name = {task.get('name'): task for task in tasks if isinstance(task, dict)}
+    selected_names = {_asset_name(task) for task in selected}
+    if any(name not in by_name or by_name[name].get('needs_generation') is False for name in selected_names):
+        return False
+    return all(name in selected_names for name, task in by_name.items() if task.get('needs_generation') is True)
+
+
+def _input_asset(ctx: CheckContext) -> Dict[str, Any]:
+    """读取阶段输入的素材元数据（validation.source，默认 asset_data；JSON 字符串会先解析）"""
+    data = ctx.memory.get(ctx.validation.get('source', 'asset_data'))
+    if isinstance(data, str):
+        data = json.loads(data)
+    return data if isinstance(data, dict) else {}
+
+
+@register_check('new_task_added', artifacts=('json:path',))
+def _check_new_task_added(ctx: CheckContext) -> bool:
+    # 输入的素材在 tasks.json 中恰好出现一次，且描述和尺寸与输入一致
+    asset = _input_asset(ctx)
+    tasks = ctx.artifacts.load_json(ctx.resolve('path'))
+    if not asset.get('name') or not isinstance(tasks, list):
+        return False
+    matches = [task for task in tasks if isinstance(task, dict) and task.get('name') == asset['name']]
+    return len(matches) == 1 and all(matches[0].get(field) == asset[field]
+                                     for field in ('description', 'size') if field in asset)
+
+
+@register_check('new_entry_added', artifacts=('text:path',))
+def _check_new_entry_added(ctx: CheckContext) -> bool:
+    # 文档中出现输入素材的名称（带或不带扩展名）
+    name = _input_asset(ctx).get('name')
+    if not name:
+        return False
+    return Path(name).stem in ctx.artifacts.read_text(ctx.resolve('path'))
@@ -0,0 +1,285 @@
+#!/usr/bin/env python3
+"""
+工作空间回收模块
+Workspace Retention and Disk-Budget Garbage Collector
+
+cleanup_after_test 为 false（默认）时，每次运行都会在 workspace_base 下留下一个 {workflow}_{timestamp}
+工作空间（包括全分辨率的 _originals/），CI 磁盘被占满后所有文件系统操作都会变慢。本模块按保留策略回收：
+
+- keep_last: 每个工作流只保留最新的 N 个运行
+- keep_failed: 失败的运行不受 keep_last 和磁盘预算影响（便于排查），只按 max_age_days 过期；
+  没有运行状态（.run_status.json）的工作空间（中断的运行、旧版本留下的工作空间）同样只按 max_age_days 过期
+- max_age_days: 超过该天数的运行一律回收
+- max_total_mb: 剩余工作空间总大小超过预算时，从最旧的运行开始回收
+
+只回收带时间戳的工作空间；自定义名称的工作空间（--workspace）需要 include_custom: true 才参与回收。
+最近 grace_minutes 分钟内有写入的工作空间视为正在运行，不回收。
+
+每个工作空间只用 os.scandir 遍历一次，同时完成大小统计：与其他工作空间共享 inode 的硬链接文件
+（分叉的工作空间）在最后一个链接删除前不会释放空间；按磁盘预算回收时逐个累计已回收工作空间中的链接数，
+共享 inode 的全部链接都将被删除时才计入回收量。
+
+工作空间的保留策略只在本模块实现；共享素材存储（asset_store.py）在回收后只清理不再被引用的对象。
+
+用法示例:
+  python workspace_gc.py --dry-run
+  python workspace_gc.py --keep-last 5 --max-total-mb 2048
+"""
+
+import os
+import re
+import sys
+import json
+import time
+import shutil
+import argparse
+import logging
+from pathlib import Path
+from datetime import datetime
+from typing import Dict, Any, List, Optional
+
+logger = logging.getLogger(__name__)
+
+STATUS_FILE = ".run_status.json"
+WORKSPACE_NAME = re.compile(r'^(?P<workflow>.+)_(?P<timestamp>\d{8}_\d{6})$')
+
+
+def write_run_status(workspace_dir: str, workflow: str, results: List[Dict]):
+    """在工作空间中记录本次运行的结果（原子替换），供回收时区分成功和失败的运行"""
+    status = {
+        'workflow': workflow,
+        'success': bool(results) and all(result.get('success') for result in results),
+        'stages': {result.get('stage'): bool(result.get('success')) for result in results},
+        'finished_at': datetime.now().isoformat(timespec='seconds'),
+    }
+    path = Path(workspace_dir) / STATUS_FILE
+    tmp = path.with_name(f"{STATUS_FILE}.tmp")
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(status, f, ensure_ascii=False, indent=2)
+    tmp.replace(path)
+
+
+def _scan_workspace(path: str, shared: Dict[tuple, int]) -> Dict[str, Any]:
+    """用 os.scandir 遍历一次工作空间：统计文件数、独占字节数、最近写入时间并读取运行状态
+
+    shared 收集与工作空间外共享的 inode（(st_dev, st_ino) -> 大小），用于按 inode 去重统计总大小；
+    返回的 shared_inodes 记录这些 inode 的 (大小, 链接数, 本工作空间内出现次数)，用于估算回收多个工作空间后释放的空间
+    """
+    inodes: Dict[tuple, List[int]] = {}  # (st_dev, st_ino) -> [大小, 链接数, 本工作空间内出现次数]
+    newest_mtime, files, status = 0.0, 0, None
+    stack = [path]
+    while stack:
+        directory = stack.pop()
+        try:
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    if entry.is_dir(follow_symlinks=False):
+                        stack.append(entry.path)
+                        continue
+                    st = entry.stat(follow_symlinks=False)
+                    files += 1
+                    newest_mtime = max(newest_mtime, st.st_mtime)
+                    key = (st.st_dev, st.st_ino)
+                    if key in inodes:
+                        inodes[key][2] += 1
+                    else:
+                        inodes[key] = [st.st_size, st.st_nlink, 1]
+                    if directory == path and entry.name == STATUS_FILE:
+                        try:
+                            with open(entry.path, 'r', encoding='utf-8') as f:
+                                status = json.load(f)
+                        except (json.JSONDecodeError, OSError):
+                            status = None
+        except OSError as e:
+            logger.debug(f"无法遍历目录: {directory} ({e})")
+
+    exclusive, shared_inodes = 0, {}
+    for key, (size, nlink, seen) in inodes.items():
+        if seen >= nlink:
+            exclusive += size
+        else:
+            shared[key] = size
+            shared_inodes[key] = (size, nlink, seen)
+    return {'files': files, 'bytes': sum(size for size, _, _ in inodes.values()),
+            'exclusive_bytes': exclusive, 'shared_inodes': shared_inodes,
+            'newest_mtime': newest_mtime, 'status': status}
+
+
+class WorkspaceGC:
+    """按保留策略和磁盘预算回收 workspace_base 下的工作空间"""
+
+    def __init__(self, workspace_base: str, keep_last: Optional[int] = None, keep_failed: bool = True,
+                 max_age_days: Optional[float] = None, max_total_mb: Optional[float] = None,
+                 include_custom: bool = False, grace_minutes: float = 10):
+        """
+        Args:
+            workspace_base: 工作空间根目录
+            keep_last: 每个工作流保留的最新运行数（None 表示不限制）
+            keep_failed: 失败的运行不受 keep_last 和磁盘预算影响
+            max_age_days: 最长保留天数（None 表示不限制）
+            max_total_mb: 工作空间总大小预算（None 表示不限制）
+            include_custom: 自定义名称的工作空间是否参与回收
+            grace_minutes: 最近有写入的工作空间视为正在运行，不回收
+        """
+        self.workspace_base = Path(workspace_base)
+        self.keep_last = keep_last
+        self.keep_failed = keep_failed
+        self.max_age_days = max_age_days
+        self.max_total_mb = max_total_mb
+        self.include_custom = include_custom
+        self.grace_minutes = grace_minutes
+
+    @classmethod
+    def from_config(cls, config: Optional[Dict], workspace_base: str) -> 'WorkspaceGC':
+        """从配置构建（global.workspace_gc）"""
+        config = config or {}
+        return cls(workspace_base, keep_last=config.get('keep_last'), keep_failed=config.get('keep_failed', True),
+                   max_age_days=config.get('max_age_days'), max_total_mb=config.get('max_total_mb'),
+                   include_custom=config.get('include_custom', False),
+                   grace_minutes=config.get('grace_minutes', 10))
+
+    def scan(self) -> Dict[str, Any]:
+        """扫描 workspace_base 下的工作空间（以 . 开头的目录是缓存和存储，不计入）
+
+        Returns:
+            {'workspaces': [工作空间信息，按创建时间从新到旧], 'total_bytes': 按 inode 去重的总大小}
+        """
+        workspaces, shared = [], {}
+        if not self.workspace_base.is_dir():
+            return {'workspaces': [], 'total_bytes': 0}
+        with os.scandir(self.workspace_base) as entries:
+            for entry in entries:
+                if entry.name.startswith('.') or not entry.is_dir(follow_symlinks=False):
+                    continue
+                info = _scan_workspace(entry.path, shared)
+                match = WORKSPACE_NAME.match(entry.name)
+                status = info.pop('status') or {}
+                if match:
+                    created = datetime.strptime(match.group('timestamp'), '%Y%m%d_%H%M%S').timestamp()
+                else:
+                    created = entry.stat(follow_symlinks=False).st_mtime
+                workspaces.append({
+                    'name': entry.name,
+                    'path': entry.path,
+                    'workflow': status.get('workflow') or (match.group('workflow') if match else None),
+                    'custom': match is None,
+                    'created': created,
+                    'state': 'unknown' if not status else ('success' if status.get('success') else 'failed'),
+                    **info,
+                })
+        workspaces.sort(key=lambda workspace: workspace['created'], reverse=True)
+        total = sum(workspace['exclusive_bytes'] for workspace in workspaces) + sum(shared.values())
+        return {'workspaces': workspaces, 'total_bytes': total}
+
+    def plan(self, scan: Dict[str, Any], now: Optional[float] = None) -> List[Dict[str, Any]]:
+        """按策略决定要回收的工作空间，返回 [{'workspace': 工作空间信息, 'reason': 原因, 'bytes': 释放的字节数}]
+
+        释放的字节数包括独占的文件，以及全部链接都在已回收工作空间中的共享 inode
+        """
+        now = now or time.time()
+        removals, kept = [], []
+        per_workflow: Dict[Any, int] = {}
+        removed_links: Dict[tuple, int] = {}  # 共享 inode -> 已回收工作空间中的链接数
+
+        def remove(workspace: Dict[str, Any], reason: str) -> int:
+            freed = workspace['exclusive_bytes']
+            for key, (size, nlink, seen) in workspace.get('shared_inodes', {}).items():
+                before = removed_links.get(key, 0)
+                removed_links[key] = before + seen
+                if before < nlink <= before + seen:
+                    freed += size
+            removals.append({'workspace': workspace, 'reason': reason, 'bytes': freed})
+            return freed
+
+        for workspace in scan['workspaces']:  # 从新到旧
+            if workspace['custom'] and not self.include_custom:
+                continue
+            if now - workspace['newest_mtime'] < self.grace_minutes * 60:
+                continue
+            if self.max_age_days is not None and now - workspace['created'] > self.max_age_days * 86400:
+                remove(workspace, 'max_age')
+                continue
+            if workspace['state'] == 'unknown' or (self.keep_failed and workspace['state'] == 'failed'):
+                continue
+            position = per_workflow.get(workspace['workflow'], 0)
+            per_workflow[workspace['workflow']] = position + 1
+            if self.keep_last is not None and position >= self.keep_last:
+                remove(workspace, 'keep_last')
+                continue
+            kept.append(workspace)
+
+        if self.max_total_mb is not None:
+            budget = self.max_total_mb * 1024 * 1024
+            remaining = scan['total_bytes'] - sum(item['bytes'] for item in removals)
+            for workspace in reversed(kept):  # 从最旧的开始
+                if remaining <= budget:
+                    break
+                remaining -= remove(workspace, 'max_total_mb')
+        return removals
+
+    def collect(self, dry_run: bool = False) -> Dict[str, Any]:
+        """扫描并回收工作空间
+
+        Returns:
+            {'scanned', 'total_bytes', 'removed': [{'name', 'reason', 'bytes'}], 'bytes_freed', 'seconds'}
+        """
+        start = time.perf_counter()
+        scan = self.scan()
+        removals = self.plan(scan)
+        for item in removals:
+            workspace = item['workspace']
+            logger.info(f"🗑  回收工作空间 ({item['reason']}): {workspace['name']} "
+                        f"{item['bytes'] / 1024 / 1024:.1f}MB")
+            if not dry_run:
+                shutil.rmtree(workspace['path'], ignore_errors=True)
+        return {
+            'scanned': len(scan['workspaces']),
+            'total_bytes': scan['total_bytes'],
+            'removed': [{'name': item['workspace']['name'], 'reason': item['reason'],
+                         'bytes': item['bytes']} for item in removals],
+            'bytes_freed': sum(item['bytes'] for item in removals),
+            'seconds': round(time.perf_counter() - start, 3),
+        }
+
+
+def main():
+    """命令行入口：按 global.workspace_gc 回收工作空间，命令行参数覆盖配置"""
+    import yaml
+
+    parser = argparse.ArgumentParser(description='工作空间回收')
+    parser.add_argument('--config', '-c', type=str, default=None,
+                        help='配置文件路径（默认: config/stage_test_config.yaml）')
+    parser.add_argument('--keep-last', type=int, default=None, help='覆盖 keep_last')
+    parser.add_argument('--max-age-days', type=float, default=None, help='覆盖 max_age_days')
+    parser.add_argument('--max-total-mb', type=float, default=None, help='覆盖 max_total_mb')
+    parser.add_argument('--include-custom', action='store_true', help='自定义名称的工作空间也参与回收')
+    parser.add_argument('--dry-run', action='store_true', help='只输出将要回收的工作空间')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s [%(levelname)s] %(message)s', datefmt='%H:%M:%S')
+    config_path = args.config or Path(__file__).parent.parent / "config" / "stage_test_config.yaml"
+    with open(config_path, 'r', encoding='utf-8') as f:
+        global_config = (yaml.safe_load(f) or {}).get('global', {})
+    gc_config = dict(global_config.get('workspace_gc') or {})
+    for key in ('keep_last', 'max_age_days', 'max_total_mb'):
+        if getattr(args, key) is not None:
+            gc_config[key] = getattr(args, key)
+    if args.include_custom:
+        gc_config['include_custom'] = True
+
+    workspace_base = global_config.get('workspace_base', 'test/temp_workspace')
+    result = WorkspaceGC.from_config(gc_config, workspace_base).collect(dry_run=args.dry_run)
+    logger.info(f"扫描 {result['scanned']} 个工作空间, 共 {result['total_bytes'] / 1024 / 1024:.1f}MB; "
+                f"{'将回收' if args.dry_run else '已回收'} {len(result['removed'])} 个, "
+                f"{result['bytes_freed'] / 1024 / 1024:.1f}MB ({result['seconds']:.2f}s)")
+
+    store_config = global_config.get('asset_store') or {}
+    if store_config.get('enabled', False) and not args.dry_run and result['removed']:
+        from asset_store import AssetStore
+        stats = AssetStore.from_config(store_config, workspace_base).prune()
+        logger.info(f"素材存储回收: {stats['objects_removed']} 个对象, {stats['bytes_freed'] / 1024 / 1024:.1f}MB")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
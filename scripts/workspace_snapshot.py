@@ -0,0 +1,249 @@
+"""
+工作空间快照与分叉模块
+Workspace Snapshots and Copy-on-Write Forking
+
+复用 --workspace 逐阶段运行时，重新尝试 stage3 的某个变体会覆盖之前的状态。本模块：
+
+- 每个阶段成功后，把工作空间的文件链接到 .snapshots/{stage}/ 并写出快照清单 manifest.json
+  （文件大小、mtime 以及可 JSON 序列化的内存变量），链接按 reflink → 复制 依次尝试，支持 reflink 时耗时为毫秒级
+- fork_workspace() 把某个阶段的快照（或工作空间的当前状态）链接到新的工作空间，
+  多个实验可以从同一份 stage2/stage4 输出分叉，而不必重新生成
+
+不使用硬链接：硬链接与原文件共享 inode，阶段原地重写文件（PIL 保存、_post_process_images）会同时修改
+源工作空间和它的快照。reflink 和复制得到的都是独立的文件。
+分叉前仍会按清单中的大小和 mtime 校验快照，被修改过的快照拒绝使用
+
+快照结构:
+    {workspace}/.snapshots/
+        stage2/
+            manifest.json   {"stage", "workflow", "created_at", "files": {相对路径: {"size", "mtime_ns"}}, "memory": {...}}
+            doc/game.md
+            public/tasks.json
+        origin.json         分叉来源 {"source", "stage", "created_at"}（仅分叉出的工作空间）
+"""
+
+import os
+import json
+import fnmatch
+import time
+import shutil
+import logging
+from pathlib import Path
+from datetime import datetime
+from collections import Counter
+from typing import Dict, Any, List, Optional, Tuple
+
+from asset_store import link_file
+from workspace_gc import STATUS_FILE
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_DIR = ".snapshots"
+MANIFEST_NAME = "manifest.json"
+ORIGIN_NAME = "origin.json"
+SNAPSHOT_LINK_MODES = ('auto', 'reflink', 'copy')  # auto: reflink → 复制；快照和分叉不使用硬链接
+
+
+def _check_link(link: str):
+    if link not in SNAPSHOT_LINK_MODES:
+        raise ValueError(f"快照不支持的链接方式: {link}（可选 {', '.join(SNAPSHOT_LINK_MODES)}；"
+                         f"硬链接会让原地写入的阶段同时修改源工作空间和快照）")
+
+
+def parse_fork_spec(spec: str) -> Tuple[str, Optional[str]]:
+    """解析 --fork-from 参数: "my_test@stage2" -> ("my_test", "stage2")，不带 @ 时阶段为 None"""
+    workspace, _, stage = spec.rpartition('@') if '@' in spec else (spec, '', '')
+    return workspace, stage or None
+
+
+def _excluded(rel: str, exclude: List[str]) -> bool:
+    """相对路径是否匹配排除模式（以 / 结尾的模式匹配整个目录，其余按 glob 匹配）"""
+    for pattern in exclude:
+        if pattern.endswith('/') and rel.startswith(pattern) or fnmatch.fnmatchcase(rel, pattern):
+            return True
+    return False
+
+
+def _workspace_files(workspace: Path, exclude: Optional[List[str]] = None) -> List[Path]:
+    """工作空间中的普通文件（不含快照目录、增量生成的影子目录、运行状态、临时文件和匹配 exclude 的文件）
+
+    快照目录和影子目录在遍历时直接跳过，不会随快照数量增长而变慢
+    """
+    files = []
+    for directory, dirnames, filenames in os.walk(workspace):
+        if directory == str(workspace):
+            dirnames[:] = [name for name in dirnames
+                           if name != SNAPSHOT_DIR and not name.startswith('.incremental_')]
+        dirnames.sort()
+        base = Path(directory).relative_to(workspace)
+        for name in filenames:
+            rel = base / name
+            if rel.as_posix() == STATUS_FILE or name.endswith('.tmp') or _excluded(rel.as_posix(), exclude or []):
+                continue
+            if not (workspace / rel).is_symlink():
+                files.append(rel)
+    return sorted(files)
+
+
+def _serializable_memory(memory: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """只保留可 JSON 序列化的内存变量"""
+    result = {}
+    for name, value in (memory or {}).items():
+        try:
+            json.dumps(value, ensure_ascii=False)
+        except (TypeError, ValueError):
+            logger.debug(f"内存变量无法序列化，不写入快照: {name}")
+            continue
+        result[name] = value
+    return result
+
+
+def _link_tree(source: Path, files: List[Path], target: Path, link: str) -> Counter:
+    """把 source 下的文件逐个链接到 target 的相同相对路径，返回各链接方式的次数（auto 时 reflink → 复制）"""
+    modes = Counter()
+    for rel in files:
+        dst = target / rel
+        dst.parent.mkdir(parents=True, exist_ok=True)
+        mode = link_file(source / rel, dst, 'reflink' if link == 'auto' else link)
+        if mode == 'none' and link == 'auto':
+            mode = link_file(source / rel, dst, 'copy')
+        if mode == 'none':
+            raise OSError(f"无法链接文件: {source / rel}")
+        modes[mode] += 1
+    return modes
+
+
+class WorkspaceSnapshots:
+    """一个工作空间的阶段快照"""
+
+    def __init__(self, workspace_dir: str, link: str = 'auto'):
+        _check_link(link)
+        self.workspace = Path(workspace_dir)
+        self.root = self.workspace / SNAPSHOT_DIR
+        self.link = link
+
+    def record(self, stage: str, workflow: Optional[str] = None,
+               memory: Optional[Dict[str, Any]] = None, exclude: Optional[List[str]] = None) -> Dict[str, Any]:
+        """记录工作空间在阶段边界的快照（覆盖该阶段之前的快照）
+
+        Args:
+            exclude: 不放入快照的文件（相对路径的 glob，以 / 结尾表示目录），
+                     例如并发运行中其他尚未完成的阶段正在写入的输出
+
+        Returns:
+            {'files': 文件数, 'bytes': 总大小, 'links': {链接方式: 次数}, 'seconds': 耗时}
+        """
+        start = time.perf_counter()
+        files = _workspace_files(self.workspace, exclude)
+        tmp = self.root / f".{stage}.tmp"
+        shutil.rmtree(tmp, ignore_errors=True)
+        tmp.mkdir(parents=True)
+        modes = _link_tree(self.workspace, files, tmp, self.link)
+
+        entries = {}
+        for rel in files:
+            st = (tmp / rel).stat()
+            entries[rel.as_posix()] = {'size': st.st_size, 'mtime_ns': st.st_mtime_ns}
+        manifest = {
+            'stage': stage,
+            'workflow': workflow,
+            'created_at': datetime.now().isoformat(timespec='seconds'),
+            'files': entries,
+            'excluded': list(exclude or []),
+            'memory': _serializable_memory(memory),
+        }
+        with open(tmp / MANIFEST_NAME, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=2)
+
+        destination = self.root / stage
+        shutil.rmtree(destination, ignore_errors=True)
+        tmp.rename(destination)
+        return {'files': len(files), 'bytes': sum(entry['size'] for entry in entries.values()),
+                'links': dict(modes), 'seconds': round(time.perf_counter() - start, 4)}
+
+    def load(self, stage: str) -> Optional[Dict[str, Any]]:
+        """读取阶段快照清单，不存在或损坏时返回 None"""
+        manifest_path = self.root / stage / MANIFEST_NAME
+        if not manifest_path.exists():
+            return None
+        try:
+            with open(manifest_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (json.JSONDecodeError, OSError) as e:
+            logger.warning(f"⚠ 快照清单损坏，已忽略: {manifest_path} ({e})")
+            return None
+
+    def stages(self) -> List[Dict[str, Any]]:
+        """按记录时间排列的全部快照清单"""
+        manifests = [self.load(path.name) for path in self.root.glob('*') if path.is_dir()
+                     and not path.name.startswith('.')] if self.root.exists() else []
+        return sorted((m for m in manifests if m),
+                      key=lambda m: (self.root / m['stage'] / MANIFEST_NAME).stat().st_mtime_ns)
+
+    def verify(self, manifest: Dict[str, Any]) -> List[str]:
+        """返回与清单不一致（缺失或被原地修改）的快照文件"""
+        stage_dir = self.root / manifest['stage']
+        changed = []
+        for rel, entry in manifest['files'].items():
+            path = stage_dir / rel
+            try:
+                st = path.stat()
+            except OSError:
+                changed.append(rel)
+                continue
+            if st.st_size != entry['size'] or st.st_mtime_ns != entry['mtime_ns']:
+                changed.append(rel)
+        return changed
+
+
+def fork_workspace(source_dir: str, target_dir: str, stage: Optional[str] = None,
+                   link: str = 'auto') -> Dict[str, Any]:
+    """从已有工作空间分叉出新的工作空间
+
+    Args:
+        source_dir: 源工作空间
+        target_dir: 新工作空间（不能已存在或必须为空）
+        stage: 分叉的阶段快照；None 表示工作空间的当前状态（内存变量取最近一次快照）
+        link: 链接方式（auto: reflink → 复制 / reflink / copy），不支持硬链接
+
+    Returns:
+        {'stage', 'files', 'links', 'memory', 'seconds'}
+
+    Raises:
+        FileNotFoundError: 源工作空间或阶段快照不存在
+        FileExistsError: 目标工作空间已存在且不为空
+        ValueError: 快照文件已被修改，或链接方式为 hardlink
+    """
+    _check_link(link)
+    start = time.perf_counter()
+    source, target = Path(source_dir), Path(target_dir)
+    if not source.is_dir():
+        raise FileNotFoundError(f"源工作空间不存在: {source}")
+    if target.exists() and any(target.iterdir()):
+        raise FileExistsError(f"目标工作空间已存在且不为空: {target}")
+
+    snapshots = WorkspaceSnapshots(str(source), link)
+    if stage:
+        manifest = snapshots.load(stage)
+        if manifest is None:
+            recorded = ', '.join(m['stage'] for m in snapshots.stages()) or '无'
+            raise FileNotFoundError(f"工作空间 {source.name} 没有 {stage} 的快照（已有: {recorded}）")
+        changed = snapshots.verify(manifest)
+        if changed:
+            raise ValueError(f"{stage} 的快照已被修改，无法分叉: {', '.join(changed[:5])}")
+        files_root, files = snapshots.root / stage, [Path(rel) for rel in manifest['files']]
+        memory = manifest.get('memory', {})
+    else:
+        recorded = snapshots.stages()
+        files_root, files = source, _workspace_files(source)
+        memory = recorded[-1].get('memory', {}) if recorded else {}
+
+    target.mkdir(parents=True, exist_ok=True)
+    modes = _link_tree(files_root, files, target, link)
+    (target / SNAPSHOT_DIR).mkdir(exist_ok=True)
+    with open(target / SNAPSHOT_DIR / ORIGIN_NAME, 'w', encoding='utf-8') as f:
+        json.dump({'source': str(source.resolve()), 'stage': stage,
+                   'created_at': datetime.now().isoformat(timespec='seconds')}, f, ensure_ascii=False, indent=2)
+
+    return {'stage': stage, 'files': len(files), 'links': dict(modes), 'memory': memory,
+            'seconds': round(time.perf_counter() - start, 4)}
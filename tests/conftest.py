@@ -0,0 +1,50 @@
+"""
+测试公共配置：把 scripts/ 加入导入路径（模块之间按顶层模块名互相导入）
+
+运行方式（在仓库根目录）:
+    python -m pytest -c config/pytest.ini --rootdir .
+"""
+
+import sys
+from pathlib import Path
+
+import pytest
+import yaml
+
+SCRIPTS_DIR = Path(__file__).resolve().parent.parent / "scripts"
+if str(SCRIPTS_DIR) not in sys.path:
+    sys.path.insert(0, str(SCRIPTS_DIR))
+
+
+@pytest.fixture
+def run_stage(tmp_path):
+    """用最小配置运行单个阶段 wf:stage1，阶段函数替换为 func，返回阶段结果
+
+    global_config 合并到 global，stage_config 合并到阶段配置
+    """
+    from test_stage_runner import StageTestRunner
+
+    def run(func, global_config=None, stage_config=None, workspace=None):
+        config = {
+            'global': {
+                'workspace_base': str(tmp_path / 'workspaces'),
+                'mock': {'enabled': False, 'llm_mode': 'off'},
+                'workspace_snapshots': {'enabled': False},
+                **(global_config or {}),
+            },
+            'workflows': {'wf': {'stages': {
+                'stage1': {'name': '测试阶段', 'function': 'fake_stage', **(stage_config or {})},
+            }}},
+        }
+        config_path = tmp_path / 'config.yaml'
+        config_path.write_text(yaml.safe_dump(config, allow_unicode=True), encoding='utf-8')
+        runner = StageTestRunner(str(config_path), use_mock=False)
+        runner.workspace_dir = str(workspace or tmp_path / 'ws')
+        Path(runner.workspace_dir).mkdir(parents=True, exist_ok=True)
+        runner._import_function = lambda function_path: func
+        try:
+            return runner.run_stage('wf', 'stage1')
+        finally:
+            runner.close()
+
+    return run
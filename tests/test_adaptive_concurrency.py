@@ -0,0 +1,102 @@
+"""AIMD 并发控制器（adaptive_concurrency.py）"""
+
+import asyncio
+
+import pytest
+
+from adaptive_concurrency import AdaptiveConcurrencyController, AdaptiveConfig, classify_outcome, status_code
+
+
+class HTTPError(Exception):
+    def __init__(self, status):
+        super().__init__(f"HTTP {status}")
+        self.status = status
+
+
+class APIError(Exception):
+    def __init__(self, code, status=None):
+        super().__init__(f"{code} {status}")
+        self.code = code
+        self.status = status
+
+
+class TestClassifyOutcome:
+    def test_ok_and_timeout(self):
+        assert classify_outcome(None) == 'ok'
+        assert classify_outcome(asyncio.TimeoutError()) == 'timeout'
+
+    def test_rate_limit_by_status_code(self):
+        assert classify_outcome(HTTPError(429)) == 'rate_limited'
+        assert classify_outcome(APIError(429, 'RESOURCE_EXHAUSTED')) == 'rate_limited'
+        assert classify_outcome(HTTPError(500)) == 'error'
+
+    def test_message_text_is_not_a_rate_limit(self):
+        assert classify_outcome(RuntimeError("quota 429 exceeded")) == 'error'
+
+    def test_status_code_ignores_booleans(self):
+        error = Exception()
+        error.status = True
+        assert status_code(error) is None
+
+
+def _run(controller, outcomes, latency=0.0):
+    """按顺序逐个执行请求，outcomes 中为 None 表示成功，否则抛出该异常"""
+    async def main():
+        for outcome in outcomes:
+            try:
+                async with controller.slot():
+                    await asyncio.sleep(latency)
+                    if outcome is not None:
+                        raise outcome
+            except Exception:
+                pass
+    asyncio.run(main())
+
+
+class TestController:
+    def test_additive_increase_after_full_round(self):
+        controller = AdaptiveConcurrencyController(AdaptiveConfig(initial=2, max_limit=4))
+        _run(controller, [None] * 2)
+        assert controller.limit == 3
+        _run(controller, [None] * 3)
+        assert controller.limit == 4
+        _run(controller, [None] * 10)
+        assert controller.limit == 4
+
+    def test_multiplicative_decrease_on_429(self):
+        controller = AdaptiveConcurrencyController(AdaptiveConfig(initial=8, min_limit=1))
+        _run(controller, [HTTPError(429)])
+        assert controller.limit == 4
+        assert controller.decisions[-1]['reason'] == 'rate_limited'
+        _run(controller, [HTTPError(429)] * 5)
+        assert controller.limit == 1
+
+    def test_plain_errors_do_not_change_limit(self):
+        controller = AdaptiveConcurrencyController(AdaptiveConfig(initial=4))
+        _run(controller, [HTTPError(500)] * 3)
+        assert controller.limit == 4
+        assert controller.counts['error'] == 3
+
+    def test_latency_spike_decreases_and_baseline_keeps_tracking(self):
+        config = AdaptiveConfig(initial=8, max_limit=8, min_samples=3, latency_spike=2.0)
+        controller = AdaptiveConcurrencyController(config)
+        for _ in range(4):
+            controller._on_success(0.1)
+        baseline = controller.baseline_latency
+
+        assert controller._on_success(1.0) == 'latency_spike'
+        assert controller.baseline_latency > baseline
+        assert controller.baseline_latency == pytest.approx(baseline + config.spike_ewma_alpha * (1.0 - baseline))
+
+    def test_concurrency_never_exceeds_limit(self):
+        controller = AdaptiveConcurrencyController(AdaptiveConfig(initial=3, max_limit=3))
+        peak = 0
+
+        async def worker(_):
+            nonlocal peak
+            peak = max(peak, controller.in_flight)
+            await asyncio.sleep(0.005)
+
+        results = asyncio.run(controller.run_batches([list(range(12))], worker))
+        assert len(results) == 12
+        assert peak <= 3
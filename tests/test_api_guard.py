@@ -0,0 +1,106 @@
+"""图像 API 限流与重试（api_guard.py）及运行器注入 api_guard"""
+
+import asyncio
+
+import pytest
+
+from api_guard import ApiGuard, RetryPolicy, is_retryable
+
+
+class HttpError(Exception):
+    def __init__(self, status):
+        super().__init__(f"HTTP {status}")
+        self.status = status
+
+
+def _guard(**kwargs):
+    return ApiGuard(retry=RetryPolicy(max_attempts=3, base_delay=0.001, max_delay=0.001), seed=0, **kwargs)
+
+
+def _flaky(errors):
+    """依次抛出 errors 中的异常，之后返回 'ok'"""
+    errors = list(errors)
+
+    async def request():
+        if errors:
+            raise errors.pop(0)
+        return 'ok'
+    return request
+
+
+def test_retryable_errors():
+    assert is_retryable(HttpError(429))
+    assert is_retryable(HttpError(503))
+    assert is_retryable(asyncio.TimeoutError())
+    assert is_retryable(ConnectionResetError())
+    assert not is_retryable(HttpError(400))
+    assert not is_retryable(ValueError('bad'))
+
+
+def test_retries_until_success():
+    guard = _guard()
+    assert asyncio.run(guard.call(_flaky([HttpError(429), HttpError(500)]))) == 'ok'
+    assert guard.stats['attempts'] == 3
+    assert guard.stats['retries'] == 2
+    assert guard.stats['succeeded'] == 1
+
+
+def test_non_retryable_error_raised_immediately():
+    guard = _guard()
+    with pytest.raises(HttpError):
+        asyncio.run(guard.call(_flaky([HttpError(400)])))
+    assert guard.stats['attempts'] == 1
+    assert guard.stats['failed'] == 1
+
+
+def test_retry_budget_shared_across_calls():
+    guard = _guard(retry_budget=1)
+
+    async def main():
+        await guard.call(_flaky([HttpError(429)]))
+        await guard.call(_flaky([HttpError(429)]))
+
+    with pytest.raises(HttpError):
+        asyncio.run(main())
+    assert guard.stats['retries'] == 1
+    assert guard.stats['budget_exhausted'] == 1
+
+
+def test_stats_grouped_by_key():
+    key = {'value': 'a'}
+    guard = _guard(key_fn=lambda: key['value'])
+
+    async def main():
+        await guard.call(_flaky([HttpError(429)]))
+        key['value'] = 'b'
+        await guard.call(_flaky([]))
+
+    asyncio.run(main())
+    assert guard.stats_for('a')['retries'] == 1
+    assert (guard.stats_for('b')['calls'], guard.stats_for('b')['retries']) == (1, 0)
+    assert guard.stats_for('c') is None
+
+
+class TestRunnerInjection:
+    GLOBAL = {'api_guard': {'retry': {'base_delay': 0.001, 'max_delay': 0.001}, 'retry_budget': 5}}
+
+    def test_guard_injected_and_stats_recorded(self, run_stage):
+        seen = {}
+
+        async def fake_stage(input_data, api_guard=None):
+            seen['guard'] = api_guard
+            return await api_guard.call(_flaky([HttpError(429)]))
+
+        result = run_stage(fake_stage, self.GLOBAL)
+        assert result['success'], result['error']
+        assert isinstance(seen['guard'], ApiGuard)
+        assert result['api_stats']['calls'] == 1
+        assert result['api_stats']['retries'] == 1
+
+    def test_functions_without_parameter_called_unchanged(self, run_stage):
+        async def fake_stage(input_data):
+            return 'ok'
+
+        result = run_stage(fake_stage, self.GLOBAL)
+        assert result['success'], result['error']
+        assert 'api_stats' not in result
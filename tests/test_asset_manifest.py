@@ -0,0 +1,92 @@
+"""素材清单与增量生成（asset_manifest.py / StageTestRunner._run_asset_stage）"""
+
+import asyncio
+import json
+
+import pytest
+import yaml
+
+from asset_manifest import AssetManifest, parse_references
+from test_stage_runner import StageTestRunner
+
+
+TASKS = [
+    {'name': 'hero.png', 'description': '主角', 'size': '64x64'},
+    {'name': 'hero_run.png', 'description': '主角奔跑', 'size': '64x64', 'yield_from': 'hero.png'},
+    {'name': 'wall.png', 'description': '墙', 'size': '32x32'},
+]
+
+
+@pytest.fixture
+def workspace(tmp_path):
+    path = tmp_path / 'ws'
+    (path / 'public' / 'assets').mkdir(parents=True)
+    (path / 'public' / 'tasks.json').write_text(json.dumps(TASKS, ensure_ascii=False), encoding='utf-8')
+    return path
+
+
+@pytest.fixture
+def runner(tmp_path, workspace):
+    config = {'global': {'workspace_base': str(tmp_path), 'mock': {'enabled': False, 'llm_mode': 'off'}},
+              'workflows': {}}
+    config_path = tmp_path / 'config.yaml'
+    config_path.write_text(yaml.safe_dump(config), encoding='utf-8')
+    runner = StageTestRunner(str(config_path), use_mock=False)
+    runner.workspace_dir = str(workspace)
+    yield runner
+    runner.close()
+
+
+def _write(workspace, *names, data=b'png'):
+    for name in names:
+        (workspace / 'public' / 'assets' / name).write_bytes(data + name.encode())
+
+
+def test_parse_references():
+    assert parse_references(None) == []
+    assert parse_references('a.png') == ['a.png']
+    assert parse_references('__MIRROR__:a.png') == ['a.png']
+    assert parse_references('__MULTI__:a.png, b.png') == ['a.png', 'b.png']
+
+
+def test_dirty_propagates_to_yield_from_dependents(workspace):
+    _write(workspace, 'hero.png', 'hero_run.png', 'wall.png')
+    manifest = AssetManifest(str(workspace))
+    manifest.update(TASKS)
+    assert manifest.find_dirty(TASKS) == []
+
+    _write(workspace, 'hero.png', data=b'regenerated')
+    assert manifest.find_dirty(TASKS) == ['hero_run.png']
+
+    changed = [dict(TASKS[0], description='主角（新）')] + TASKS[1:]
+    assert manifest.find_dirty(changed) == ['hero.png', 'hero_run.png']
+
+
+def test_failed_full_run_only_records_images_it_wrote(runner, workspace):
+    """部分失败的运行不能把之前运行留下的旧图像记为最新"""
+    _write(workspace, 'wall.png', data=b'stale')
+
+    def generate(workspace_dir):
+        _write(workspace, 'hero.png')
+        raise RuntimeError("API 失败")
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(runner._run_asset_stage(generate, 'generate', None, 'wf:stage4',
+                                            {'path': 'public/assets/'}, incremental=False))
+
+    manifest = AssetManifest(str(workspace)).load()
+    assert set(manifest.entries) == {'hero.png'}
+    assert manifest.find_dirty(TASKS) == ['hero_run.png', 'wall.png']
+
+
+def test_full_run_skips_images_it_did_not_write(runner, workspace):
+    _write(workspace, 'wall.png', data=b'stale')
+
+    def generate(workspace_dir):
+        _write(workspace, 'hero.png', 'hero_run.png')
+        return "完成"
+
+    result = asyncio.run(runner._run_asset_stage(generate, 'generate', None, 'wf:stage4',
+                                                 {'path': 'public/assets/'}, incremental=False))
+    assert result == "完成"
+    assert AssetManifest(str(workspace)).load().find_dirty(TASKS) == ['wall.png']
@@ -0,0 +1,93 @@
+"""共享素材存储（asset_store.py）"""
+
+import os
+import shutil
+
+import pytest
+
+import asset_store
+from asset_store import AssetStore, link_file
+
+
+@pytest.fixture
+def workspace(tmp_path):
+    path = tmp_path / 'ws'
+    (path / 'public' / 'assets').mkdir(parents=True)
+    (path / 'public' / 'assets' / 'hero.png').write_bytes(b'hero-v1')
+    return path
+
+
+@pytest.fixture
+def reflink(monkeypatch):
+    """模拟支持 reflink 的文件系统：克隆得到内容相同、inode 不同的文件"""
+    monkeypatch.setattr(asset_store, '_reflink', shutil.copyfile)
+
+
+@pytest.fixture
+def no_reflink(monkeypatch):
+    def unsupported(src, dst):
+        raise OSError(95, 'Operation not supported')
+    monkeypatch.setattr(asset_store, '_reflink', unsupported)
+
+
+def _objects(store_dir):
+    return sorted((store_dir / 'objects').glob('*/*.png'))
+
+
+class TestAssetStore:
+    def test_workspace_files_stay_writable_and_independent(self, tmp_path, workspace, reflink):
+        store = AssetStore(str(tmp_path / 'store'))
+        store.ingest_workspace(str(workspace))
+        image = workspace / 'public' / 'assets' / 'hero.png'
+        obj, = _objects(tmp_path / 'store')
+
+        assert os.access(image, os.W_OK)
+        assert image.stat().st_ino != obj.stat().st_ino
+        image.write_bytes(b'hero-v2')  # 阶段原地重写素材
+        assert obj.read_bytes() == b'hero-v1'
+
+    def test_identical_content_stored_once(self, tmp_path, workspace, reflink):
+        other = tmp_path / 'ws2' / 'public' / 'assets'
+        other.mkdir(parents=True)
+        (other / 'hero.png').write_bytes(b'hero-v1')
+
+        store = AssetStore(str(tmp_path / 'store'))
+        store.ingest_workspace(str(workspace))
+        stats = store.ingest_workspace(str(tmp_path / 'ws2'))
+        assert stats['new_objects'] == 0
+        assert stats['linked'] == 1
+        assert stats['bytes_deduplicated'] == len(b'hero-v1')
+
+    def test_no_object_written_without_reflink(self, tmp_path, workspace, no_reflink):
+        store = AssetStore(str(tmp_path / 'store'))
+        stats = store.ingest_workspace(str(workspace))
+
+        assert stats['linked'] == 0
+        assert stats['skipped'] == 1
+        assert _objects(tmp_path / 'store') == []
+        assert (workspace / 'public' / 'assets' / 'hero.png').read_bytes() == b'hero-v1'
+
+    def test_prune_drops_objects_of_removed_workspaces(self, tmp_path, workspace, reflink):
+        store = AssetStore(str(tmp_path / 'store'))
+        store.ingest_workspace(str(workspace))
+        assert store.prune()['objects_removed'] == 0
+
+        shutil.rmtree(workspace)
+        result = store.prune()
+        assert result == {'refs_removed': 1, 'objects_removed': 1, 'bytes_freed': len(b'hero-v1')}
+
+
+class TestLinkFile:
+    def test_copy_and_hardlink(self, tmp_path):
+        src = tmp_path / 'src'
+        src.write_bytes(b'data')
+        assert link_file(src, tmp_path / 'copy', 'copy') == 'copy'
+        assert (tmp_path / 'copy').stat().st_ino != src.stat().st_ino
+        assert link_file(src, tmp_path / 'hard', 'hardlink') == 'hardlink'
+        assert (tmp_path / 'hard').stat().st_ino == src.stat().st_ino
+
+    def test_existing_destination_fails(self, tmp_path):
+        src = tmp_path / 'src'
+        src.write_bytes(b'data')
+        (tmp_path / 'dst').write_bytes(b'other')
+        assert link_file(src, tmp_path / 'dst', 'hardlink') == 'none'
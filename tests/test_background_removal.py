@@ -0,0 +1,108 @@
+"""背景移除服务（background_removal.py）及运行器注入 background_removal"""
+
+import time
+from concurrent.futures import Future
+
+import test_stage_runner
+from background_removal import BackgroundRemovalService
+
+
+def _done(result=None, error=None):
+    future = Future()
+    if error is not None:
+        future.set_exception(error)
+    else:
+        future.set_result(result)
+    return future
+
+
+def test_drain_reports_batch_and_keeps_unfinished():
+    service = BackgroundRemovalService()
+    unfinished = Future()
+    service._pending = [_done({'name': 'a.png', 'seconds': 0.5}), _done(error=RuntimeError('boom')), unfinished]
+
+    stats = service.drain(deadline=time.monotonic() - 1)  # 预算已用完：不等待
+    assert stats == {'submitted': 3, 'completed': 1, 'failed': 1, 'pending': 1, 'busy_seconds': 0.5}
+    assert service._pending == [unfinished]
+
+
+def test_close_in_forked_child_keeps_parent_pool():
+    class Executor:
+        shut_down = False
+
+        def shutdown(self, **kwargs):
+            self.shut_down = True
+
+    service = BackgroundRemovalService()
+    service._executor = executor = Executor()
+    service._owner_pid = -1  # 由其他进程启动
+    service.close()
+    assert not executor.shut_down
+    assert service._executor is None
+
+
+class FakeService:
+    """记录提交的图像，drain 返回提交数"""
+    instances = []
+
+    def __init__(self, config):
+        self.config = config
+        self.submitted = []
+        self.closed = False
+        FakeService.instances.append(self)
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(config)
+
+    def submit(self, path):
+        self.submitted.append(path)
+
+    def drain(self, timeout=None, deadline=None):
+        self.deadline = deadline
+        return {'submitted': len(self.submitted), 'completed': len(self.submitted), 'failed': 0,
+                'pending': 0, 'busy_seconds': 0.0}
+
+    def close(self):
+        self.closed = True
+
+
+class TestRunnerInjection:
+    GLOBAL = {'lazy_imports': []}  # 假的 rembg 不注册为延迟模块
+
+    def _patch(self, monkeypatch):
+        FakeService.instances = []
+        find_spec = test_stage_runner.importlib.util.find_spec
+        monkeypatch.setattr(test_stage_runner, 'BackgroundRemovalService', FakeService)
+        monkeypatch.setattr(test_stage_runner.importlib.util, 'find_spec',
+                            lambda name, *args: object() if name == 'rembg' else find_spec(name, *args))
+        monkeypatch.delenv('AUTO_REMOVE_BACKGROUND', raising=False)
+
+    def test_service_drained_after_stage(self, run_stage, monkeypatch):
+        self._patch(monkeypatch)
+
+        def fake_stage(input_data, background_removal=None):
+            background_removal.submit('hero.png')
+            return 'ok'
+
+        result = run_stage(fake_stage, {**self.GLOBAL, 'background_removal': {'enabled': True, 'workers': 1}},
+                           stage_config={'timeout': 30})
+        assert result['success'], result['error']
+        assert result['background_removal']['submitted'] == 1
+        service, = FakeService.instances
+        assert service.config['workers'] == 1
+        assert service.deadline is not None and service.deadline <= time.monotonic() + 30
+        assert service.closed
+
+    def test_not_injected_when_disabled(self, run_stage, monkeypatch):
+        self._patch(monkeypatch)
+        monkeypatch.setenv('AUTO_REMOVE_BACKGROUND', 'false')
+
+        def fake_stage(input_data, background_removal=None):
+            assert background_removal is None
+            return 'ok'
+
+        result = run_stage(fake_stage, {**self.GLOBAL, 'background_removal': {'enabled': True}})
+        assert result['success'], result['error']
+        assert 'background_removal' not in result
+        assert not FakeService.instances
@@ -0,0 +1,80 @@
+"""参考图编码缓存（reference_cache.py）及运行器注入 reference_cache"""
+
+import base64
+import io
+import os
+
+from PIL import Image
+
+from reference_cache import ReferenceImageCache
+
+
+def _png(path, size=(32, 32), color=(200, 30, 30, 255)):
+    Image.new('RGBA', size, color).save(path)
+    return path
+
+
+def test_hit_after_first_encode(tmp_path):
+    cache = ReferenceImageCache()
+    path = _png(tmp_path / 'hero.png')
+    first = cache.get(path)
+    assert cache.get(path) is first
+    assert (cache.stats['hits'], cache.stats['misses']) == (1, 1)
+    assert first['mime_type'] == 'image/png'
+    assert base64.b64decode(first['data']) == path.read_bytes()
+
+
+def test_rewritten_reference_is_reencoded(tmp_path):
+    cache = ReferenceImageCache()
+    path = _png(tmp_path / 'hero.png')
+    first = cache.get(path)
+    _png(path, size=(48, 48))
+    os.utime(path, ns=(0, os.stat(path).st_mtime_ns + 1))
+    assert cache.get(path) != first
+    assert cache.stats['misses'] == 2
+
+
+def test_lru_eviction_by_encoded_size(tmp_path):
+    a = _png(tmp_path / 'a.png')
+    entry_size = len(ReferenceImageCache().get(a)['data'])
+    cache = ReferenceImageCache(max_bytes=entry_size * 2)
+    b = _png(tmp_path / 'b.png', color=(0, 0, 255, 255))
+    c = _png(tmp_path / 'c.png', color=(0, 255, 0, 255))
+    for path in (a, b, a, c):
+        cache.get(path)
+    assert cache.stats['evictions'] == 1
+    cache.get(a)
+    assert cache.stats['hits'] == 2  # a 最近使用过，淘汰的是 b
+
+
+def test_downscale_long_edge(tmp_path):
+    cache = ReferenceImageCache(max_edge=16)
+    entry = cache.get(_png(tmp_path / 'big.png', size=(64, 32)))
+    with Image.open(io.BytesIO(base64.b64decode(entry['data']))) as img:
+        assert img.size == (16, 8)
+
+
+def test_parts_for_skips_missing_references(tmp_path):
+    _png(tmp_path / 'hero.png')
+    parts = ReferenceImageCache().parts_for('hero.png', tmp_path)
+    assert len(parts) == 1 and 'inline_data' in parts[0]
+    assert ReferenceImageCache().parts_for('missing.png', tmp_path) == []
+
+
+def test_cache_injected_into_stage_function(run_stage, tmp_path):
+    workspace = tmp_path / 'ws'
+    workspace.mkdir()
+    _png(workspace / 'hero.png')
+    seen = []
+
+    def fake_stage(input_data, reference_cache=None):
+        seen.append(reference_cache)
+        reference_cache.get(workspace / 'hero.png')
+        reference_cache.get(workspace / 'hero.png')
+        return 'ok'
+
+    result = run_stage(fake_stage, {'reference_cache': {'max_mb': 1}}, workspace=workspace)
+    assert result['success'], result['error']
+    assert isinstance(seen[0], ReferenceImageCache)
+    assert seen[0].max_bytes == 1024 * 1024
+    assert (seen[0].stats['hits'], seen[0].stats['misses']) == (1, 1)
@@ -0,0 +1,54 @@
+"""图集布局（sprite_atlas.plan_atlases）"""
+
+import pytest
+
+from sprite_atlas import plan_atlases
+
+
+def _overlaps(a, b):
+    return a['x'] < b['x'] + b['w'] and b['x'] < a['x'] + a['w'] and a['y'] < b['y'] + b['h'] and b['y'] < a['y'] + a['h']
+
+
+def _assert_valid(atlases, frames, max_size):
+    for atlas in atlases:
+        assert atlas['width'] <= max_size and atlas['height'] <= max_size
+    for name, frame in frames.items():
+        atlas = atlases[frame['atlas']]
+        assert frame['x'] + frame['w'] <= atlas['width'] and frame['y'] + frame['h'] <= atlas['height'], name
+    items = list(frames.values())
+    for i, a in enumerate(items):
+        for b in items[i + 1:]:
+            assert a['atlas'] != b['atlas'] or not _overlaps(a, b)
+
+
+def test_groups_share_one_atlas():
+    items = [('player', [('player_idle', 64, 64), ('player_run', 64, 64)]),
+             ('enemy', [('enemy_idle', 32, 32)])]
+    atlases, frames = plan_atlases(items, max_size=256, padding=1)
+
+    assert len(atlases) == 1
+    assert set(frames) == {'player_idle', 'player_run', 'enemy_idle'}
+    assert frames['player_idle']['group'] == 'player'
+    _assert_valid(atlases, frames, 256)
+
+
+def test_tall_group_is_split_within_max_size():
+    members = [(f'frame_{i}', 100, 100) for i in range(30)]
+    atlases, frames = plan_atlases([('anim', members)], max_size=256, padding=1)
+
+    assert len(atlases) > 1
+    assert len(frames) == 30
+    _assert_valid(atlases, frames, 256)
+
+
+def test_many_groups_spill_into_new_atlases():
+    items = [(f'group_{g}', [(f'g{g}_{i}', 60, 60) for i in range(3)]) for g in range(20)]
+    atlases, frames = plan_atlases(items, max_size=200, padding=2)
+
+    assert len(frames) == 60
+    _assert_valid(atlases, frames, 200)
+
+
+def test_oversized_sprite_rejected():
+    with pytest.raises(ValueError, match='big'):
+        plan_atlases([('g', [('big', 300, 10)])], max_size=256)
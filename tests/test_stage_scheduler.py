@@ -0,0 +1,158 @@
+"""阶段DAG构建与并发调度（StageGraph / StageTestRunner._run_stages_parallel）"""
+
+import asyncio
+
+import pytest
+import yaml
+
+from stage_scheduler import StageGraph
+from test_stage_runner import StageTestRunner
+
+
+STAGES = {
+    'stage1': {},
+    'stage2': {'dependencies': ['stage1']},
+    'stage3': {'dependencies': ['stage2']},
+    'stage4': {'dependencies': ['stage2']},
+    'stage5': {'dependencies': ['stage3', 'stage4']},
+}
+
+
+class TestStageGraph:
+    def test_ready_follows_dependencies(self):
+        graph = StageGraph(STAGES, list(STAGES))
+        assert graph.ready(set(), set()) == ['stage1']
+        assert graph.ready({'stage1', 'stage2'}, {'stage1', 'stage2'}) == ['stage3', 'stage4']
+        assert graph.ready({'stage1', 'stage2', 'stage3'}, {'stage1', 'stage2', 'stage3', 'stage4'}) == []
+
+    def test_unselected_dependencies_are_satisfied(self):
+        graph = StageGraph(STAGES, ['stage3', 'stage4'])
+        assert graph.ready(set(), set()) == ['stage3', 'stage4']
+
+    def test_descendants(self):
+        graph = StageGraph(STAGES, list(STAGES))
+        assert graph.descendants('stage2') == {'stage3', 'stage4', 'stage5'}
+        assert graph.descendants('stage5') == set()
+
+    def test_ancestors(self):
+        graph = StageGraph(STAGES, list(STAGES))
+        assert graph.ancestors('stage5') == {'stage1', 'stage2', 'stage3', 'stage4'}
+        assert graph.ancestors('stage3') == {'stage1', 'stage2'}
+        assert graph.ancestors('stage1') == set()
+
+    def test_cycle_rejected(self):
+        with pytest.raises(ValueError, match='循环依赖'):
+            StageGraph({'a': {'dependencies': ['b']}, 'b': {'dependencies': ['a']}}, ['a', 'b'])
+
+
+@pytest.fixture
+def make_runner(tmp_path):
+    """用最小配置构建运行器，阶段函数替换为按 delays 休眠的假实现"""
+    runners = []
+
+    def factory(snapshots=False, failing=(), delays=None, stop_on_error=True, stages=None):
+        config = {
+            'global': {
+                'workspace_base': str(tmp_path / 'workspaces'),
+                'stop_on_error': stop_on_error,
+                'max_parallel_stages': 4,
+                'mock': {'enabled': False, 'llm_mode': 'off'},
+                'workspace_snapshots': {'enabled': snapshots},
+            },
+            'workflows': {'wf': {'stages': stages or STAGES}},
+        }
+        config_path = tmp_path / 'config.yaml'
+        config_path.write_text(yaml.safe_dump(config), encoding='utf-8')
+        runner = StageTestRunner(str(config_path), use_mock=False)
+        runner.workspace_dir = str(tmp_path / 'ws')
+        runner.events = []
+        runner.running = set()
+        runner.snapshot_calls = []
+        delays = delays or {}
+
+        async def fake_run_stage(workflow_name, stage_name, snapshot=True):
+            runner.events.append(('start', stage_name))
+            runner.running.add(stage_name)
+            await asyncio.sleep(delays.get(stage_name, 0.01))
+            runner.running.discard(stage_name)
+            runner.events.append(('end', stage_name))
+            return {'stage': stage_name, 'success': stage_name not in failing}
+
+        async def fake_record_snapshot(workflow_name, stage_name, memory, exclude=None):
+            runner.events.append(('snapshot', stage_name))
+            runner.snapshot_calls.append((stage_name, set(runner.running)))
+            await asyncio.sleep(delays.get('snapshot', 0.01))
+            runner.events.append(('snapshot_end', stage_name))
+            return {'files': 0}
+
+        runner.run_stage_async = fake_run_stage
+        runner._record_snapshot = fake_record_snapshot
+        runners.append(runner)
+        return runner
+
+    yield factory
+    for runner in runners:
+        runner.close()
+
+
+def _run(runner, stages=None):
+    return asyncio.run(runner._run_stages_parallel('wf', stages or list(STAGES)))
+
+
+class TestParallelScheduling:
+    def test_dependencies_finish_before_dependents_start(self, make_runner):
+        runner = make_runner()
+        results = _run(runner)
+
+        assert [r['stage'] for r in results] == list(STAGES)
+        position = {event: index for index, event in enumerate(runner.events)}
+        for stage, config in STAGES.items():
+            for dep in config.get('dependencies', []):
+                assert position[('end', dep)] < position[('start', stage)]
+
+    def test_independent_stages_overlap(self, make_runner):
+        runner = make_runner(delays={'stage3': 0.05, 'stage4': 0.05})
+        _run(runner)
+        starts = [i for i, event in enumerate(runner.events) if event in (('start', 'stage3'), ('start', 'stage4'))]
+        ends = [i for i, event in enumerate(runner.events) if event in (('end', 'stage3'), ('end', 'stage4'))]
+        assert max(starts) < min(ends)
+
+    def test_failure_cancels_only_descendants(self, make_runner):
+        runner = make_runner(failing={'stage3'})
+        results = {r['stage']: r for r in _run(runner)}
+
+        assert results['stage4']['success']
+        assert results['stage5'].get('skipped')
+        assert ('start', 'stage5') not in runner.events
+
+    def test_failure_without_stop_on_error_runs_descendants(self, make_runner):
+        runner = make_runner(failing={'stage3'}, stop_on_error=False)
+        results = {r['stage']: r for r in _run(runner)}
+        assert not results['stage5'].get('skipped')
+
+    def test_snapshots_do_not_block_independent_branch(self, make_runner):
+        runner = make_runner(snapshots=True, delays={'stage3': 0.01, 'stage4': 0.1, 'snapshot': 0.02})
+        results = {r['stage']: r for r in _run(runner)}
+        position = {event: index for index, event in enumerate(runner.events)}
+
+        assert all(result['snapshot'] == {'files': 0} for result in results.values())
+        assert position[('start', 'stage4')] < position[('end', 'stage3')]
+        assert ('stage3', {'stage4'}) in runner.snapshot_calls  # stage4 仍在运行时记录 stage3 的快照
+        assert position[('snapshot_end', 'stage3')] < position[('end', 'stage4')]
+        for dep in ('stage3', 'stage4'):
+            assert position[('snapshot_end', dep)] < position[('start', 'stage5')]
+
+    def test_snapshot_excludes_outputs_of_unfinished_stages(self, make_runner):
+        stages = {
+            'stage1': {'output': {'type': 'file', 'path': 'public/tasks.json'}},
+            'stage2': {'dependencies': ['stage1'], 'output': {'type': 'directory', 'path': 'public/assets'}},
+            'stage3': {'dependencies': ['stage1'], 'output': {'type': 'file', 'path': 'public/assets/{asset_name}'}},
+            'stage4': {'dependencies': ['stage1'], 'output': {'type': 'file', 'path': 'public/tasks.json'}},
+            'stage5': {'dependencies': ['stage2'], 'output': {'type': 'memory', 'variable': 'x'}},
+        }
+        runner = make_runner(stages=stages)
+        graph = StageGraph(stages, list(stages))
+
+        exclude = runner._snapshot_exclude(graph, stages, 'stage2', {'stage2', 'stage3', 'stage4', 'stage5'})
+        assert exclude == ['public/assets/*']  # stage1 的 tasks.json 属于 stage2 的上游，保留
+        assert runner._snapshot_exclude(graph, stages, 'stage3', {'stage2', 'stage3'}) == ['public/assets/']
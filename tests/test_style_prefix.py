@@ -0,0 +1,70 @@
+"""公共风格前缀（style_prefix.py）及运行器注入 style_prefix"""
+
+import json
+
+from style_prefix import BYTES_PER_TOKEN, StylePrefixPlan, split_sentences
+
+STYLE = "Orthogonal top-down view. No shadows, no lighting effects."
+TASKS = [
+    {'name': 'hero.png', 'size': '32x32', 'description': f"{STYLE} A knight with a sword."},
+    {'name': 'slime.png', 'size': '32x32', 'description': f"{STYLE} A green slime."},
+    {'name': 'chest.png', 'size': '32x32', 'description': f"A wooden chest. {STYLE}"},
+    {'name': 'title.png', 'size': '256x64', 'description': "Pixel art title text."},
+]
+
+
+def test_split_sentences():
+    assert split_sentences("One. Two!  Three?") == ['One.', 'Two!', 'Three?']
+    assert split_sentences('') == []
+
+
+def test_shared_sentences_moved_to_system_instruction():
+    plan = StylePrefixPlan.from_tasks(TASKS, min_share=0.5)
+    body = plan.request_body(TASKS[2])
+    assert body['systemInstruction']['parts'][0]['text'] == STYLE
+    assert body['contents'][0]['parts'][0]['text'] == "A wooden chest.\nSize: 32x32"
+    assert 'systemInstruction' not in plan.request_body(TASKS[3])
+
+
+def test_prefix_counted_on_the_wire_every_request():
+    plan = StylePrefixPlan.from_tasks(TASKS, min_share=0.5)
+    for task in TASKS:
+        plan.request_body(task)
+
+    stats = plan.summary()
+    prefix_bytes = len(STYLE.encode('utf-8'))
+    remainder_bytes = sum(len(plan.split(task['description'])[1].encode('utf-8')) for task in TASKS)
+    assert stats['requests'] == 4
+    assert stats['prefixes'] == 1
+    assert stats['bytes_sent'] == 3 * prefix_bytes + remainder_bytes
+
+    prefix_tokens = prefix_bytes // BYTES_PER_TOKEN
+    assert stats['prefix_tokens'] == 3 * prefix_tokens
+    assert stats['prefix_tokens_cacheable'] == 2 * prefix_tokens
+    assert stats['prefix_tokens_billed'] == prefix_tokens
+
+
+def test_plan_injected_from_workspace_tasks(run_stage, tmp_path):
+    workspace = tmp_path / 'ws'
+    (workspace / 'public').mkdir(parents=True)
+    (workspace / 'public' / 'tasks.json').write_text(json.dumps(TASKS), encoding='utf-8')
+
+    def fake_stage(input_data, style_prefix=None):
+        for task in TASKS:
+            style_prefix.request_body(task)
+        return 'ok'
+
+    result = run_stage(fake_stage, {'style_prefix': {'enabled': True, 'min_share': 0.5}}, workspace=workspace)
+    assert result['success'], result['error']
+    assert result['style_prefix']['requests'] == 4
+    assert result['style_prefix']['prefix_tokens_cacheable'] > 0
+
+
+def test_disabled_plan_not_injected(run_stage):
+    def fake_stage(input_data, style_prefix=None):
+        assert style_prefix is None
+        return 'ok'
+
+    result = run_stage(fake_stage, {'style_prefix': {'enabled': False}})
+    assert result['success'], result['error']
+    assert 'style_prefix' not in result
@@ -0,0 +1,104 @@
+"""阶段输出验证检查（validation_engine.py）"""
+
+import json
+
+import pytest
+from PIL import Image
+
+from validation_engine import ValidationEngine, parse_size
+
+ASSETS = 'public/assets/'
+
+
+@pytest.fixture
+def workspace(tmp_path):
+    """两张 64x64 素材：hero 为透明背景，wall 为白色不透明背景"""
+    assets = tmp_path / 'public' / 'assets'
+    assets.mkdir(parents=True)
+    hero = Image.new('RGBA', (64, 64), (0, 0, 0, 0))
+    hero.paste((200, 30, 30, 255), (16, 16, 48, 48))
+    hero.save(assets / 'hero.png')
+    Image.new('RGBA', (64, 64), (255, 255, 255, 255)).save(assets / 'wall.png')
+
+    tasks = [
+        {'name': 'hero.png', 'size': '64x64', 'description': '主角', 'needs_generation': True},
+        {'name': 'wall.png', 'size': '60x60', 'description': '墙', 'needs_generation': False},
+    ]
+    (tmp_path / 'public' / 'tasks.json').write_text(json.dumps(tasks, ensure_ascii=False), encoding='utf-8')
+    (tmp_path / 'doc').mkdir()
+    (tmp_path / 'doc' / 'game.md').write_text('# 游戏\n## 测试步骤\n', encoding='utf-8')
+    return tmp_path
+
+
+def _status(workspace, check, output=None, memory=None, **validation):
+    engine = ValidationEngine(str(workspace), memory=memory)
+    return engine.check_status(check, {'check': check, **validation}, output or {})
+
+
+def test_parse_size():
+    assert parse_size('1024x768') == (1024, 768)
+    assert parse_size('32×32') == (32, 32)
+    assert parse_size('big') is None
+
+
+class TestFileChecks:
+    def test_file_and_json_checks(self, workspace):
+        output = {'path': 'public/tasks.json'}
+        assert _status(workspace, 'file_exists', output) == 'passed'
+        assert _status(workspace, 'valid_json', output) == 'passed'
+        assert _status(workspace, 'items_have_fields', output, required_fields=['name', 'size']) == 'passed'
+        assert _status(workspace, 'items_have_fields', output, required_fields=['category']) == 'failed'
+        assert _status(workspace, 'file_exists', {'path': 'doc/missing.md'}) == 'failed'
+
+    def test_contains_keywords(self, workspace):
+        output = {'path': 'doc/game.md'}
+        assert _status(workspace, 'contains_keywords', output, keywords=['游戏']) == 'passed'
+        assert _status(workspace, 'contains_keywords', output, keywords=['关卡']) == 'failed'
+
+    def test_unknown_check(self, workspace):
+        assert _status(workspace, 'no_such_check') == 'unknown'
+
+
+class TestImageChecks:
+    output = {'path': ASSETS, 'reference': 'public/tasks.json'}
+
+    def test_counts_and_formats(self, workspace):
+        assert _status(workspace, 'image_count_matches', self.output) == 'passed'
+        assert _status(workspace, 'all_images_downloaded', self.output) == 'passed'
+        assert _status(workspace, 'images_valid', self.output) == 'passed'
+
+    def test_size_tolerance(self, workspace):
+        assert _status(workspace, 'images_size_correct', self.output) == 'passed'
+        assert _status(workspace, 'images_size_correct', self.output, tolerance=0) == 'failed'
+        assert _status(workspace, 'sizes_updated', {'path': 'public/tasks.json'}) == 'failed'
+
+    def test_transparency_skips_background_assets(self, workspace):
+        assert _status(workspace, 'transparent_png', self.output) == 'failed'
+
+        tasks = json.loads((workspace / 'public' / 'tasks.json').read_text(encoding='utf-8'))
+        tasks[1]['is_background'] = True
+        (workspace / 'public' / 'tasks.json').write_text(json.dumps(tasks), encoding='utf-8')
+        assert _status(workspace, 'transparent_png', self.output) == 'passed'
+
+    def test_full_run_reports_each_check(self, workspace):
+        output = {**self.output, 'validation': [{'check': 'image_count_matches'}, {'check': 'images_valid'}]}
+        passed, results = ValidationEngine(str(workspace)).run(output)
+        assert passed
+        assert [r['check'] for r in results] == ['image_count_matches', 'images_valid']
+
+
+class TestMemoryChecks:
+    def test_batch_order(self, workspace):
+        tasks = [{'name': 'hero.png'}, {'name': 'hero_run.png', 'yield_from': 'hero.png'}]
+        output = {'variable': 'batches'}
+        ordered = {'batches': [[tasks[0]], [tasks[1]]], 'valid_tasks': tasks}
+        reversed_ = {'batches': [[tasks[1]], [tasks[0]]], 'valid_tasks': tasks}
+        assert _status(workspace, 'batch_order_correct', output, memory=ordered) == 'passed'
+        assert _status(workspace, 'batch_order_correct', output, memory=reversed_) == 'failed'
+
+    def test_needs_generation_filter(self, workspace):
+        output = {'variable': 'selected', 'reference': 'public/tasks.json'}
+        assert _status(workspace, 'needs_generation_filter', output,
+                       memory={'selected': [{'name': 'hero.png'}]}) == 'passed'
+        assert _status(workspace, 'needs_generation_filter', output,
+                       memory={'selected': [{'name': 'wall.png'}]}) == 'failed'
@@ -0,0 +1,101 @@
+"""工作空间回收策略（workspace_gc.py）"""
+
+import os
+import time
+
+import pytest
+
+from workspace_gc import WorkspaceGC, write_run_status
+
+MB = 1024 * 1024
+
+
+@pytest.fixture
+def base(tmp_path):
+    return tmp_path / 'workspaces'
+
+
+def _workspace(base, name, state='success', size=0):
+    """创建工作空间；state 为 None 时不写运行状态（中断的运行）"""
+    path = base / name
+    path.mkdir(parents=True)
+    if size:
+        (path / 'data.bin').write_bytes(b'x' * size)
+    if state is not None:
+        write_run_status(str(path), name.rsplit('_', 2)[0], [{'stage': 'stage1', 'success': state == 'success'}])
+    return path
+
+
+def _age(base, seconds=3600):
+    """把所有文件的 mtime 调到 grace_minutes 之前"""
+    old = time.time() - seconds
+    for path in base.rglob('*'):
+        os.utime(path, (old, old))
+
+
+def _plan(gc):
+    return [(item['workspace']['name'], item['reason']) for item in gc.plan(gc.scan())]
+
+
+def test_keep_last_per_workflow(base):
+    for day in range(1, 4):
+        _workspace(base, f'wf_2024010{day}_000000')
+    _workspace(base, 'other_20240101_000000')
+    _age(base)
+
+    removals = _plan(WorkspaceGC(str(base), keep_last=1))
+    assert removals == [
+        ('wf_20240102_000000', 'keep_last'), ('wf_20240101_000000', 'keep_last')]
+
+
+def test_failed_and_unknown_runs_only_expire_by_age(base):
+    _workspace(base, 'wf_20240103_000000')
+    _workspace(base, 'wf_20240102_000000', state='failed')
+    _workspace(base, 'wf_20240101_000000', state=None)
+    _age(base)
+
+    assert _plan(WorkspaceGC(str(base), keep_last=0, max_total_mb=0)) == [('wf_20240103_000000', 'keep_last')]
+    expired = WorkspaceGC(str(base), max_age_days=1).plan(WorkspaceGC(str(base)).scan(), now=time.time())
+    assert {item['workspace']['name'] for item in expired} == {
+        'wf_20240101_000000', 'wf_20240102_000000', 'wf_20240103_000000'}
+
+
+def test_recent_and_custom_workspaces_kept(base):
+    _workspace(base, 'wf_20240101_000000')
+    _workspace(base, 'my_test')
+    _age(base)
+    _workspace(base, 'wf_20240102_000000')
+
+    assert _plan(WorkspaceGC(str(base), keep_last=0)) == [('wf_20240101_000000', 'keep_last')]
+
+
+def test_budget_counts_hardlinks_shared_between_workspaces(base):
+    """共享 inode 的全部链接都被回收时才计入回收量，达到预算后不再继续删除"""
+    oldest = _workspace(base, 'wf_20240101_000000')
+    fork = _workspace(base, 'wf_20240102_000000')
+    _workspace(base, 'wf_20240103_000000', size=MB // 10)
+    _workspace(base, 'wf_20240104_000000')
+    (oldest / 'big.bin').write_bytes(b'x' * MB)
+    os.link(oldest / 'big.bin', fork / 'big.bin')
+    _age(base)
+
+    gc = WorkspaceGC(str(base), max_total_mb=0.5)
+    scan = gc.scan()
+    assert MB < scan['total_bytes'] < 2 * MB
+
+    removals = gc.plan(scan)
+    names = [item['workspace']['name'] for item in removals]
+    assert names == ['wf_20240101_000000', 'wf_20240102_000000']
+    assert removals[0]['bytes'] < MB <= removals[1]['bytes']
+
+
+def test_collect_removes_planned_workspaces(base):
+    _workspace(base, 'wf_20240101_000000', size=1000)
+    _workspace(base, 'wf_20240102_000000')
+    _age(base)
+
+    result = WorkspaceGC(str(base), keep_last=1).collect()
+    assert [item['name'] for item in result['removed']] == ['wf_20240101_000000']
+    assert result['bytes_freed'] >= 1000
+    assert not (base / 'wf_20240101_000000').exists()
+    assert (base / 'wf_20240102_000000').exists()
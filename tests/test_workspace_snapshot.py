@@ -0,0 +1,87 @@
+"""阶段快照与工作空间分叉（workspace_snapshot.py）"""
+
+import pytest
+
+from workspace_snapshot import WorkspaceSnapshots, fork_workspace, parse_fork_spec
+
+
+@pytest.fixture
+def workspace(tmp_path):
+    path = tmp_path / 'ws'
+    (path / 'public' / 'assets').mkdir(parents=True)
+    (path / 'doc').mkdir()
+    (path / 'public' / 'assets' / 'hero.png').write_bytes(b'hero-v1')
+    (path / 'doc' / 'game.md').write_text('# game', encoding='utf-8')
+    return path
+
+
+def test_parse_fork_spec():
+    assert parse_fork_spec('my_test@stage2') == ('my_test', 'stage2')
+    assert parse_fork_spec('my_test') == ('my_test', None)
+
+
+def test_record_excludes_snapshots_and_status(workspace):
+    (workspace / '.run_status.json').write_text('{}', encoding='utf-8')
+    (workspace / '.incremental_stage4').mkdir()
+    (workspace / '.incremental_stage4' / 'shadow.png').write_bytes(b'x')
+    snapshots = WorkspaceSnapshots(str(workspace), link='copy')
+
+    snapshots.record('stage2', 'wf', {'count': 1, 'client': object()})
+    snapshots.record('stage3', 'wf')
+    manifest = snapshots.load('stage3')
+    assert sorted(manifest['files']) == ['doc/game.md', 'public/assets/hero.png']
+    assert snapshots.load('stage2')['memory'] == {'count': 1}
+    assert [m['stage'] for m in snapshots.stages()] == ['stage2', 'stage3']
+
+
+def test_record_skips_excluded_outputs(workspace):
+    snapshots = WorkspaceSnapshots(str(workspace))
+    snapshots.record('stage3', exclude=['public/assets/'])
+    manifest = snapshots.load('stage3')
+    assert list(manifest['files']) == ['doc/game.md']
+    assert manifest['excluded'] == ['public/assets/']
+
+
+def test_fork_restores_stage_state(tmp_path, workspace):
+    WorkspaceSnapshots(str(workspace), link='copy').record('stage2', 'wf', {'count': 1})
+    (workspace / 'doc' / 'later.md').write_text('stage3 output', encoding='utf-8')
+
+    result = fork_workspace(str(workspace), str(tmp_path / 'fork'), 'stage2', link='copy')
+    assert result['files'] == 2
+    assert result['memory'] == {'count': 1}
+    assert not (tmp_path / 'fork' / 'doc' / 'later.md').exists()
+    assert (tmp_path / 'fork' / '.snapshots' / 'origin.json').exists()
+
+
+@pytest.mark.parametrize('stage', ['stage2', None])
+def test_in_place_writes_to_fork_leave_source_and_snapshot_intact(tmp_path, workspace, stage):
+    WorkspaceSnapshots(str(workspace)).record('stage2')
+    fork = tmp_path / 'fork'
+    result = fork_workspace(str(workspace), str(fork), stage, link='auto')
+    assert 'hardlink' not in result['links']
+
+    with open(fork / 'public' / 'assets' / 'hero.png', 'r+b') as f:  # 原地重写（PIL 保存、后处理）
+        f.write(b'HERO')
+    assert (workspace / 'public' / 'assets' / 'hero.png').read_bytes() == b'hero-v1'
+    assert (workspace / '.snapshots' / 'stage2' / 'public' / 'assets' / 'hero.png').read_bytes() == b'hero-v1'
+    assert WorkspaceSnapshots(str(workspace)).verify(WorkspaceSnapshots(str(workspace)).load('stage2')) == []
+
+
+def test_hardlink_rejected(tmp_path, workspace):
+    with pytest.raises(ValueError, match='硬链接'):
+        WorkspaceSnapshots(str(workspace), link='hardlink')
+    with pytest.raises(ValueError, match='硬链接'):
+        fork_workspace(str(workspace), str(tmp_path / 'fork'), link='hardlink')
+
+
+def test_fork_rejects_modified_snapshot(tmp_path, workspace):
+    WorkspaceSnapshots(str(workspace)).record('stage2')
+    (workspace / '.snapshots' / 'stage2' / 'doc' / 'game.md').write_text('# edited', encoding='utf-8')
+
+    with pytest.raises(ValueError, match='已被修改'):
+        fork_workspace(str(workspace), str(tmp_path / 'fork'), 'stage2')
+
+
+def test_fork_missing_stage(tmp_path, workspace):
+    with pytest.raises(FileNotFoundError):
+        fork_workspace(str(workspace), str(tmp_path / 'fork'), 'stage9')